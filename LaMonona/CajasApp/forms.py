@@ -1,5 +1,5 @@
 from django import forms
-from django.core.exceptions import ValidationError
+from Task import referencias
 from Task.models import Cajas,TurnosCaja
 
 UBICACIONES = [
@@ -15,6 +15,12 @@ ESTADOS = [
 class CajaForm(forms.ModelForm):
     ubicacion = forms.ChoiceField(choices=UBICACIONES, widget=forms.Select(attrs={'class': 'form-control'}))
     estado = forms.ChoiceField(choices=ESTADOS, widget=forms.Select(attrs={'class': 'form-control'}))
+    # opciones desde la caché de referencia; el modelo solo confirma que la sucursal exista al validar
+    id_sucursal = forms.TypedChoiceField(
+        choices=referencias.opciones_sucursales,
+        coerce=referencias.instancia_sucursal,
+        widget=forms.HiddenInput(),
+    )
 
     class Meta:
         model = Cajas
@@ -23,6 +29,13 @@ class CajaForm(forms.ModelForm):
             'id_sucursal': forms.HiddenInput(),  # 👈 ahora siempre hidden
         }
 class TurnoForm(forms.ModelForm):
+    # "un turno abierto por caja" se valida al guardar, con la caja bloqueada (servicios.abrir_turno)
+    id_caja = forms.TypedChoiceField(
+        choices=referencias.opciones_cajas,
+        coerce=referencias.instancia_caja,
+        widget=forms.Select(attrs={'class': 'form-control'}),
+    )
+
     class Meta:
         model = TurnosCaja
         # campos que usás para crear un turno
@@ -32,28 +45,3 @@ class TurnoForm(forms.ModelForm):
             'fecha_apertura': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'}),
             'fecha_cierre': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'}),
         }
-
-    def clean(self):
-        cleaned = super().clean()
-        id_caja = cleaned.get('id_caja')
-        fecha_cierre = cleaned.get('fecha_cierre')
-
-        if id_caja and not fecha_cierre:
-            sucursal_id = id_caja.id_sucursal_id  # si Caja tiene FK a Sucursal
-            from .models import TurnosCaja
-
-            # Buscar si ya hay turno abierto en la misma sucursal
-            qs = TurnosCaja.objects.filter(
-                id_caja__id_sucursal_id=sucursal_id,
-                fecha_cierre__isnull=True
-            )
-            if self.instance and self.instance.pk:
-                qs = qs.exclude(pk=self.instance.pk)
-
-            if qs.exists():
-                raise ValidationError(
-                    f"Ya existe un turno abierto en la sucursal {id_caja.id_sucursal.nombre}. "
-                    "Debe cerrarse antes de abrir otro."
-                )
-
-        return cleaned
\ No newline at end of file
@@ -0,0 +1,21 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+from CajasApp.servicios import cerrar_turnos_vencidos, conciliar_turnos_cerrados
+
+
+class Command(BaseCommand):
+    help = 'Cierra los turnos que siguen abiertos después de N horas y concilia sus montos en todas las sucursales.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--horas', type=int, default=24, help='Antigüedad mínima de un turno abierto para cerrarlo (por defecto 24).')
+
+    def handle(self, *args, **options):
+        limite = timezone.now() - timedelta(hours=options['horas'])
+        turnos, cajas = cerrar_turnos_vencidos(limite)
+        conciliados = conciliar_turnos_cerrados()
+        self.stdout.write(self.style.SUCCESS(
+            f'{turnos} turno(s) cerrado(s), {cajas} caja(s) marcada(s) como cerradas, '
+            f'{conciliados} turno(s) cerrado(s) sin saldo conciliado(s).'
+        ))
@@ -0,0 +1,184 @@
+import time
+from decimal import Decimal
+
+from django.db import OperationalError, transaction
+from django.db.models import DecimalField, Exists, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from Task import etiquetas, referencias
+from Task.models import Cajas, Gastos, Sucursales, TurnosCaja, Ventas
+
+# Códigos de MySQL para "lock wait timeout" y "deadlock": la operación se puede reintentar
+ERRORES_REINTENTABLES = (1205, 1213)
+REINTENTOS = 3
+
+CERO = Value(Decimal('0.00'), output_field=DecimalField(max_digits=10, decimal_places=2))
+
+
+def _suma_por_turno(modelo, campo):
+    """Subconsulta correlacionada con la suma de `campo` para el turno de la fila externa"""
+    return Coalesce(
+        Subquery(
+            modelo.objects.filter(id_turno=OuterRef('id_turno'))
+            .order_by()
+            .values('id_turno')
+            .annotate(total=Sum(campo))
+            .values('total')[:1],
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ),
+        CERO,
+    )
+
+
+def montos_turno():
+    """Expresiones (ingresos, egresos, saldo) calculadas desde ventas y gastos de cada turno"""
+    ingresos = _suma_por_turno(Ventas, 'total_venta')
+    egresos = _suma_por_turno(Gastos, 'monto')
+    return ingresos, egresos, ingresos - egresos
+
+
+def cerrar_turno(id_turno, fecha_cierre=None):
+    """Cierra un turno guardando ingresos, egresos y saldo final.
+
+    La fila del turno queda bloqueada mientras se calculan los montos, que salen de
+    una sola consulta con la suma de `ventas` y de `gastos` del turno. Las ventas
+    bloquean la misma fila, así que ninguna se confirma entre el cálculo y el cierre.
+    Si el turno ya estaba cerrado se devuelve sin cambios.
+    """
+    with transaction.atomic():
+        turno = TurnosCaja.objects.select_for_update().get(id_turno=id_turno)
+        if turno.fecha_cierre is not None:
+            return turno
+
+        ingresos, egresos, _ = montos_turno()
+        montos = (
+            TurnosCaja.objects.filter(id_turno=id_turno)
+            .annotate(ingresos=ingresos, egresos=egresos)
+            .values('ingresos', 'egresos')
+            .get()
+        )
+        turno.fecha_cierre = fecha_cierre or timezone.now()
+        turno.ingresos_totales = montos['ingresos']
+        turno.egresos_totales = montos['egresos']
+        turno.saldo_final = montos['ingresos'] - montos['egresos']
+        turno.save(update_fields=['fecha_cierre', 'ingresos_totales', 'egresos_totales', 'saldo_final'])
+    return turno
+
+
+def cerrar_turnos_vencidos(abiertos_antes_de, fecha_cierre=None):
+    """Cierra en bloque los turnos abiertos antes de la fecha indicada, en todas las sucursales.
+
+    Los totales se calculan y guardan con un único UPDATE, y las cajas que se quedan
+    sin turnos abiertos pasan a "Cerrada". Devuelve (turnos_cerrados, cajas_cerradas).
+    """
+    fecha_cierre = fecha_cierre or timezone.now()
+    with transaction.atomic():
+        vencidos = list(
+            TurnosCaja.objects.select_for_update()
+            .filter(fecha_cierre__isnull=True, fecha_apertura__lt=abiertos_antes_de)
+            .values_list('id_turno', 'id_caja_id')
+        )
+        if not vencidos:
+            return 0, 0
+
+        ingresos, egresos, saldo = montos_turno()
+        turnos = TurnosCaja.objects.filter(id_turno__in=[id_turno for id_turno, _ in vencidos])
+        cerrados = turnos.update(
+            fecha_cierre=fecha_cierre,
+            ingresos_totales=ingresos,
+            egresos_totales=egresos,
+            saldo_final=saldo,
+        )
+        cajas = (
+            Cajas.objects.filter(id_caja__in={id_caja for _, id_caja in vencidos}, estado='Abierta')
+            .exclude(Exists(TurnosCaja.objects.filter(id_caja=OuterRef('id_caja'), fecha_cierre__isnull=True)))
+            .update(estado='Cerrada')
+        )
+        # update() no dispara señales
+        transaction.on_commit(referencias.invalidar)
+        etiquetas.invalidar_al_confirmar(
+            *(f'turno:{id_turno}' for id_turno, _ in vencidos), *{f'caja:{id_caja}' for _, id_caja in vencidos},
+        )
+    return cerrados, cajas
+
+
+def conciliar_turnos_cerrados():
+    """Recalcula los montos de los turnos cerrados que quedaron sin saldo final (un UPDATE sobre los turnos bloqueados)"""
+    ingresos, egresos, saldo = montos_turno()
+    with transaction.atomic():
+        # Los ids hacen falta para invalidar las etiquetas de cada turno
+        ids = list(
+            TurnosCaja.objects.select_for_update()
+            .filter(fecha_cierre__isnull=False, saldo_final__isnull=True)
+            .values_list('id_turno', flat=True)
+        )
+        if not ids:
+            return 0
+        etiquetas.invalidar_al_confirmar(*(f'turno:{id_turno}' for id_turno in ids))
+        return TurnosCaja.objects.filter(id_turno__in=ids).update(
+            ingresos_totales=ingresos,
+            egresos_totales=egresos,
+            saldo_final=saldo,
+        )
+
+
+# ===== APERTURA DE CAJAS Y TURNOS =====
+# La regla "una caja abierta por sucursal" se protege bloqueando la fila de la
+# sucursal, y "un turno abierto por caja" bloqueando la fila de la caja. Esas filas
+# siempre existen, así que el bloqueo funciona aunque todavía no haya ninguna caja
+# o turno abierto, y solo espera quien intenta abrir en la misma sucursal o caja.
+
+class AperturaRechazada(Exception):
+    """No se puede abrir la caja o el turno; el mensaje se muestra al usuario"""
+
+
+def _es_reintentable(error):
+    codigo = error.args[0] if error.args else None
+    return codigo in ERRORES_REINTENTABLES or 'locked' in str(error).lower()
+
+
+def _con_reintentos(operacion, mensaje):
+    """Ejecuta `operacion` y la reintenta si la base de datos reporta un conflicto de bloqueo.
+
+    Si el conflicto sigue después de los reintentos lanza `AperturaRechazada(mensaje)`.
+    """
+    for intento in range(REINTENTOS):
+        try:
+            return operacion()
+        except OperationalError as error:
+            if not _es_reintentable(error):
+                raise
+            if intento == REINTENTOS - 1:
+                raise AperturaRechazada(mensaje)
+            time.sleep(0.05 * 2 ** intento)
+
+
+def guardar_caja(caja):
+    """Guarda la caja; si queda abierta, verifica que no haya otra caja abierta en su sucursal"""
+    def guardar():
+        with transaction.atomic():
+            if caja.estado == 'Abierta':
+                Sucursales.objects.select_for_update().filter(id_sucursal=caja.id_sucursal_id).values_list('id_sucursal').first()
+                abiertas = Cajas.objects.filter(id_sucursal_id=caja.id_sucursal_id, estado='Abierta')
+                if caja.pk:
+                    abiertas = abiertas.exclude(pk=caja.pk)
+                if abiertas.exists():
+                    raise AperturaRechazada('Ya existe una caja abierta en esta sucursal; ciérrala antes de abrir otra.')
+            caja.save()
+            return caja
+    return _con_reintentos(guardar, 'Hay otra apertura en curso en esta sucursal; intenta de nuevo en unos segundos.')
+
+
+def abrir_turno(turno):
+    """Guarda un turno nuevo verificando, con la caja bloqueada, que no tenga otro turno abierto"""
+    def guardar():
+        with transaction.atomic():
+            Cajas.objects.select_for_update().filter(id_caja=turno.id_caja_id).values_list('id_caja').first()
+            abiertos = TurnosCaja.objects.filter(id_caja_id=turno.id_caja_id, fecha_cierre__isnull=True)
+            if turno.fecha_cierre is None and abiertos.exists():
+                raise AperturaRechazada('Ya hay un turno abierto para esa caja; ciérralo antes de abrir uno nuevo.')
+            if not turno.fecha_apertura:
+                turno.fecha_apertura = timezone.now()
+            turno.save()
+            return turno
+    return _con_reintentos(guardar, 'Hay otra operación en curso en esta caja; intenta de nuevo en unos segundos.')
@@ -1,3 +1,232 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import OperationalError, connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from Task import referencias
+from Task.models import Cajas, Empleados, Gastos, Sucursales, TurnosCaja, Ventas
+from Task.pruebas import PresupuestoConsultasMixin
+from . import servicios
+from .forms import CajaForm, TurnoForm
+from .servicios import (
+    AperturaRechazada, abrir_turno, cerrar_turno, cerrar_turnos_vencidos, conciliar_turnos_cerrados, guardar_caja,
+)
+
+
+class PresupuestosCajasTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajero', 'cajero@lamonona.com', 'clave')
+        empleado = Empleados.objects.create(nombre='Caro', apellido='Caja', correo='cajero@lamonona.com', id_user_id=cls.usuario.id)
+        for i in range(3):
+            sucursal = Sucursales.objects.create(nombre_sucursal=f'Sucursal {i}')
+            for j in range(3):
+                caja = Cajas.objects.create(id_sucursal=sucursal, ubicacion=f'Caja {j}', estado='Abierta' if j == 0 else 'Cerrada')
+                if j == 0:
+                    TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_lista_cajas(self):
+        respuesta = self.get_con_presupuesto('lista_cajas')
+        self.assertEqual(len(respuesta.context['cajas']), 9)
+        # Con la caché de referencia caliente no se consultan cajas ni sucursales
+        with CaptureQueriesContext(connection) as consultas:
+            self.client.get(reverse('lista_cajas'))
+        self.assertFalse([consulta for consulta in consultas.captured_queries if 'cajas' in consulta['sql']])
+
+    def test_formulario_de_caja(self):
+        self.get_con_presupuesto('crear_caja')
+
+
+class CierreTurnosTests(TestCase):
+    """Montos guardados al cerrar turnos, uno a uno, en bloque y al conciliar"""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_user('cierre', 'cierre@lamonona.com', 'clave')
+        cls.empleado = Empleados.objects.create(nombre='Ceci', apellido='Cierre', correo='cierre@lamonona.com', id_user_id=usuario.id)
+        sucursal = Sucursales.objects.create(nombre_sucursal='Oeste')
+        cls.cajas = [Cajas.objects.create(id_sucursal=sucursal, ubicacion=f'Caja {i}', estado='Abierta') for i in range(2)]
+
+    def setUp(self):
+        cache.clear()
+
+    def _turno(self, caja, horas_abierto, ventas=(), gastos=()):
+        ahora = timezone.now()
+        turno = TurnosCaja.objects.create(
+            id_caja=caja, id_empleado=self.empleado, fecha_apertura=ahora - timedelta(hours=horas_abierto),
+        )
+        for total in ventas:
+            Ventas.objects.create(id_turno=turno, fecha_venta=ahora, total_venta=Decimal(total))
+        for monto in gastos:
+            Gastos.objects.create(id_turno=turno, fecha_gasto=ahora, monto=Decimal(monto), concepto='Limpieza')
+        return turno
+
+    def _montos(self, turno):
+        turno.refresh_from_db()
+        return turno.ingresos_totales, turno.egresos_totales, turno.saldo_final
+
+    def test_cerrar_turno(self):
+        turno = self._turno(self.cajas[0], 2, ventas=['10.50', '4.25'], gastos=['3.00'])
+        cerrar_turno(turno.id_turno)
+        self.assertEqual(self._montos(turno), (Decimal('14.75'), Decimal('3.00'), Decimal('11.75')))
+        self.assertIsNotNone(turno.fecha_cierre)
+
+        # Cerrar otra vez no recalcula ni cambia la fecha de cierre
+        fecha_cierre = turno.fecha_cierre
+        Ventas.objects.create(id_turno=turno, fecha_venta=timezone.now(), total_venta=Decimal('1.00'))
+        cerrar_turno(turno.id_turno)
+        self.assertEqual(self._montos(turno), (Decimal('14.75'), Decimal('3.00'), Decimal('11.75')))
+        self.assertEqual(turno.fecha_cierre, fecha_cierre)
+
+    def test_turno_sin_movimientos(self):
+        turno = self._turno(self.cajas[0], 1)
+        cerrar_turno(turno.id_turno)
+        self.assertEqual(self._montos(turno), (Decimal('0.00'), Decimal('0.00'), Decimal('0.00')))
+
+    def test_cerrar_turnos_vencidos(self):
+        vencido = self._turno(self.cajas[0], 30, ventas=['20.00'], gastos=['5.00'])
+        vigente = self._turno(self.cajas[1], 2, ventas=['7.00'])
+        self.assertEqual(cerrar_turnos_vencidos(timezone.now() - timedelta(hours=24)), (1, 1))
+        self.assertEqual(self._montos(vencido), (Decimal('20.00'), Decimal('5.00'), Decimal('15.00')))
+        self.assertIsNone(self._montos(vigente)[2])
+        self.assertEqual(
+            list(Cajas.objects.order_by('id_caja').values_list('estado', flat=True)), ['Cerrada', 'Abierta'],
+        )
+        self.assertEqual(cerrar_turnos_vencidos(timezone.now() - timedelta(hours=24)), (0, 0))
+
+    def test_conciliar_turnos_cerrados(self):
+        turno = self._turno(self.cajas[0], 3, ventas=['9.99'], gastos=['0.99'])
+        TurnosCaja.objects.filter(pk=turno.pk).update(fecha_cierre=timezone.now())
+        abierto = self._turno(self.cajas[1], 1, ventas=['1.00'])
+        self.assertEqual(conciliar_turnos_cerrados(), 1)
+        self.assertEqual(self._montos(turno), (Decimal('9.99'), Decimal('0.99'), Decimal('9.00')))
+        self.assertIsNone(self._montos(abierto)[2])
+        self.assertEqual(conciliar_turnos_cerrados(), 0)
+
+    @mock.patch.object(servicios.time, 'sleep')
+    def test_reintentos_agotados_usan_el_mensaje_de_la_operacion(self, _):
+        def bloqueada():
+            raise OperationalError(1205, 'Lock wait timeout exceeded')
+
+        with self.assertRaisesMessage(AperturaRechazada, 'en esta caja'):
+            servicios._con_reintentos(bloqueada, 'Hay otra operación en curso en esta caja.')
+
+
+class AperturaTests(TestCase):
+    """Una caja abierta por sucursal y un turno abierto por caja, verificados con la fila bloqueada"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('apertura', 'apertura@lamonona.com', 'clave')
+        cls.empleado = Empleados.objects.create(nombre='Abi', apellido='Apertura', correo='apertura@lamonona.com', id_user_id=cls.usuario.id)
+        cls.sucursales = [Sucursales.objects.create(nombre_sucursal=nombre) for nombre in ('Norte', 'Sur')]
+
+    def setUp(self):
+        cache.clear()
+
+    def test_un_turno_abierto_por_caja(self):
+        caja = guardar_caja(Cajas(id_sucursal=self.sucursales[0], estado='Abierta'))
+        primero = abrir_turno(TurnosCaja(id_caja=caja, id_empleado=self.empleado))
+        self.assertIsNotNone(primero.fecha_apertura)
+        with self.assertRaisesMessage(AperturaRechazada, 'Ya hay un turno abierto'):
+            abrir_turno(TurnosCaja(id_caja=caja, id_empleado=self.empleado))
+        self.assertEqual(TurnosCaja.objects.filter(id_caja=caja).count(), 1)
+
+        cerrar_turno(primero.id_turno)
+        abrir_turno(TurnosCaja(id_caja=caja, id_empleado=self.empleado))
+        self.assertEqual(TurnosCaja.objects.filter(id_caja=caja, fecha_cierre__isnull=True).count(), 1)
+
+    def test_una_caja_abierta_por_sucursal(self):
+        abierta = guardar_caja(Cajas(id_sucursal=self.sucursales[0], estado='Abierta'))
+        with self.assertRaisesMessage(AperturaRechazada, 'Ya existe una caja abierta'):
+            guardar_caja(Cajas(id_sucursal=self.sucursales[0], estado='Abierta'))
+        # Una caja cerrada, la misma caja guardada otra vez y otra sucursal no chocan
+        cerrada = guardar_caja(Cajas(id_sucursal=self.sucursales[0], estado='Cerrada'))
+        guardar_caja(abierta)
+        guardar_caja(Cajas(id_sucursal=self.sucursales[1], estado='Abierta'))
+        self.assertEqual(Cajas.objects.filter(estado='Abierta').count(), 2)
+
+        cerrada.estado = 'Abierta'
+        with self.assertRaises(AperturaRechazada):
+            guardar_caja(cerrada)
+
+    def test_crear_caja_muestra_el_rechazo(self):
+        guardar_caja(Cajas(id_sucursal=self.sucursales[0], estado='Abierta'))
+        self.client.force_login(self.usuario)
+        respuesta = self.client.post(reverse('crear_caja'), {
+            'id_sucursal': self.sucursales[0].pk, 'ubicacion': 'Monona, zn oeste', 'estado': 'Abierta',
+        })
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertIn('Ya existe una caja abierta', str(respuesta.context['form'].non_field_errors()))
+        self.assertEqual(Cajas.objects.count(), 1)
+
+    @mock.patch.object(servicios.time, 'sleep')
+    def test_reintenta_conflictos_de_bloqueo(self, espera):
+        errores = [OperationalError(1213, 'Deadlock found'), OperationalError(1205, 'Lock wait timeout exceeded')]
+
+        def operacion():
+            if errores:
+                raise errores.pop(0)
+            return 'hecho'
+
+        self.assertEqual(servicios._con_reintentos(operacion, 'Ocupado.'), 'hecho')
+        self.assertEqual(espera.call_count, 2)
+
+    @mock.patch.object(servicios.time, 'sleep')
+    def test_otros_errores_no_se_reintentan(self, espera):
+        operacion = mock.Mock(side_effect=OperationalError(1054, 'Unknown column'))
+        with self.assertRaises(OperationalError):
+            servicios._con_reintentos(operacion, 'Ocupado.')
+        self.assertEqual(operacion.call_count, 1)
+        espera.assert_not_called()
+
+
+class ReferenciasTests(TestCase):
+    """Copia por proceso de sucursales y cajas, recargada cuando cambia la versión compartida"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.sucursal = Sucursales.objects.create(nombre_sucursal='Centro')
+        cls.caja = Cajas.objects.create(id_sucursal=cls.sucursal, ubicacion='Monona, zn oeste', estado='Cerrada')
+
+    def setUp(self):
+        cache.clear()
+        referencias.cajas()
+
+    def test_formularios_sin_consultas(self):
+        with self.assertNumQueries(0):
+            caja_form, turno_form = CajaForm(), TurnoForm()
+            self.assertIn('Centro', str(caja_form['id_sucursal']) + str(turno_form['id_caja']))
+            sucursal = caja_form.fields['id_sucursal'].clean(str(self.sucursal.pk))
+            caja = turno_form.fields['id_caja'].clean(str(self.caja.pk))
+        self.assertEqual((sucursal.pk, sucursal.nombre_sucursal), (self.sucursal.pk, 'Centro'))
+        self.assertEqual((caja.pk, caja.id_sucursal_id, caja.estado), (self.caja.pk, self.sucursal.pk, 'Cerrada'))
+
+    def test_save_y_delete_cambian_la_version(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            nueva = Sucursales.objects.create(nombre_sucursal='Norte')
+        self.assertEqual(referencias.sucursal(nueva.pk).nombre_sucursal, 'Norte')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.caja.delete()
+        self.assertIsNone(referencias.caja(self.caja.pk))
 
-# Create your tests here.
+    def test_otro_proceso_recarga_la_copia(self):
+        # update() no dispara señales: la copia del proceso sigue con el nombre anterior
+        Sucursales.objects.filter(pk=self.sucursal.pk).update(nombre_sucursal='Centro histórico')
+        with self.assertNumQueries(0):
+            self.assertEqual(referencias.sucursal(self.sucursal.pk).nombre_sucursal, 'Centro')
+        # Lo que hace el save de otro worker: cambiar la versión en la caché compartida
+        referencias.invalidar()
+        self.assertEqual(referencias.sucursal(self.sucursal.pk).nombre_sucursal, 'Centro histórico')
+        self.assertEqual(referencias.caja(self.caja.pk).nombre_sucursal, 'Centro histórico')
@@ -6,4 +6,5 @@ urlpatterns = [
     path('nueva/', views.crear_caja, name='crear_caja'),
     path('editar/<int:pk>/', views.editar_caja, name='editar_caja'),
     path('eliminar/<int:pk>/', views.eliminar_caja, name='eliminar_caja'),
+    path('turnos/<int:pk>/cerrar/', views.cerrar_turno_view, name='cerrar_turno'),
 ]
\ No newline at end of file
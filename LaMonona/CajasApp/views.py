@@ -1,37 +1,33 @@
+from asgiref.sync import sync_to_async
 from django.shortcuts import render, redirect, get_object_or_404
-from django.db import transaction
 from django.utils import timezone
+from Task import referencias
+from Task.asincrono import arender
 from Task.models import Cajas, TurnosCaja
+from django.contrib.auth.decorators import login_required
+from django.http import Http404, JsonResponse
+from django.views.decorators.http import require_http_methods
 from .forms import CajaForm, TurnoForm
+from .servicios import AperturaRechazada, abrir_turno, cerrar_turno, guardar_caja
 
 
-def lista_cajas(request):
-    cajas = Cajas.objects.all()
-    return render(request, 'cajas/lista.html', {'cajas': cajas})
+async def lista_cajas(request):
+    # sale de la caché de referencia: no consulta la base mientras no cambie ninguna caja
+    cajas = await sync_to_async(referencias.cajas)()
+    return await arender(request, 'cajas/lista.html', {'cajas': cajas})
 
 
 def crear_caja(request):
     if request.method == 'POST':
         form = CajaForm(request.POST)
         if form.is_valid():
+            caja = form.save(commit=False)
+            caja.id_sucursal = form.cleaned_data['id_sucursal']
             try:
-                with transaction.atomic():
-                    sucursal = form.cleaned_data['id_sucursal']
-                    # bloquear todas las cajas de esa sucursal
-                    existentes = Cajas.objects.select_for_update().filter(
-                        id_sucursal=sucursal,
-                        estado='Abierta'
-                    )
-                    if existentes.exists():
-                        form.add_error(None, 'Ya existe una caja abierta en esta sucursal; ciérrala antes de abrir otra.')
-                    else:
-                        caja = form.save(commit=False)   # 👈 acá
-                        if not caja.fecha_apertura:
-                            caja.fecha_apertura = timezone.now()
-                        caja.id_sucursal = sucursal      # 👈 lo asignás explícito
-                        caja.save()
-                        return redirect('lista_cajas')
-            except Exception as e:
+                # la sucursal queda bloqueada mientras se verifica que no haya otra caja abierta
+                guardar_caja(caja)
+                return redirect('lista_cajas')
+            except AperturaRechazada as e:
                 form.add_error(None, str(e))
     else:
         form = CajaForm()
@@ -49,27 +45,29 @@ def editar_caja(request, pk):
             sucursal = form.cleaned_data.get('id_sucursal')
             if sucursal:
                 caja.id_sucursal = sucursal
-            caja.save()
-
-            # 🔹 Lógica de turnos
-            if caja.estado == "Cerrada":
-                turno_abierto = TurnosCaja.objects.filter(
-                    id_caja=caja, fecha_cierre__isnull=True
-                ).first()
-                if turno_abierto:
-                    turno_abierto.fecha_cierre = timezone.now()
-                    turno_abierto.save()
-
-            elif caja.estado == "Abierta":
-                # Creamos un turno si no hay otro abierto
-                if not TurnosCaja.objects.filter(id_caja=caja, fecha_cierre__isnull=True).exists():
-                    TurnosCaja.objects.create(
-                        id_caja=caja,
-                        id_empleado=None,  # ⚠️ ajustar si lo ligás a un usuario/empleado
-                        fecha_apertura=timezone.now()
-                    )
-
-            return redirect('lista_cajas')
+            try:
+                guardar_caja(caja)
+
+                # 🔹 Lógica de turnos
+                if caja.estado == "Cerrada":
+                    turno_abierto = TurnosCaja.objects.filter(
+                        id_caja=caja, fecha_cierre__isnull=True
+                    ).values_list('id_turno', flat=True).first()
+                    if turno_abierto:
+                        cerrar_turno(turno_abierto)
+
+                elif caja.estado == "Abierta":
+                    # Creamos un turno si no hay otro abierto
+                    if not TurnosCaja.objects.filter(id_caja=caja, fecha_cierre__isnull=True).exists():
+                        abrir_turno(TurnosCaja(
+                            id_caja=caja,
+                            id_empleado=None,  # ⚠️ ajustar si lo ligás a un usuario/empleado
+                            fecha_apertura=timezone.now()
+                        ))
+
+                return redirect('lista_cajas')
+            except AperturaRechazada as e:
+                form.add_error(None, str(e))
     else:
         form = CajaForm(instance=caja)
 
@@ -88,22 +86,29 @@ def crear_turno(request):
         form = TurnoForm(request.POST)
         if form.is_valid():
             try:
-                with transaction.atomic():
-                    id_caja = form.cleaned_data['id_caja']
-                    existentes = TurnosCaja.objects.select_for_update().filter(
-                        id_caja=id_caja,
-                        fecha_cierre__isnull=True
-                    )
-                    if existentes.exists():
-                        form.add_error(None, 'Ya hay un turno abierto para esa caja; ciérralo antes de abrir uno nuevo.')
-                    else:
-                        turno = form.save(commit=False)
-                        if not turno.fecha_apertura:
-                            turno.fecha_apertura = timezone.now()
-                        turno.save()
-                        return redirect('lista_turnos')
-            except Exception as e:
+                # la caja queda bloqueada mientras se verifica que no tenga otro turno abierto
+                abrir_turno(form.save(commit=False))
+                return redirect('lista_turnos')
+            except AperturaRechazada as e:
                 form.add_error(None, str(e))
     else:
         form = TurnoForm()
     return render(request, 'cajas/form.html', {'form': form})
+
+
+@login_required
+@require_http_methods(["POST"])
+def cerrar_turno_view(request, pk):
+    """Cierra el turno calculando ingresos, egresos y saldo final"""
+    try:
+        turno = cerrar_turno(pk)
+    except TurnosCaja.DoesNotExist:
+        raise Http404('Turno no encontrado')
+    return JsonResponse({
+        'success': True,
+        'id_turno': turno.id_turno,
+        'fecha_cierre': turno.fecha_cierre,
+        'ingresos_totales': turno.ingresos_totales,
+        'egresos_totales': turno.egresos_totales,
+        'saldo_final': turno.saldo_final,
+    })
@@ -5,6 +5,18 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.1/howto/deployment/asgi/
+
+En producción:
+
+    uvicorn LaMonona.asgi:application --host 0.0.0.0 --port 8000 --workers 4
+
+Las vistas async (lista_productos, dashboard_stock, lista_cajas, lista_ventas,
+datos_ventas, eventos_stock) esperan sus consultas sin ocupar el worker; las
+demás siguen siendo síncronas y Django las corre en un hilo por petición. Los
+archivos estáticos los sirve el proxy (nginx), como con WSGI. No usar
+CONN_MAX_AGE > 0: con ASGI cada petición abre sus conexiones en otro hilo y las
+persistentes se acumularían. `python manage.py benchmark_concurrencia` compara
+cuántas peticiones simultáneas atiende un worker con WSGI y con ASGI.
 """
 
 import os
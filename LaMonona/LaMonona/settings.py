@@ -11,6 +11,8 @@ https://docs.djangoproject.com/en/5.1/ref/settings/
 """
 
 from pathlib import Path
+import os
+import tempfile
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -47,11 +49,14 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'Task.metricas.MetricasMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
+    'Task.replicas.ReplicaMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'Task.middleware.PerfilMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -75,6 +80,8 @@ TEMPLATES = [
 ]
 
 WSGI_APPLICATION = 'LaMonona.wsgi.application'
+# Las vistas async (listas, dashboard, eventos SSE) solo liberan el worker con ASGI
+ASGI_APPLICATION = 'LaMonona.asgi.application'
 
 
 # Database
@@ -91,6 +98,49 @@ DATABASES = {
     }
 }
 
+# Réplica de solo lectura para reportes y dashboards (Task/replicas.py). Sin REPLICA_NAME
+# todo se lee de `default`. En local puede ser otra base SQLite o MySQL cargada con
+# `python manage.py sincronizar_replica`.
+if os.environ.get('REPLICA_NAME'):
+    DATABASES['reporting'] = {
+        **DATABASES['default'],
+        'ENGINE': os.environ.get('REPLICA_ENGINE', DATABASES['default']['ENGINE']),
+        'NAME': os.environ['REPLICA_NAME'],
+        'USER': os.environ.get('REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.environ.get('REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.environ.get('REPLICA_HOST', DATABASES['default']['HOST']),
+        'PORT': os.environ.get('REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+DATABASE_ROUTERS = ['Task.replicas.ReporteRouter']
+# Retraso de la réplica a partir del cual los reportes vuelven al primario; también es
+# cuánto tiempo lee del primario una sesión después de escribir
+REPLICA_RETRASO_MAXIMO = 5
+
+
+# Authentication
+# Igual que ModelBackend, pero los permisos de cada usuario quedan en la caché (Task/permisos.py)
+
+AUTHENTICATION_BACKENDS = ['Task.permisos.PermisosCacheBackend']
+
+
+# Cache
+# Compartida entre procesos del mismo servidor; los datos de referencia guardan aquí su versión
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / '.cache',
+    }
+}
+# Con varios servidores, la caché etiquetada (Task/etiquetas.py) tiene que ser compartida
+# para que todos vean las invalidaciones: CACHE_REDIS_URL=redis://host:6379/0 (requiere `redis`)
+if os.environ.get('CACHE_REDIS_URL'):
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ['CACHE_REDIS_URL'],
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -125,6 +175,36 @@ USE_TZ = True
 LOGIN_URL = 'signin'
 LOGIN_REDIRECT_URL = 'inicio'
 
+# Reportes PDF: se generan en un pool de procesos y se guardan por hash de sus datos
+REPORTES_PDF_DIR = BASE_DIR / 'reportes_pdf'
+REPORTES_PDF_PROCESOS = 2
+
+# Sockets por los que los procesos se reenvían los avisos de stock (ruta corta: límite de los sockets Unix)
+AVISOS_SOCKETS_DIR = Path(tempfile.gettempdir()) / 'lamonona_avisos'
+
+# Métricas por vista (Task/metricas.py): consultas SQL permitidas por petición, incluidas
+# las de sesión y usuario. Pasarse registra una advertencia y hace fallar las pruebas.
+PRESUPUESTO_CONSULTAS_POR_DEFECTO = 30
+PRESUPUESTOS_CONSULTAS = {
+    # Con la sesión todavía sin perfil: se consulta y se guarda en la sesión
+    'inicio': 6,
+    'user': 6,
+    'userlist': 2,
+    'datos_usuarios': 6,
+    'lista_productos': 5,
+    'dashboard_stock': 5,
+    'buscar_productos': 4,
+    'lista_cajas': 3,
+    'lista_ventas': 2,
+    'datos_ventas': 2,
+    'reporte_resumen': 4,
+    'metricas': 2,
+}
+# Token para que Prometheus lea /metricas/ sin sesión (Authorization: Bearer <token>)
+METRICAS_TOKEN = os.environ.get('METRICAS_TOKEN')
+
+TEST_RUNNER = 'Task.pruebas.ModelosGestionadosRunner'
+
 # Static files (CSS, JavaScript, Images)
 # https://docs.djangoproject.com/en/5.1/howto/static-files/
 
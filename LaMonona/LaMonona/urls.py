@@ -28,7 +28,9 @@ urlpatterns = [
     path('ventas/', include('VentasApp.urls')),
 
     path('users/', views.user_list, name='userlist'),
+    path('users/datos/', views.datos_usuarios, name='datos_usuarios'),
     path('users/add/', views.add_user, name='add_user'),
+    path('users/alta-masiva/', views.alta_masiva_usuarios, name='alta_masiva_usuarios'),
     path('users/edit/<int:user_id>/', views.edit_user, name='edit_user'),
     path('user/edit/<int:user_id>/', views.edit_profile, name='edit_profile'),
     path('user/change-password/', views.change_password, name='change_password'),
@@ -43,8 +45,12 @@ urlpatterns = [
     path('productos/editar/<int:producto_id>/', views.editar_producto, name='editar_producto'),
     path('productos/eliminar/<int:producto_id>/', views.eliminar_producto, name='eliminar_producto'),
     path('productos/dashboard/', views.dashboard_stock, name='dashboard_stock'),
+    path('productos/buscar/', views.buscar_productos, name='buscar_productos'),
+    path('productos/importar/', views.importar_productos, name='importar_productos'),
+    path('productos/eventos/', views.eventos_stock, name='eventos_stock'),
     
     path('logout/', views.exit, name='exit'),
+    path('metricas/', views.metricas_prometheus, name='metricas'),
     path('password_reset/', 
          auth_views.PasswordResetView.as_view(
              template_name='password_reset.html',
@@ -18,10 +18,12 @@ class SucursalesAdmin(admin.ModelAdmin):
 @admin.register(Cajas)
 class CajasAdmin(admin.ModelAdmin):
     list_display = ['id_caja', 'id_sucursal', 'ubicacion', 'estado']
+    list_select_related = ['id_sucursal']
 
 @admin.register(TurnosCaja)
 class TurnosCajaAdmin(admin.ModelAdmin):
     list_display = ['id_turno', 'id_empleado', 'fecha_apertura', 'fecha_cierre']
+    list_select_related = ['id_empleado']
 
 @admin.register(Ventas)
 class VentasAdmin(admin.ModelAdmin):
@@ -30,7 +32,9 @@ class VentasAdmin(admin.ModelAdmin):
 @admin.register(DetallesVenta)
 class DetallesVentaAdmin(admin.ModelAdmin):
     list_display = ['id_detalle', 'id_venta', 'id_producto', 'cantidad', 'subtotal']
+    list_select_related = ['id_venta', 'id_producto']
 
 @admin.register(Gastos)
 class GastosAdmin(admin.ModelAdmin):
-    list_display = ['id_gasto', 'id_turno', 'fecha_gasto', 'monto', 'concepto']
\ No newline at end of file
+    list_display = ['id_gasto', 'id_turno', 'fecha_gasto', 'monto', 'concepto']
+    list_select_related = ['id_turno']
\ No newline at end of file
@@ -0,0 +1,191 @@
+"""Alta masiva de empleados desde CSV (apertura de sucursales).
+
+Cada fila se valida con los campos de `EmpleadoCreationForm`; los usuarios y
+correos repetidos se buscan con una sola consulta para todo el archivo. Las
+contraseñas se hashean en paralelo en un pool de procesos (PBKDF2 es lo que más
+tarda) y después usuarios, empleados y grupos se insertan con `bulk_create`, en
+una transacción. Las filas con errores se saltan y se informan.
+
+Columnas: username, password, nombre, apellido, correo, rol y, opcionales, edad,
+telefono y direccion.
+"""
+import csv
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from .forms import EmpleadoCreationForm
+from .importacion import MAX_ERRORES_INFORMADOS, ImportacionInvalida
+from .models import AuthGroup, AuthUser, AuthUserGroups, Empleados
+
+COLUMNAS_OBLIGATORIAS = ['username', 'password', 'nombre', 'apellido', 'correo', 'rol']
+COLUMNAS = [*COLUMNAS_OBLIGATORIAS, 'edad', 'telefono', 'direccion']
+# Con pocas contraseñas no vale la pena levantar procesos
+MINIMO_PARA_POOL = 4
+
+
+def hashear(contrasenas, procesos=None):
+    """`make_password` de cada contraseña, repartidas entre `procesos` (por defecto, uno por CPU).
+
+    Los procesos se crean con "spawn": un fork desde un servidor con hilos puede
+    copiar locks tomados. Así los procesos no tienen Django configurado, por eso
+    reciben el hasher ya elegido y las sales generadas aquí.
+    """
+    procesos = min(procesos or os.cpu_count() or 1, len(contrasenas))
+    if procesos <= 1 or len(contrasenas) < MINIMO_PARA_POOL:
+        return [make_password(contrasena) for contrasena in contrasenas]
+    hasher = get_hasher()
+    sales = [hasher.salt() for _ in contrasenas]
+    with ProcessPoolExecutor(max_workers=procesos, mp_context=multiprocessing.get_context('spawn')) as pool:
+        return list(pool.map(
+            hasher.encode, contrasenas, sales, chunksize=max(1, len(contrasenas) // (procesos * 4)),
+        ))
+
+
+def _filas_validas(lector, resultado):
+    """(línea, valores limpios) de las filas que pasan la validación de cada campo"""
+    campos = EmpleadoCreationForm().fields
+    campos['password'] = campos['password1']
+    for fila in lector:
+        resultado['filas'] += 1
+        errores, limpios = {}, {}
+        for columna in COLUMNAS:
+            try:
+                limpios[columna] = campos[columna].clean((fila.get(columna) or '').strip())
+            except ValidationError as e:
+                errores[columna] = e.messages
+        if errores:
+            _agregar_error(resultado, lector.line_num, errores)
+        else:
+            yield lector.line_num, limpios
+
+
+def _agregar_error(resultado, linea, errores):
+    resultado['num_errores'] += 1
+    if len(resultado['errores']) < MAX_ERRORES_INFORMADOS:
+        resultado['errores'][linea] = errores
+
+
+def _sin_repetidos(filas, resultado):
+    """Descarta usuarios o correos ya registrados o repetidos dentro del archivo (una consulta)"""
+    usernames = {limpios['username'] for _, limpios in filas}
+    correos = {limpios['correo'] for _, limpios in filas}
+    existentes = AuthUser.objects.filter(Q(username__in=usernames) | Q(email__in=correos)).values_list('username', 'email')
+    usados_username = {username for username, _ in existentes}
+    usados_correo = {email for _, email in existentes}
+
+    unicas = []
+    for linea, limpios in filas:
+        errores = {}
+        if limpios['username'] in usados_username:
+            errores['username'] = ['Este nombre de usuario ya está registrado.']
+        if limpios['correo'] in usados_correo:
+            errores['correo'] = ['Este correo electrónico ya está registrado.']
+        if errores:
+            _agregar_error(resultado, linea, errores)
+            continue
+        usados_username.add(limpios['username'])
+        usados_correo.add(limpios['correo'])
+        unicas.append(limpios)
+    return unicas
+
+
+def _grupos(nombres):
+    """{nombre: id} de los grupos, creando los que falten"""
+    grupos = dict(AuthGroup.objects.filter(name__in=nombres).values_list('name', 'id'))
+    faltantes = [AuthGroup(name=nombre) for nombre in nombres if nombre not in grupos]
+    if faltantes:
+        AuthGroup.objects.bulk_create(faltantes, ignore_conflicts=True)
+        grupos = dict(AuthGroup.objects.filter(name__in=nombres).values_list('name', 'id'))
+    return grupos
+
+
+def _crear_usuarios(usuarios):
+    """bulk_create que deja asignado el id de cada usuario también en MySQL"""
+    AuthUser.objects.bulk_create(usuarios)
+    if connection.features.can_return_rows_from_bulk_insert:
+        return
+    ids = dict(
+        AuthUser.objects.filter(username__in=[usuario.username for usuario in usuarios]).values_list('username', 'id')
+    )
+    for usuario in usuarios:
+        usuario.id = ids[usuario.username]
+
+
+def _guardar(usuarios, filas):
+    """Usuarios, empleados y grupos en unas pocas sentencias"""
+    grupos = _grupos({limpios['rol'] for limpios in filas})
+    _crear_usuarios(usuarios)
+    Empleados.objects.bulk_create([
+        Empleados(
+            id_user=usuario,
+            nombre=limpios['nombre'],
+            apellido=limpios['apellido'],
+            edad=limpios['edad'],
+            telefono=limpios['telefono'] or None,
+            correo=limpios['correo'],
+            direccion=limpios['direccion'] or None,
+        )
+        for usuario, limpios in zip(usuarios, filas)
+    ])
+    AuthUserGroups.objects.bulk_create([
+        AuthUserGroups(user=usuario, group_id=grupos[limpios['rol']])
+        for usuario, limpios in zip(usuarios, filas)
+    ])
+
+
+def alta_masiva(archivo, permitir_administradores=True, simular=False, procesos=None, delimitador=','):
+    """Crea los empleados de un CSV (objeto de texto) y devuelve el resumen.
+
+    El resumen tiene `filas`, `creados`, `num_errores`, `errores`
+    ({línea: {columna: [mensajes]}}) y `segundos`. Con `simular=True` se valida
+    todo pero no se hashea ni se guarda nada.
+    """
+    lector = csv.DictReader(archivo, delimiter=delimitador)
+    faltantes = [columna for columna in COLUMNAS_OBLIGATORIAS if columna not in (lector.fieldnames or [])]
+    if faltantes:
+        raise ImportacionInvalida(f'Faltan las columnas: {", ".join(faltantes)}.')
+
+    resultado = {'filas': 0, 'creados': 0, 'num_errores': 0, 'errores': {}}
+    inicio = time.perf_counter()
+    filas = []
+    for linea, limpios in _filas_validas(lector, resultado):
+        if limpios['rol'] == 'administrador' and not permitir_administradores:
+            _agregar_error(resultado, linea, {'rol': ['Solo los super administradores pueden crear administradores.']})
+        else:
+            filas.append((linea, limpios))
+    filas = _sin_repetidos(filas, resultado)
+
+    if filas and not simular:
+        contrasenas = hashear([limpios['password'] for limpios in filas], procesos)
+        ahora = timezone.now()
+        # Mismos valores que EmpleadoCreationForm.save
+        usuarios = [
+            AuthUser(
+                username=limpios['username'],
+                email=limpios['correo'],
+                first_name=limpios['nombre'],
+                last_name=limpios['apellido'],
+                is_active=True,
+                is_staff=limpios['rol'] == 'administrador',
+                is_superuser=limpios['rol'] == 'administrador',
+                password=contrasena,
+                date_joined=ahora,
+            )
+            for limpios, contrasena in zip(filas, contrasenas)
+        ]
+        try:
+            with transaction.atomic():
+                _guardar(usuarios, filas)
+        except IntegrityError:
+            # Otro alta registró el mismo usuario o correo mientras se hasheaban las contraseñas
+            raise ImportacionInvalida('Algunos usuarios se registraron mientras tanto; vuelve a intentarlo.')
+    resultado['creados'] = len(filas)
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    return resultado
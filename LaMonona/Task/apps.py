@@ -3,4 +3,7 @@ from django.apps import AppConfig
 
 class TaskConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
-    name = 'Task'
\ No newline at end of file
+    name = 'Task'
+
+    def ready(self):
+        from . import busqueda, etiquetas, metricas, middleware, permisos, referencias, replicas  # noqa: F401  (conectan señales)
@@ -0,0 +1,48 @@
+"""Ayudas para las vistas async de lectura (servidas con ASGI, ver LaMonona/asgi.py).
+
+El ORM async de Django (`aiterator`, `acount`, `aaggregate`...) ejecuta cada
+consulta con `sync_to_async` en el hilo de la petición, así que dos consultas de
+una misma petición lanzadas con `asyncio.gather` igual corren una detrás de otra.
+`leer` ejecuta una función síncrona de solo lectura en un hilo aparte, con su
+propia conexión (que se cierra al terminar), y así `gather` sí las superpone.
+Las ContextVar (lecturas de reporte, métricas) pasan al hilo.
+
+Dentro de una transacción (p. ej. en las pruebas) no se abre otra conexión, que no
+vería lo que todavía no se confirmó: se lee en el hilo de la petición.
+"""
+from asgiref.sync import sync_to_async
+from django.db import connections
+from django.shortcuts import render
+
+
+def _en_transaccion():
+    return any(conexion.in_atomic_block for conexion in connections.all(initialized_only=True))
+
+
+def _aislada(funcion, args):
+    try:
+        return funcion(*args)
+    finally:
+        # El hilo es del pool del event loop: nadie más cerraría su conexión
+        connections.close_all()
+
+
+async def leer(funcion, *args):
+    """Resultado de `funcion(*args)`, calculado en otro hilo para poder usar `asyncio.gather`"""
+    if await sync_to_async(_en_transaccion)():
+        return await sync_to_async(funcion)(*args)
+    return await sync_to_async(_aislada, thread_sensitive=False)(funcion, args)
+
+
+async def listar(queryset):
+    """Filas del queryset con el ORM async"""
+    return [fila async for fila in queryset.aiterator()]
+
+
+async def arender(request, plantilla, contexto=None):
+    """`render` desde una vista async: las plantillas leen la sesión, el usuario y `request.empleado`"""
+    # `request.user` y `auser()` guardan el usuario por separado; sin esto, después de
+    # `login_required` (que usa `auser()`) la plantilla lo volvería a consultar
+    if hasattr(request, '_acached_user'):
+        request.user = request._acached_user
+    return await sync_to_async(render)(request, plantilla, contexto)
@@ -0,0 +1,177 @@
+"""Avisos de stock en tiempo real para el dashboard (Server-Sent Events).
+
+Cuando un movimiento de stock hace que un producto cambie de estado (normal, stock
+bajo o sin stock), `movimientos.aplicar` publica un aviso después del commit. Los
+avisos se entregan a las conexiones SSE abiertas en el mismo proceso y, para llegar
+a los demás procesos del servidor (p. ej. una venta registrada en un worker WSGI y
+un dashboard abierto en el proceso ASGI), se envían como datagramas a un socket
+Unix por proceso que escucha. Una publicación (una importación puede cambiar miles
+de productos) se limita a los avisos que caben en una cola y viaja en datagramas del
+tamaño que admite el sistema. No se consulta la base para esperar cambios.
+"""
+import asyncio
+import atexit
+import json
+import logging
+import os
+import socket
+import tempfile
+import threading
+import uuid
+from contextlib import asynccontextmanager
+from pathlib import Path
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+LATIDO_SEGUNDOS = 20
+MAX_PENDIENTES = 100
+# Tope por datagrama; el sistema puede admitir menos (macOS: 2048 bytes por defecto)
+MAX_BYTES_DATAGRAMA = 64 * 1024
+# Los sockets Unix de datagramas no existen en Windows: ahí los avisos solo llegan al mismo proceso
+_ENTRE_PROCESOS = hasattr(socket, 'AF_UNIX')
+
+_lock = threading.Lock()
+_suscriptores = set()  # (loop, cola) de cada conexión abierta en este proceso
+_receptor = {'ruta': None, 'transporte': None}
+
+
+def _directorio():
+    directorio = Path(getattr(settings, 'AVISOS_SOCKETS_DIR', Path(tempfile.gettempdir()) / 'lamonona_avisos'))
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def cambios_de_estado(antes_y_despues):
+    """Avisos para los productos que cambiaron de estado.
+
+    Recibe tuplas (id_producto, nombre, stock_anterior, stock_actual, stock_minimo)
+    y usa las mismas reglas que `Productos.estado_stock`.
+    """
+    from .models import Productos
+
+    avisos = []
+    for id_producto, nombre, anterior, actual, minimo in antes_y_despues:
+        estado_anterior = Productos(stock=anterior, stock_minimo=minimo).estado_stock
+        estado = Productos(stock=actual, stock_minimo=minimo).estado_stock
+        if estado != estado_anterior:
+            avisos.append({
+                'id_producto': id_producto,
+                'nombre_producto': nombre,
+                'stock': actual,
+                'stock_minimo': minimo,
+                'estado_anterior': estado_anterior,
+                'estado': estado,
+            })
+    return avisos
+
+
+def publicar(avisos):
+    """Entrega los avisos a los dashboards abiertos en este y en los demás procesos"""
+    if not avisos:
+        return
+    if len(avisos) > MAX_PENDIENTES:
+        # Ninguna cola guarda más que esto: el resto se descartaría en cada conexión
+        logger.warning('Se publican %s de %s avisos de stock', MAX_PENDIENTES, len(avisos))
+        avisos = avisos[:MAX_PENDIENTES]
+    _entregar(avisos)
+    if _ENTRE_PROCESOS:
+        _enviar_a_otros_procesos(avisos)
+
+
+def _entregar(avisos):
+    with _lock:
+        suscriptores = list(_suscriptores)
+    for loop, cola in suscriptores:
+        try:
+            loop.call_soon_threadsafe(_encolar, cola, avisos)
+        except RuntimeError:  # el loop de esa conexión ya se cerró
+            pass
+
+
+def _encolar(cola, avisos):
+    descartados = 0
+    for aviso in avisos:
+        try:
+            cola.put_nowait(aviso)
+        except asyncio.QueueFull:
+            descartados += 1
+    if descartados:
+        # Un cliente que no lee no debe frenar a los demás; pierde avisos, no la conexión
+        logger.warning('Cliente SSE con la cola llena; se descartan %s de %s avisos', descartados, len(avisos))
+
+
+def _paquetes(avisos, limite):
+    """JSON de los avisos repartido en listas de hasta `limite` bytes"""
+    paquete, tamano = [], 2
+    for aviso in avisos:
+        datos = json.dumps(aviso).encode('utf-8')
+        if paquete and tamano + len(datos) + 1 > limite:
+            yield b'[' + b','.join(paquete) + b']'
+            paquete, tamano = [], 2
+        paquete.append(datos)
+        tamano += len(datos) + 1
+    if paquete:
+        yield b'[' + b','.join(paquete) + b']'
+
+
+def _enviar_a_otros_procesos(avisos):
+    with socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM) as emisor:
+        emisor.setblocking(False)
+        # Linux reserva parte del búfer de envío para su contabilidad, de ahí la mitad
+        limite = min(MAX_BYTES_DATAGRAMA, emisor.getsockopt(socket.SOL_SOCKET, socket.SO_SNDBUF) // 2)
+        paquetes = list(_paquetes(avisos, limite))
+        for ruta in _directorio().glob('*.sock'):
+            if str(ruta) == _receptor['ruta']:
+                continue
+            for numero, datos in enumerate(paquetes):
+                try:
+                    emisor.sendto(datos, str(ruta))
+                except (ConnectionRefusedError, FileNotFoundError):
+                    ruta.unlink(missing_ok=True)  # quedó de un proceso que ya terminó
+                    break
+                except OSError as e:
+                    # Un aviso por destino: el resto de los paquetes tampoco entraría
+                    logger.warning(
+                        'No se pudieron enviar %s de %s paquetes de avisos a %s: %s',
+                        len(paquetes) - numero, len(paquetes), ruta, e,
+                    )
+                    break
+
+
+class _Receptor(asyncio.DatagramProtocol):
+    def datagram_received(self, datos, direccion):
+        try:
+            _entregar(json.loads(datos))
+        except ValueError:
+            logger.warning('Aviso de stock ilegible descartado')
+
+
+async def _asegurar_receptor():
+    if not _ENTRE_PROCESOS or _receptor['transporte'] is not None:
+        return
+    ruta = str(_directorio() / f'{os.getpid()}-{uuid.uuid4().hex[:8]}.sock')
+    transporte, _ = await asyncio.get_running_loop().create_datagram_endpoint(
+        _Receptor, local_addr=ruta, family=socket.AF_UNIX,
+    )
+    if _receptor['transporte'] is not None:  # otra conexión lo creó mientras tanto
+        transporte.close()
+        os.unlink(ruta)
+        return
+    _receptor.update(ruta=ruta, transporte=transporte)
+    atexit.register(lambda: Path(ruta).unlink(missing_ok=True))
+
+
+@asynccontextmanager
+async def escuchar():
+    """Cola asyncio que recibe los avisos mientras dure el bloque `async with`"""
+    await _asegurar_receptor()
+    suscriptor = (asyncio.get_running_loop(), asyncio.Queue(maxsize=MAX_PENDIENTES))
+    with _lock:
+        _suscriptores.add(suscriptor)
+    try:
+        yield suscriptor[1]
+    finally:
+        with _lock:
+            _suscriptores.discard(suscriptor)
@@ -0,0 +1,318 @@
+"""Benchmark repetible de las vistas más usadas con el cliente de pruebas de Django.
+
+Cada escenario se pide varias veces (después de unas peticiones de calentamiento)
+y se informa la latencia p50/p95, las consultas SQL de una petición y el pico de
+memoria que reserva Python durante una petición (medido aparte con `tracemalloc`,
+que hace más lentas las peticiones). El resultado es un dict serializable a JSON
+para comparar entre commits con `comparar`.
+
+`concurrencia` mide otra cosa: cuántas peticiones por segundo atiende un solo
+worker cuando muchos clientes piden a la vez, servido con WSGI (un pool de hilos,
+como gunicorn con `--threads`) y con ASGI (un event loop, como uvicorn). Las
+peticiones pasan por los handlers reales de Django, sin red.
+"""
+import asyncio
+import statistics
+import subprocess
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+from datetime import timedelta
+from io import BytesIO
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.handlers.asgi import ASGIHandler
+from django.core.handlers.wsgi import WSGIHandler
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+from .models import DetallesVenta, Empleados, Productos, Ventas
+
+# Cuánto puede empeorar el p95 antes de marcarlo como regresión
+TOLERANCIA_LATENCIA = 1.2
+
+
+def escenarios():
+    """(nombre, vista, parámetros GET); las fechas se calculan al momento de medir"""
+    hoy = timezone.localdate()
+    return [
+        ('inicio', 'inicio', None),
+        ('userlist', 'userlist', None),
+        ('datos_usuarios', 'datos_usuarios', {'length': 25, 'order[0][column]': '1', 'columns[1][data]': 'nombre'}),
+        ('datos_usuarios:busqueda', 'datos_usuarios', {'length': 25, 'search[value]': 'garcía'}),
+        ('user', 'user', None),
+        ('lista_productos', 'lista_productos', None),
+        ('dashboard_stock', 'dashboard_stock', None),
+        ('buscar_productos', 'buscar_productos', {'q': 'cam'}),
+        ('buscar_productos:dos_palabras', 'buscar_productos', {'q': 'pelota azul'}),
+        ('lista_cajas', 'lista_cajas', None),
+        ('lista_ventas', 'lista_ventas', None),
+        ('datos_ventas', 'datos_ventas', {'length': 25}),
+        ('datos_ventas:busqueda', 'datos_ventas', {'length': 25, 'search[value]': 'Ana'}),
+        ('datos_ventas:rango', 'datos_ventas', {
+            'length': 25, 'desde': (hoy - timedelta(days=30)).isoformat(), 'hasta': hoy.isoformat(),
+        }),
+        ('reporte_resumen', 'reporte_resumen', None),
+        ('reporte_resumen:trimestre', 'reporte_resumen', {
+            'periodo': 'semana', 'desde': (hoy - timedelta(days=90)).isoformat(), 'hasta': hoy.isoformat(),
+        }),
+    ]
+
+
+def _pedir(cliente, url, datos):
+    respuesta = cliente.get(url, datos)
+    if respuesta.streaming:
+        b''.join(respuesta.streaming_content)
+    return respuesta
+
+
+def _percentil(valores, p):
+    ordenados = sorted(valores)
+    return ordenados[min(len(ordenados) - 1, round(p / 100 * (len(ordenados) - 1)))]
+
+
+def medir(cliente, url, datos=None, repeticiones=20, calentamiento=2):
+    for _ in range(calentamiento):
+        _pedir(cliente, url, datos)
+
+    tiempos = []
+    for _ in range(repeticiones):
+        inicio = time.perf_counter()
+        respuesta = _pedir(cliente, url, datos)
+        tiempos.append((time.perf_counter() - inicio) * 1000)
+
+    # Se cuentan con un execute_wrapper: con DEBUG=True, queries_log ya puede estar
+    # lleno (deque acotada) y CaptureQueriesContext contaría cero
+    consultas = []
+    with connection.execute_wrapper(lambda execute, sql, *args: consultas.append(sql) or execute(sql, *args)):
+        _pedir(cliente, url, datos)
+    tracemalloc.start()
+    try:
+        _pedir(cliente, url, datos)
+        _, pico = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return {
+        'estado': respuesta.status_code,
+        'p50_ms': round(statistics.median(tiempos), 2),
+        'p95_ms': round(_percentil(tiempos, 95), 2),
+        'media_ms': round(statistics.fmean(tiempos), 2),
+        'consultas': len(consultas),
+        'memoria_pico_kb': round(pico / 1024, 1),
+    }
+
+
+def _commit():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, timeout=5,
+        ).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        return None
+
+
+def ejecutar(usuario, repeticiones=20, calentamiento=2, solo=None, salida=None):
+    """Mide todos los escenarios (o los de `solo`) con la sesión de `usuario`"""
+    cliente = Client()
+    cliente.force_login(usuario)
+    resultados = {}
+    for nombre, vista, datos in escenarios():
+        if solo and nombre not in solo and nombre.split(':')[0] not in solo:
+            continue
+        resultados[nombre] = medir(cliente, reverse(vista), datos, repeticiones, calentamiento)
+        if salida:
+            salida(f'{nombre}: p50 {resultados[nombre]["p50_ms"]} ms, p95 {resultados[nombre]["p95_ms"]} ms, '
+                   f'{resultados[nombre]["consultas"]} consultas')
+    return {
+        'commit': _commit(),
+        'fecha': timezone.now().isoformat(),
+        'base': connection.vendor,
+        'filas': {
+            'productos': Productos.objects.count(),
+            'empleados': Empleados.objects.count(),
+            'ventas': Ventas.objects.count(),
+            'detalles_venta': DetallesVenta.objects.count(),
+        },
+        'repeticiones': repeticiones,
+        'escenarios': resultados,
+    }
+
+
+def comparar(anterior, actual):
+    """Líneas de texto con las diferencias por escenario; las regresiones empiezan con '!'"""
+    lineas = []
+    for nombre, medicion in actual['escenarios'].items():
+        previa = anterior.get('escenarios', {}).get(nombre)
+        if previa is None:
+            continue
+        regresion = (
+            medicion['p95_ms'] > previa['p95_ms'] * TOLERANCIA_LATENCIA
+            or medicion['consultas'] > previa['consultas']
+        )
+        lineas.append(
+            f'{"!" if regresion else " "} {nombre}: p95 {previa["p95_ms"]} -> {medicion["p95_ms"]} ms, '
+            f'consultas {previa["consultas"]} -> {medicion["consultas"]}, '
+            f'memoria {previa["memoria_pico_kb"]} -> {medicion["memoria_pico_kb"]} KB'
+        )
+    return lineas
+
+
+# ===== CONCURRENCIA: WSGI CONTRA ASGI =====
+
+VISTAS_CONCURRENCIA = ['lista_productos', 'dashboard_stock', 'lista_cajas', 'lista_ventas', 'datos_ventas']
+
+
+@contextmanager
+def latencia_sql(milisegundos):
+    """Agrega una espera a cada consulta, como la red hasta un MySQL en otro servidor"""
+    def esperar(execute, sql, params, many, context):
+        time.sleep(milisegundos / 1000)
+        return execute(sql, params, many, context)
+
+    def instalar(sender, connection, **kwargs):
+        connection.execute_wrappers.append(esperar)
+
+    if not milisegundos:
+        yield
+        return
+    connection_created.connect(instalar, weak=False)
+    try:
+        yield
+    finally:
+        connection_created.disconnect(instalar)
+        # Las conexiones de los hilos del benchmark se cierran por petición; se limpia la de este hilo
+        for conexion in connections.all(initialized_only=True):
+            if esperar in conexion.execute_wrappers:
+                conexion.execute_wrappers.remove(esperar)
+
+
+def _medicion(tiempos, errores, segundos):
+    return {
+        'peticiones': len(tiempos),
+        'errores': errores,
+        'por_segundo': round(len(tiempos) / segundos, 1),
+        'p50_ms': round(statistics.median(tiempos), 2),
+        'p95_ms': round(_percentil(tiempos, 95), 2),
+    }
+
+
+def _wsgi(path, cookie, clientes, peticiones, hilos):
+    """`clientes` hilos piden a la vez, pero solo `hilos` peticiones se atienden al mismo tiempo"""
+    handler = WSGIHandler()
+    worker = threading.Semaphore(hilos)
+    pendientes = iter(range(peticiones))
+    lock = threading.Lock()
+    tiempos, errores = [], []
+
+    def cliente():
+        while True:
+            with lock:
+                if next(pendientes, None) is None:
+                    return
+            entorno = {'PATH_INFO': path, 'HTTP_COOKIE': cookie, 'HTTP_HOST': 'localhost', 'wsgi.input': BytesIO()}
+            setup_testing_defaults(entorno)
+            estado = []
+            inicio = time.perf_counter()
+            with worker:
+                cuerpo = handler(entorno, lambda status, headers, exc_info=None: estado.append(status))
+                try:
+                    b''.join(cuerpo)
+                finally:
+                    cuerpo.close()
+            with lock:
+                tiempos.append((time.perf_counter() - inicio) * 1000)
+                if not estado[0].startswith('200'):
+                    errores.append(estado[0])
+
+    inicio = time.perf_counter()
+    hilos_clientes = [threading.Thread(target=cliente) for _ in range(clientes)]
+    for hilo in hilos_clientes:
+        hilo.start()
+    for hilo in hilos_clientes:
+        hilo.join()
+    return _medicion(tiempos, len(errores), time.perf_counter() - inicio)
+
+
+async def _asgi(path, cookie, clientes, peticiones):
+    """`clientes` corrutinas piden a la vez a un solo event loop"""
+    handler = ASGIHandler()
+    pendientes = iter(range(peticiones))
+    tiempos, errores = [], []
+    scope = {
+        'type': 'http', 'asgi': {'version': '3.0'}, 'http_version': '1.1', 'method': 'GET', 'scheme': 'http',
+        'path': path, 'raw_path': path.encode(), 'root_path': '', 'query_string': b'',
+        'headers': [(b'host', b'localhost'), (b'cookie', cookie.encode())],
+        'client': ('127.0.0.1', 0), 'server': ('localhost', 80),
+    }
+
+    async def pedir():
+        recibido = asyncio.Event()
+        estado = []
+
+        async def receive():
+            if recibido.is_set():
+                # Django escucha la desconexión del cliente hasta terminar la respuesta
+                await asyncio.Event().wait()
+            recibido.set()
+            return {'type': 'http.request', 'body': b'', 'more_body': False}
+
+        async def send(mensaje):
+            if mensaje['type'] == 'http.response.start':
+                estado.append(mensaje['status'])
+
+        await handler(dict(scope), receive, send)
+        return estado[0]
+
+    async def cliente():
+        while next(pendientes, None) is not None:
+            inicio = time.perf_counter()
+            estado = await pedir()
+            tiempos.append((time.perf_counter() - inicio) * 1000)
+            if estado != 200:
+                errores.append(estado)
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(clientes)))
+    return _medicion(tiempos, len(errores), time.perf_counter() - inicio)
+
+
+def concurrencia(usuario, vistas=None, clientes=50, peticiones=500, hilos=4, latencia_ms=0, salida=None):
+    """Peticiones por segundo y latencia de cada vista con WSGI (`hilos` hilos) y con ASGI.
+
+    Con la base en la misma máquina casi no hay espera de E/S y los dos rinden
+    parecido; `latencia_ms` simula la red hasta la base para ver la diferencia.
+    """
+    cliente = Client()
+    cliente.force_login(usuario)
+    cookie = f'{settings.SESSION_COOKIE_NAME}={cliente.cookies[settings.SESSION_COOKIE_NAME].value}'
+    resultados = {}
+    with latencia_sql(latencia_ms):
+        for vista in vistas or VISTAS_CONCURRENCIA:
+            path = reverse(vista)
+            # Calentamiento: plantillas compiladas y cachés llenas para los dos
+            _wsgi(path, cookie, 1, 2, 1)
+            wsgi = _wsgi(path, cookie, clientes, peticiones, hilos)
+            asgi = asyncio.run(_asgi(path, cookie, clientes, peticiones))
+            resultados[vista] = {
+                'wsgi': wsgi,
+                'asgi': asgi,
+                'mejora': round(asgi['por_segundo'] / wsgi['por_segundo'], 2) if wsgi['por_segundo'] else None,
+            }
+            if salida:
+                salida(f'{vista}: WSGI {wsgi["por_segundo"]}/s (p95 {wsgi["p95_ms"]} ms), '
+                       f'ASGI {asgi["por_segundo"]}/s (p95 {asgi["p95_ms"]} ms)')
+    return {
+        'commit': _commit(),
+        'fecha': timezone.now().isoformat(),
+        'base': connection.vendor,
+        'clientes': clientes,
+        'peticiones': peticiones,
+        'hilos_wsgi': hilos,
+        'latencia_sql_ms': latencia_ms,
+        'vistas': resultados,
+    }
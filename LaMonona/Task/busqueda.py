@@ -0,0 +1,200 @@
+"""Índice en memoria para buscar productos por nombre y descripción.
+
+Cada proceso arma un índice de prefijos con las palabras normalizadas (minúsculas y
+sin acentos, así "camion" encuentra "camión") y lo reconstruye cuando cambia la
+versión guardada en la caché compartida, igual que `referencias`. Solo se indexan
+textos; precio y stock se leen de la base para los resultados que se devuelven.
+"""
+import heapq
+import re
+import threading
+import unicodedata
+import uuid
+from bisect import bisect_left
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Productos
+
+CLAVE_VERSION = 'busqueda_productos:version'
+LONGITUD_MINIMA = 2
+LIMITE_MAXIMO = 50
+
+_PALABRA = re.compile(r'\w+')
+_FIN_PREFIJO = '\U0010ffff'
+
+
+def normalizar(texto):
+    """Minúsculas y sin marcas diacríticas ("Camión" -> "camion")"""
+    descompuesto = unicodedata.normalize('NFKD', texto or '')
+    return ''.join(c for c in descompuesto if not unicodedata.combining(c)).lower()
+
+
+def palabras(texto):
+    return _PALABRA.findall(normalizar(texto))
+
+
+class Indice:
+    """Índice de prefijos sobre (id_producto, nombre, descripción).
+
+    Los productos se numeran en su orden de ranking base (nombres más cortos
+    primero) y cada lista de coincidencias guarda esos números ordenados, así que
+    una búsqueda recorre las listas en orden y se detiene al juntar `limite`
+    resultados en lugar de ordenar todas las coincidencias. Para los prefijos
+    cortos, que coinciden con muchas palabras, las listas ya vienen combinadas.
+    """
+
+    PREFIJO_PRECALCULADO = 3
+    REVISIONES_DIRECTAS = 2000
+
+    def __init__(self, filas):
+        productos = sorted(
+            ((id_producto, normalizar(nombre), palabras(descripcion)) for id_producto, nombre, descripcion in filas),
+            key=lambda fila: (len(fila[1]), fila[1]),
+        )
+        self.ids = [id_producto for id_producto, _, _ in productos]
+        self.en_nombre = []   # posición -> palabras del nombre
+        self.en_todo = []     # posición -> palabras del nombre y la descripción
+        self.nombres = sorted((nombre, posicion) for posicion, (_, nombre, _) in enumerate(productos))
+        self.tablas = {'nombre': ({}, {}), 'todo': ({}, {})}  # tabla -> (por palabra, por prefijo corto)
+
+        for posicion, (_, nombre, descripcion) in enumerate(productos):
+            del_nombre = tuple(palabras(nombre))
+            de_todo = tuple(set(del_nombre) | set(descripcion))
+            self.en_nombre.append(del_nombre)
+            self.en_todo.append(de_todo)
+            for tabla, lista in (('nombre', del_nombre), ('todo', de_todo)):
+                por_palabra, por_prefijo = self.tablas[tabla]
+                for palabra in set(lista):
+                    por_palabra.setdefault(palabra, []).append(posicion)
+                for prefijo in {palabra[:n] for palabra in lista for n in range(1, self.PREFIJO_PRECALCULADO + 1)}:
+                    por_prefijo.setdefault(prefijo, []).append(posicion)
+
+        self.palabras = {}
+        for tabla, (por_palabra, _) in self.tablas.items():
+            ordenadas = sorted(por_palabra)
+            self.palabras[tabla] = (ordenadas, [por_palabra[palabra] for palabra in ordenadas])
+
+    def _posiciones(self, tabla, termino):
+        """Listas ordenadas de posiciones de las palabras que empiezan con `termino`"""
+        if len(termino) <= self.PREFIJO_PRECALCULADO:
+            posiciones = self.tablas[tabla][1].get(termino)
+            return [posiciones] if posiciones else []
+        ordenadas, listas = self.palabras[tabla]
+        inicio = bisect_left(ordenadas, termino)
+        fin = bisect_left(ordenadas, termino + _FIN_PREFIJO, inicio)
+        return listas[inicio:fin]
+
+    @staticmethod
+    def _coincide(palabras_producto, terminos):
+        return all(any(palabra.startswith(termino) for palabra in palabras_producto) for termino in terminos)
+
+    def _recorrer(self, tabla, terminos, elegidas, limite):
+        """Agrega a `elegidas` las posiciones donde todos los términos coinciden, en orden de ranking.
+
+        Se recorre la lista más corta verificando los demás términos producto por
+        producto; si las coincidencias son escasas y se agota `REVISIONES_DIRECTAS`,
+        se pasa a intersectar conjuntos, que es más barato en ese caso.
+        """
+        por_termino = [self._posiciones(tabla, termino) for termino in terminos]
+        if not all(por_termino):
+            return
+        palabras_por_posicion = self.en_nombre if tabla == 'nombre' else self.en_todo
+        listas = min(por_termino, key=lambda listas: sum(map(len, listas)))
+        guia = listas[0] if len(listas) == 1 else heapq.merge(*listas)
+
+        ultima = -1
+        for revisadas, posicion in enumerate(guia):
+            if len(elegidas) >= limite:
+                return
+            if revisadas >= self.REVISIONES_DIRECTAS:
+                break
+            ultima = posicion
+            # Un término puede ser prefijo de otro ("cam camion"), así que se verifican todos juntos
+            if posicion not in elegidas and self._coincide(palabras_por_posicion[posicion], terminos):
+                elegidas[posicion] = None
+        else:
+            return
+
+        conjuntos = sorted((set().union(*listas) for listas in por_termino), key=len)
+        for posicion in sorted(conjuntos[0].intersection(*conjuntos[1:])):
+            if len(elegidas) >= limite:
+                return
+            if posicion > ultima and posicion not in elegidas and self._coincide(palabras_por_posicion[posicion], terminos):
+                elegidas[posicion] = None
+
+    def buscar(self, texto, limite=10):
+        """Ids de los productos cuyas palabras empiezan con cada término de `texto`, mejor rankeados primero.
+
+        Primero los nombres que empiezan con la consulta completa, luego los que tienen
+        todos los términos en el nombre y al final los que los completan con la descripción.
+        """
+        consulta = ' '.join(palabras(texto))
+        terminos = sorted(set(consulta.split()), key=len, reverse=True)
+        if len(consulta) < LONGITUD_MINIMA or not terminos:
+            return []
+
+        inicio = bisect_left(self.nombres, (consulta,))
+        fin = bisect_left(self.nombres, (consulta + _FIN_PREFIJO,), inicio)
+        elegidas = dict.fromkeys(heapq.nsmallest(limite, (posicion for _, posicion in self.nombres[inicio:fin])))
+        self._recorrer('nombre', terminos, elegidas, limite)
+        self._recorrer('todo', terminos, elegidas, limite)
+        return [self.ids[posicion] for posicion in elegidas]
+
+
+_lock = threading.Lock()
+_actual = {'version': None, 'indice': None}
+
+
+def invalidar():
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+def indice():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, uuid.uuid4().hex, None)
+        version = cache.get(CLAVE_VERSION)
+    if version == _actual['version']:
+        return _actual['indice']
+
+    # Mientras un hilo reconstruye, los demás siguen usando el índice anterior si ya hay uno
+    if not _lock.acquire(blocking=_actual['indice'] is None):
+        return _actual['indice']
+    try:
+        if version != _actual['version']:
+            filas = Productos.objects.values_list('id_producto', 'nombre_producto', 'descripcion').iterator(chunk_size=5000)
+            _actual.update(version=version, indice=Indice(filas))
+    finally:
+        _lock.release()
+    return _actual['indice']
+
+
+def buscar_productos(texto, limite=10):
+    """Productos que coinciden con `texto`, rankeados, con precio y stock actuales"""
+    limite = max(1, min(limite, LIMITE_MAXIMO))
+    ids = indice().buscar(texto, limite)
+    if not ids:
+        return []
+    datos = {
+        fila['id_producto']: fila
+        for fila in Productos.objects.filter(id_producto__in=ids).values(
+            'id_producto', 'nombre_producto', 'descripcion', 'precio', 'stock'
+        )
+    }
+    # Un producto borrado entre la búsqueda y esta consulta simplemente no aparece
+    return [datos[id_producto] for id_producto in ids if id_producto in datos]
+
+
+@receiver(post_save, sender=Productos)
+def _al_guardar(sender, update_fields=None, **kwargs):
+    # Los cambios de precio o stock no tocan el índice
+    if update_fields is None or {'nombre_producto', 'descripcion'} & set(update_fields):
+        transaction.on_commit(invalidar)
+
+
+@receiver(post_delete, sender=Productos)
+def _al_borrar(sender, **kwargs):
+    transaction.on_commit(invalidar)
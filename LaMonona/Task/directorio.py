@@ -0,0 +1,103 @@
+"""Directorio de empleados para la lista de usuarios (DataTables en modo serverSide).
+
+Cada página es una consulta de empleados con su usuario (`select_related`) y otra
+que trae los grupos de todos los usuarios de la página; el conteo se hace con
+COUNT(*) porque la tabla es chica y DataTables lo usa para numerar las páginas.
+Las páginas se guardan en la caché etiquetada hasta que cambian los empleados, los
+usuarios o sus grupos.
+"""
+import hashlib
+
+from django.db.models import Prefetch, Q
+from . import etiquetas
+from .models import AuthUserGroups, Empleados
+
+TAMANO_PAGINA_MAXIMO = 100
+# Columna de DataTables -> campo por el que se ordena
+COLUMNAS_ORDEN = {
+    'id_empleado': 'id_empleado',
+    'username': 'id_user__username',
+    'nombre': 'nombre',
+    'apellido': 'apellido',
+    'edad': 'edad',
+    'telefono': 'telefono',
+    'correo': 'correo',
+    'direccion': 'direccion',
+    'activo': 'id_user__is_active',
+}
+CAMPOS_BUSQUEDA = ['nombre', 'apellido', 'correo', 'telefono', 'id_user__username']
+TABLAS = ['empleados', 'auth_user', 'auth_user_groups', 'auth_group']
+# DataTables los cambia en cada pedido y no afectan la página
+PARAMETROS_IGNORADOS = {'draw', '_'}
+
+
+def empleados_con_rol():
+    """Empleados con su usuario y sus grupos (`empleado.id_user.grupos`) ya cargados"""
+    return Empleados.objects.select_related('id_user').prefetch_related(
+        Prefetch(
+            'id_user__authusergroups_set',
+            queryset=AuthUserGroups.objects.select_related('group').order_by('group__name'),
+            to_attr='grupos',
+        )
+    )
+
+
+def buscar(queryset, texto):
+    """Cada palabra de `texto` debe aparecer en el nombre, apellido, correo, teléfono o usuario"""
+    for palabra in (texto or '').split():
+        condicion = Q()
+        for campo in CAMPOS_BUSQUEDA:
+            condicion |= Q(**{f'{campo}__icontains': palabra})
+        queryset = queryset.filter(condicion)
+    return queryset
+
+
+def orden(params):
+    """Campos de `order_by` a partir de los parámetros `order[i][column]`/`columns[j][data]` de DataTables"""
+    campos = []
+    i = 0
+    while (columna := params.get(f'order[{i}][column]')) is not None:
+        campo = COLUMNAS_ORDEN.get(params.get(f'columns[{columna}][data]', ''))
+        if campo:
+            campos.append(f'-{campo}' if params.get(f'order[{i}][dir]') == 'desc' else campo)
+        i += 1
+    # id_empleado al final para que el orden entre páginas sea estable
+    return [*campos, 'id_empleado']
+
+
+def pagina(params):
+    """Página del directorio en el formato que espera DataTables (sin `draw`)"""
+    try:
+        tamano = min(max(int(params.get('length', 25)), 1), TAMANO_PAGINA_MAXIMO)
+        inicio = max(int(params.get('start', 0)), 0)
+    except ValueError:
+        tamano, inicio = 25, 0
+
+    todos = Empleados.objects.all()
+    filtrados = buscar(todos, params.get('search[value]'))
+    total = todos.count()
+    total_filtrados = filtrados.count() if filtrados.query.where else total
+
+    empleados = buscar(empleados_con_rol(), params.get('search[value]')).order_by(*orden(params))
+    data = [{
+        'id_empleado': empleado.id_empleado,
+        'id_user': empleado.id_user.id,
+        'username': empleado.id_user.username,
+        'nombre': empleado.nombre,
+        'apellido': empleado.apellido,
+        'edad': empleado.edad,
+        'telefono': empleado.telefono,
+        'correo': empleado.correo,
+        'direccion': empleado.direccion,
+        'activo': bool(empleado.id_user.is_active),
+        'rol': empleado.id_user.grupos[0].group.name if empleado.id_user.grupos else None,
+    } for empleado in empleados[inicio:inicio + tamano]]
+
+    return {'recordsTotal': total, 'recordsFiltered': total_filtrados, 'data': data}
+
+
+def pagina_cacheada(params):
+    """`pagina` desde la caché etiquetada"""
+    params = {clave: valor for clave, valor in params.items() if clave not in PARAMETROS_IGNORADOS}
+    clave = hashlib.sha1(repr(sorted(params.items())).encode()).hexdigest()
+    return etiquetas.obtener(f'directorio:{clave}', lambda: pagina(params), TABLAS)
@@ -0,0 +1,240 @@
+"""Caché con etiquetas que se invalidan solas al escribir en la base.
+
+Cada entrada guarda, junto al valor, la versión de sus etiquetas al momento de
+calcularlo; al leerla se comparan con las versiones vigentes (una sola
+`get_many`) y si alguna cambió se recalcula. Invalidar una etiqueta es cambiar su
+versión, sin buscar las entradas que la usan.
+
+Hay dos clases de etiquetas:
+
+- De tabla (`'productos'`, `'ventas'`, `'turnos_caja'`...): cambian con cualquier
+  INSERT, UPDATE o DELETE confirmado sobre la tabla. Se detectan con un
+  `execute_wrapper` en cada conexión, así que también cubren `update()`,
+  `bulk_create` y el SQL a mano, que no disparan señales.
+- De instancia (`'sucursal:3'`, `'caja:7'`, `'turno:42'`, `'producto:15'`): las
+  cambian `post_save`/`post_delete` de los modelos de `ETIQUETAS_INSTANCIA`
+  (con el valor anterior y el nuevo de cada clave foránea). Quien escriba esos
+  modelos en bloque debe llamar a `invalidar_al_confirmar` con las etiquetas.
+
+Las versiones viven en la caché `default` (archivos en el servidor, o la caché
+compartida que se configure), así que todos los procesos ven las invalidaciones.
+Los valores se calculan leyendo del primario, nunca de la réplica de reportes,
+para no guardar datos atrasados con versiones nuevas.
+"""
+import functools
+import hashlib
+import re
+import uuid
+
+from django.apps import apps
+from django.core.cache import cache
+from django.db import transaction
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+from django.http import HttpResponse
+from .models import (
+    Cajas, DetallesVenta, FotoStock, Gastos, MovimientoStock, Productos, PronosticoProducto, Sucursales, TurnosCaja,
+    Ventas,
+)
+from .replicas import lectura_del_primario
+
+DURACION = 60 * 60
+# Tablas que cambian en cada petición y que ninguna entrada usa
+SIN_ETIQUETA = {'django_session', 'django_admin_log', 'django_migrations'}
+
+# Modelo -> [(prefijo, campo)]: una instancia guardada o borrada invalida '<prefijo>:<valor del campo>'
+ETIQUETAS_INSTANCIA = {
+    Sucursales: [('sucursal', 'id_sucursal')],
+    Cajas: [('caja', 'id_caja'), ('sucursal', 'id_sucursal_id')],
+    TurnosCaja: [('turno', 'id_turno'), ('caja', 'id_caja_id')],
+    Ventas: [('turno', 'id_turno_id')],
+    Gastos: [('turno', 'id_turno_id')],
+    DetallesVenta: [('producto', 'id_producto_id')],
+    Productos: [('producto', 'id_producto')],
+    MovimientoStock: [('producto', 'id_producto_id')],
+    FotoStock: [('producto', 'id_producto_id')],
+    PronosticoProducto: [('producto', 'id_producto_id')],
+}
+
+_ESCRITURA = re.compile(
+    r'\s*(?:INSERT\s+(?:IGNORE\s+)?INTO|REPLACE\s+INTO|UPDATE|DELETE\s+FROM)\s+[`"]?(\w+)', re.IGNORECASE,
+)
+
+
+def _clave_etiqueta(etiqueta):
+    return f'etiqueta:{etiqueta}'
+
+
+def invalidar(*etiquetas):
+    cache.set_many({_clave_etiqueta(etiqueta): uuid.uuid4().hex for etiqueta in etiquetas}, None)
+
+
+def invalidar_al_confirmar(*etiquetas, using=None):
+    """Para usar después de escrituras que no disparan señales (update, bulk_create)"""
+    if etiquetas:
+        transaction.on_commit(lambda: invalidar(*etiquetas), using=using)
+
+
+def _versiones(etiquetas):
+    claves = [_clave_etiqueta(etiqueta) for etiqueta in etiquetas]
+    versiones = cache.get_many(claves)
+    for clave in claves:
+        if clave not in versiones:
+            cache.add(clave, uuid.uuid4().hex, None)
+            versiones[clave] = cache.get(clave)
+    return tuple(versiones[clave] for clave in claves)
+
+
+def obtener(clave, calcular, etiquetas, duracion=DURACION):
+    """Valor de `clave`, recalculado con `calcular()` si no está o cambió alguna etiqueta.
+
+    Un resultado None no se guarda (p. ej. "no existe", que puede dejar de ser cierto
+    por una escritura en bloque que no invalida etiquetas de instancia).
+    """
+    etiquetas = sorted(set(etiquetas))
+    clave = f'etiquetado:{clave}'
+    versiones = _versiones(etiquetas)
+    guardado = cache.get(clave)
+    if guardado is not None and guardado[0] == versiones:
+        return guardado[1]
+    # Las versiones se leyeron antes de calcular: si algo cambia mientras tanto, la
+    # entrada queda vieja y la próxima lectura la recalcula
+    with lectura_del_primario():
+        valor = calcular()
+    if valor is not None:
+        cache.set(clave, (versiones, valor), duracion)
+    return valor
+
+
+def cacheado(etiquetas, duracion=DURACION):
+    """Decorador de funciones que devuelven datos (no querysets perezosos).
+
+    `etiquetas` es una lista o una función que recibe los mismos argumentos que la
+    decorada, p. ej. `lambda id_turno: [f'turno:{id_turno}']`. La clave sale del
+    nombre de la función y de sus argumentos.
+    """
+    def decorador(funcion):
+        @functools.wraps(funcion)
+        def envoltura(*args, **kwargs):
+            lista = etiquetas(*args, **kwargs) if callable(etiquetas) else etiquetas
+            firma = hashlib.sha1(repr((args, sorted(kwargs.items()))).encode()).hexdigest()
+            return obtener(
+                f'{funcion.__module__}.{funcion.__qualname__}:{firma}',
+                lambda: funcion(*args, **kwargs), lista, duracion,
+            )
+        return envoltura
+    return decorador
+
+
+def consulta(queryset, etiquetas=(), duracion=DURACION):
+    """`list(queryset)` guardado con las etiquetas de las tablas que lee (y las adicionales)"""
+    sql, params = queryset.query.sql_with_params()
+    tablas = [tabla for tabla in tablas_conocidas() if re.search(rf'[`"]{tabla}[`"]', sql)]
+    clave = hashlib.sha1(f'{sql}|{params!r}'.encode()).hexdigest()
+    return obtener(f'consulta:{clave}', lambda: list(queryset), [*tablas, *etiquetas], duracion)
+
+
+def cache_vista(etiquetas, duracion=DURACION, por_usuario=False):
+    """Decorador de vistas JSON (GET) cuya respuesta solo depende de la URL (y del usuario con `por_usuario`).
+
+    No usar con HTML: las páginas llevan el token CSRF de cada sesión. Solo se
+    guardan las respuestas 200 que no son streaming.
+    """
+    def decorador(vista):
+        @functools.wraps(vista)
+        def envoltura(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return vista(request, *args, **kwargs)
+            lista = etiquetas(request, *args, **kwargs) if callable(etiquetas) else etiquetas
+            clave = f'vista:{request.get_full_path()}'
+            if por_usuario:
+                clave += f'|{request.user.pk}'
+            respuestas = {}
+
+            def calcular():
+                respuesta = vista(request, *args, **kwargs)
+                respuestas['actual'] = respuesta
+                if respuesta.status_code != 200 or respuesta.streaming:
+                    return None
+                return respuesta['Content-Type'], respuesta.content
+
+            guardada = obtener(clave, calcular, lista, duracion)
+            if 'actual' in respuestas:
+                return respuestas['actual']
+            tipo, contenido = guardada
+            return HttpResponse(contenido, content_type=tipo)
+        return envoltura
+    return decorador
+
+
+# ===== INVALIDACIÓN =====
+
+@functools.cache
+def tablas_conocidas():
+    return frozenset(modelo._meta.db_table for modelo in apps.get_models(include_auto_created=True)) - SIN_ETIQUETA
+
+
+def _detectar_escritura(execute, sql, params, many, context):
+    resultado = execute(sql, params, many, context)
+    coincidencia = _ESCRITURA.match(sql)
+    if coincidencia and coincidencia.group(1) in tablas_conocidas():
+        conexion = context['connection']
+        if conexion.in_atomic_block or conexion.get_autocommit():
+            invalidar_al_confirmar(coincidencia.group(1), using=conexion.alias)
+        else:
+            # Transacción manual (set_autocommit(False)): on_commit no está disponible
+            invalidar(coincidencia.group(1))
+    return resultado
+
+
+@receiver(connection_created)
+def _instalar(sender, connection, **kwargs):
+    if _detectar_escritura not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_detectar_escritura)
+
+
+def etiquetas_de(modelo, valores):
+    """Etiquetas de instancia para los valores (dict campo -> valor) de una fila"""
+    etiquetas = {
+        f'{prefijo}:{valores[campo]}'
+        for prefijo, campo in ETIQUETAS_INSTANCIA.get(modelo, ())
+        if valores.get(campo) is not None
+    }
+    if modelo is DetallesVenta and valores.get('id_venta_id') is not None:
+        id_turno = Ventas.objects.filter(pk=valores['id_venta_id']).values_list('id_turno_id', flat=True).first()
+        if id_turno is not None:
+            etiquetas.add(f'turno:{id_turno}')
+    return etiquetas
+
+
+def _campos_etiquetados(modelo):
+    campos = [campo for _, campo in ETIQUETAS_INSTANCIA.get(modelo, ())]
+    return campos + ['id_venta_id'] if modelo is DetallesVenta else campos
+
+
+def _valores(instancia, campos):
+    return {campo: getattr(instancia, campo) for campo in campos}
+
+
+@receiver(pre_save)
+def _antes_de_guardar(sender, instance, raw=False, **kwargs):
+    # Si cambia una clave foránea (p. ej. la venta pasa a otro turno) también hay que
+    # invalidar la etiqueta del valor anterior, que solo está en la base
+    campos = _campos_etiquetados(sender)
+    claves_foraneas = [campo for campo in campos if campo != sender._meta.pk.attname]
+    if raw or not claves_foraneas or instance._state.adding or instance.pk is None:
+        return
+    anterior = sender._base_manager.using(instance._state.db).filter(pk=instance.pk).values(*claves_foraneas).first()
+    if anterior and anterior != _valores(instance, claves_foraneas):
+        instance._etiquetas_anteriores = etiquetas_de(sender, anterior)
+
+
+@receiver(post_save)
+@receiver(post_delete)
+def _al_cambiar(sender, instance, using, **kwargs):
+    if sender not in ETIQUETAS_INSTANCIA:
+        return
+    etiquetas = etiquetas_de(sender, _valores(instance, _campos_etiquetados(sender)))
+    etiquetas |= instance.__dict__.pop('_etiquetas_anteriores', set())
+    invalidar_al_confirmar(*etiquetas, using=using)
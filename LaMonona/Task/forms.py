@@ -89,9 +89,12 @@ class EditarEmpleadoForm(forms.ModelForm):
             self.fields['apellido'].initial = self.instance.id_user.last_name
             self.fields['correo'].initial = self.instance.id_user.email
             self.fields['is_active'].initial = self.instance.id_user.is_active
-            user_group = AuthUserGroups.objects.filter(user=self.instance.id_user).first()
-            if user_group:
-                self.fields['rol'].initial = user_group.group.name
+            # `directorio.empleados_con_rol` ya trae los grupos; si no, se consultan
+            grupos = getattr(self.instance.id_user, 'grupos', None)
+            if grupos is None:
+                grupos = AuthUserGroups.objects.filter(user=self.instance.id_user).select_related('group')[:1]
+            if grupos:
+                self.fields['rol'].initial = grupos[0].group.name
 
     def clean_correo(self):
         correo = self.cleaned_data['correo']
@@ -181,6 +184,10 @@ class CambiarContraseñaForm(forms.Form):
 
 
 class ProductoForm(forms.ModelForm):
+    # Stock que se mostró al abrir el formulario: al guardar se aplica la diferencia
+    # como movimiento, sin pisar las ventas que ocurrieron mientras tanto
+    stock_anterior = forms.IntegerField(required=False, widget=forms.HiddenInput())
+
     class Meta:
         model = Productos
         fields = ['nombre_producto', 'descripcion', 'precio', 'stock', 'stock_minimo']
@@ -204,9 +211,12 @@ class ProductoForm(forms.ModelForm):
     
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            self.fields['stock_anterior'].initial = self.instance.stock
         self.helper = FormHelper()
         self.helper.form_method = 'post'
         self.helper.layout = Layout(
+            Field('stock_anterior'),
             Row(
                 Column(Field('nombre_producto', css_class='form-control'), css_class='col-md-8'),
                 Column(Field('precio', css_class='form-control'), css_class='col-md-4'),
@@ -220,3 +230,10 @@ class ProductoForm(forms.ModelForm):
                 Submit('submit', '💾 Guardar Producto', css_class='btn btn-primary'),
             )
         )
+
+    def diferencia_stock(self):
+        """Cuánto cambió el usuario el stock respecto al que se le mostró"""
+        anterior = self.cleaned_data.get('stock_anterior')
+        if anterior is None:
+            anterior = self.initial.get('stock') or 0
+        return self.cleaned_data['stock'] - anterior
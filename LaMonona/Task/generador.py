@@ -0,0 +1,219 @@
+"""Datos sintéticos a escala de producción para medir las vistas.
+
+Con la misma semilla, los mismos parámetros (incluida la fecha final `hasta`) y una
+base vacía se generan siempre los mismos datos. Todo se inserta con `bulk_create`
+en lotes y con ids asignados acá (a partir del máximo de cada tabla), así los
+detalles pueden apuntar a sus ventas sin releerlas, también en MySQL. Por eso debe
+correrse sin otros procesos escribiendo en la base, y sobre una base con datos los
+ids (y por lo tanto los datos) cambian. Al final se recalculan los resúmenes de
+ventas del período generado.
+"""
+import random
+import time
+from bisect import bisect_left
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db.models import Max
+from django.utils import timezone
+from . import busqueda, referencias
+from .models import (
+    AuthGroup, AuthUser, AuthUserGroups, Cajas, DetallesVenta, Empleados, Gastos, Productos, Sucursales,
+    TurnosCaja, Ventas,
+)
+from VentasApp.resumenes import reconstruir
+
+TAMANO_LOTE = 5000
+# Fecha final por defecto: fija, para que una misma corrida dé siempre las mismas fechas
+HASTA = date(2025, 12, 31)
+CONTRASENA = 'lamonona'  # la misma para todos los empleados generados (se hashea una sola vez)
+
+_BARRIOS = ['Centro', 'Norte', 'Sur', 'Este', 'Oeste', 'Puerto', 'Parque', 'Estación', 'Mercado', 'Plaza']
+_NOMBRES = ['Ana', 'Luis', 'María', 'José', 'Lucía', 'Carlos', 'Sofía', 'Jorge', 'Valeria', 'Diego', 'Camila', 'Pablo']
+_APELLIDOS = ['García', 'Pérez', 'López', 'Gómez', 'Díaz', 'Martínez', 'Rodríguez', 'Sánchez', 'Romero', 'Torres']
+_ARTICULOS = ['Camión', 'Muñeca', 'Pelota', 'Rompecabezas', 'Peluche', 'Cuaderno', 'Lápiz', 'Mochila', 'Taza', 'Globo']
+_VARIANTES = ['rojo', 'azul', 'verde', 'grande', 'mini', 'clásico', 'deluxe', 'de madera', 'musical', 'infantil']
+_CONCEPTOS = ['Limpieza', 'Cambio', 'Fletes', 'Papelería', 'Mantenimiento', 'Viáticos']
+
+
+class Escala:
+    """Cantidades a generar; `lineas_venta` es el total aproximado de detalles"""
+
+    def __init__(self, sucursales=5, cajas_por_sucursal=3, empleados_por_sucursal=6, productos=2000,
+                 lineas_venta=100_000, lineas_por_venta=3, dias=90, gastos_por_turno=1):
+        self.sucursales = sucursales
+        self.cajas_por_sucursal = cajas_por_sucursal
+        self.empleados_por_sucursal = empleados_por_sucursal
+        self.productos = productos
+        self.lineas_venta = lineas_venta
+        self.lineas_por_venta = lineas_por_venta
+        self.dias = dias
+        self.gastos_por_turno = gastos_por_turno
+
+
+def _siguiente_id(modelo):
+    return (modelo.objects.aggregate(maximo=Max(modelo._meta.pk.attname))['maximo'] or 0) + 1
+
+
+def _insertar(modelo, objetos):
+    for inicio in range(0, len(objetos), TAMANO_LOTE):
+        modelo.objects.bulk_create(objetos[inicio:inicio + TAMANO_LOTE])
+
+
+class Generador:
+    def __init__(self, escala, semilla=42, salida=None, hasta=HASTA):
+        self.escala = escala
+        self.azar = random.Random(semilla)
+        self.salida = salida or (lambda mensaje: None)
+        self.hasta = hasta
+        self.desde = self.hasta - timedelta(days=escala.dias - 1)
+
+    def _informar(self, texto, inicio):
+        self.salida(f'{texto} en {time.perf_counter() - inicio:.1f} s')
+
+    def crear_sucursales(self):
+        inicio = time.perf_counter()
+        id_sucursal, id_caja = _siguiente_id(Sucursales), _siguiente_id(Cajas)
+        self.sucursales = [
+            Sucursales(id_sucursal=id_sucursal + i, nombre_sucursal=f'{_BARRIOS[i % len(_BARRIOS)]} {i + 1}',
+                       direccion=f'Calle {self.azar.randint(1, 200)} #{self.azar.randint(1, 999)}')
+            for i in range(self.escala.sucursales)
+        ]
+        self.cajas = [
+            Cajas(id_caja=id_caja + i * self.escala.cajas_por_sucursal + j, id_sucursal=sucursal,
+                  ubicacion=f'Caja {j + 1}', estado='Cerrada')
+            for i, sucursal in enumerate(self.sucursales)
+            for j in range(self.escala.cajas_por_sucursal)
+        ]
+        _insertar(Sucursales, self.sucursales)
+        _insertar(Cajas, self.cajas)
+        self._informar(f'{len(self.sucursales)} sucursales y {len(self.cajas)} cajas', inicio)
+
+    def crear_empleados(self):
+        inicio = time.perf_counter()
+        contrasena = make_password(CONTRASENA)
+        grupo, _ = AuthGroup.objects.get_or_create(name='vendedor')
+        id_user, id_empleado = _siguiente_id(AuthUser), _siguiente_id(Empleados)
+        # Dados de alta el primer día del período, no al correr el comando
+        alta = timezone.make_aware(datetime.combine(self.desde, datetime.min.time()))
+        usuarios, empleados = [], []
+        self.empleados_por_sucursal = {}
+        for sucursal in self.sucursales:
+            for _ in range(self.escala.empleados_por_sucursal):
+                n = len(usuarios)
+                nombre, apellido = self.azar.choice(_NOMBRES), self.azar.choice(_APELLIDOS)
+                usuario = AuthUser(
+                    id=id_user + n, username=f'gen{id_user + n}', password=contrasena, first_name=nombre,
+                    last_name=apellido, email=f'gen{id_user + n}@lamonona.test', is_superuser=False,
+                    is_staff=False, is_active=True, date_joined=alta,
+                )
+                empleado = Empleados(
+                    id_empleado=id_empleado + n, id_user=usuario, nombre=nombre, apellido=apellido,
+                    correo=usuario.email, edad=self.azar.randint(18, 65),
+                    telefono=f'55{self.azar.randint(10_000_000, 99_999_999)}',
+                )
+                usuarios.append(usuario)
+                empleados.append(empleado)
+                self.empleados_por_sucursal.setdefault(sucursal.id_sucursal, []).append(empleado.id_empleado)
+        _insertar(AuthUser, usuarios)
+        _insertar(Empleados, empleados)
+        _insertar(AuthUserGroups, [AuthUserGroups(user=usuario, group=grupo) for usuario in usuarios])
+        self._informar(f'{len(empleados)} empleados', inicio)
+
+    def crear_productos(self):
+        inicio = time.perf_counter()
+        id_producto = _siguiente_id(Productos)
+        self.productos = []
+        for i in range(self.escala.productos):
+            self.productos.append(Productos(
+                id_producto=id_producto + i,
+                nombre_producto=f'{self.azar.choice(_ARTICULOS)} {self.azar.choice(_VARIANTES)} {i + 1}',
+                descripcion=f'{self.azar.choice(_VARIANTES)} {self.azar.choice(_VARIANTES)}',
+                precio=Decimal(self.azar.randrange(500, 50_000)) / 100,
+                stock=self.azar.choice([0, *range(1, 200)]),
+                stock_minimo=self.azar.choice([3, 5, 10]),
+            ))
+        _insertar(Productos, self.productos)
+        # Pocos productos se llevan la mayoría de las ventas (distribución tipo Zipf)
+        self.pesos_productos = list(accumulate(1 / (rango + 1) for rango in range(len(self.productos))))
+        self._informar(f'{len(self.productos)} productos', inicio)
+
+    def _producto_al_azar(self):
+        return self.productos[bisect_left(self.pesos_productos, self.azar.random() * self.pesos_productos[-1])]
+
+    def crear_ventas(self):
+        """Un turno (ya cerrado) por caja y día; las ventas se reparten entre los turnos y se insertan por lotes"""
+        inicio = time.perf_counter()
+        turnos = []
+        id_turno = _siguiente_id(TurnosCaja)
+        for dia in range(self.escala.dias):
+            fecha = self.desde + timedelta(days=dia)
+            apertura = timezone.make_aware(datetime.combine(fecha, datetime.min.time()) + timedelta(hours=9))
+            for caja in self.cajas:
+                turnos.append(TurnosCaja(
+                    id_turno=id_turno + len(turnos), id_caja=caja,
+                    id_empleado_id=self.azar.choice(self.empleados_por_sucursal[caja.id_sucursal_id]),
+                    fecha_apertura=apertura,
+                    fecha_cierre=apertura + timedelta(hours=10),
+                ))
+        _insertar(TurnosCaja, turnos)
+
+        ventas_totales = max(1, self.escala.lineas_venta // self.escala.lineas_por_venta)
+        id_venta, id_detalle = _siguiente_id(Ventas), _siguiente_id(DetallesVenta)
+        ventas, detalles, num_lineas = [], [], 0
+        for n in range(ventas_totales):
+            turno = turnos[self.azar.randrange(len(turnos))]
+            venta = Ventas(
+                id_venta=id_venta + n, id_turno=turno,
+                nombre_cliente=self.azar.choice([None, *_NOMBRES]),
+                fecha_venta=turno.fecha_apertura + timedelta(seconds=self.azar.randrange(10 * 3600)),
+                total_venta=Decimal(0),
+            )
+            for _ in range(max(1, round(self.azar.expovariate(1 / self.escala.lineas_por_venta)))):
+                producto = self._producto_al_azar()
+                cantidad = self.azar.randint(1, 4)
+                detalles.append(DetallesVenta(
+                    id_detalle=id_detalle + num_lineas, id_venta=venta, id_producto=producto,
+                    cantidad=cantidad, subtotal=producto.precio * cantidad,
+                ))
+                venta.total_venta += producto.precio * cantidad
+                num_lineas += 1
+            ventas.append(venta)
+            if len(detalles) >= TAMANO_LOTE:
+                _insertar(Ventas, ventas)
+                _insertar(DetallesVenta, detalles)
+                ventas, detalles = [], []
+        _insertar(Ventas, ventas)
+        _insertar(DetallesVenta, detalles)
+        self._informar(f'{len(turnos)} turnos, {ventas_totales} ventas y {num_lineas} líneas', inicio)
+
+        inicio = time.perf_counter()
+        id_gasto = _siguiente_id(Gastos)
+        gastos = [
+            Gastos(
+                id_gasto=id_gasto + i * self.escala.gastos_por_turno + j, id_turno=turno,
+                fecha_gasto=turno.fecha_apertura + timedelta(seconds=self.azar.randrange(10 * 3600)),
+                monto=Decimal(self.azar.randrange(1000, 100_000)) / 100, concepto=self.azar.choice(_CONCEPTOS),
+            )
+            for i, turno in enumerate(turnos)
+            for j in range(self.escala.gastos_por_turno)
+        ]
+        _insertar(Gastos, gastos)
+        self._informar(f'{len(gastos)} gastos', inicio)
+
+    def generar(self):
+        # Cada lote se confirma por separado: una sola transacción de millones de filas
+        # haría crecer sin límite el registro de deshacer de MySQL
+        self.crear_sucursales()
+        self.crear_empleados()
+        self.crear_productos()
+        self.crear_ventas()
+        inicio = time.perf_counter()
+        filas_ventas, filas_productos = reconstruir(self.desde, self.hasta)
+        self._informar(f'{filas_ventas + filas_productos} filas de resumen', inicio)
+        # bulk_create no dispara las señales que invalidan estas cachés (las etiquetadas
+        # de `etiquetas` se invalidan solas por tabla)
+        referencias.invalidar()
+        busqueda.invalidar()
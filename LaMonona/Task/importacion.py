@@ -0,0 +1,223 @@
+"""Importación masiva del catálogo de productos desde CSV.
+
+El archivo se lee fila por fila (nunca completo en memoria) y cada valor se valida
+con los campos de `ProductoForm`. Las filas válidas se procesan en lotes: los
+productos existentes del lote se buscan con una sola consulta, por código
+(`id_producto`) o por nombre, y se guardan con `bulk_update`/`bulk_create`. Los
+cambios de stock pasan por el libro de movimientos. Cada lote se confirma en su
+propia transacción, así que sus filas quedan bloqueadas solo mientras se procesa
+ese lote; si un lote falla, los anteriores ya quedaron guardados. Las filas con
+errores se saltan y se informan.
+
+Columnas reconocidas: id_producto, nombre_producto, descripcion, precio, stock y
+stock_minimo. En un producto existente, una celda vacía deja el valor como está.
+"""
+import csv
+import time
+from itertools import islice
+
+from django.core.exceptions import ValidationError
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Max, Q
+from . import busqueda, movimientos
+from .forms import ProductoForm
+from .models import MovimientoStock, Productos
+
+TAMANO_LOTE = 1000
+TAMANO_BULK_UPDATE = 250
+COLUMNAS = ['nombre_producto', 'descripcion', 'precio', 'stock', 'stock_minimo']
+CAMPOS_ACTUALIZABLES = ['nombre_producto', 'descripcion', 'precio', 'stock_minimo']
+# Para no devolver respuestas enormes si todo el archivo está mal
+MAX_ERRORES_INFORMADOS = 500
+
+
+class ImportacionInvalida(Exception):
+    """El archivo no se puede importar (p. ej. faltan las columnas necesarias)"""
+
+
+class _Simulacion(Exception):
+    pass
+
+
+def _filas_validas(lector, campos, resultado):
+    """Genera (número de línea, código, valores limpios); los errores quedan en `resultado`"""
+    for fila in lector:
+        resultado['filas'] += 1
+        errores = {}
+        limpios = {}
+        codigo = (fila.get('id_producto') or '').strip()
+        if codigo:
+            if codigo.isdigit():
+                codigo = int(codigo)
+            else:
+                errores['id_producto'] = ['El código debe ser un número entero.']
+        for columna in COLUMNAS:
+            valor = (fila.get(columna) or '').strip()
+            if not valor:
+                continue
+            try:
+                limpios[columna] = campos[columna].clean(valor)
+            except ValidationError as e:
+                errores[columna] = e.messages
+        if limpios.get('stock', 0) < 0:
+            errores['stock'] = ['El stock no puede ser negativo.']
+        if not codigo and not errores and 'nombre_producto' not in limpios:
+            errores['nombre_producto'] = ['Se necesita el código o el nombre del producto.']
+
+        if errores:
+            _agregar_error(resultado, lector.line_num, errores)
+        else:
+            yield lector.line_num, codigo or None, limpios
+
+
+def _agregar_error(resultado, linea, errores):
+    resultado['num_errores'] += 1
+    if len(resultado['errores']) < MAX_ERRORES_INFORMADOS:
+        resultado['errores'][linea] = errores
+
+
+def _procesar_lote(lote, resultado, id_user):
+    codigos = {codigo for _, codigo, _ in lote if codigo}
+    nombres = {limpios['nombre_producto'] for _, codigo, limpios in lote if not codigo}
+    existentes = list(
+        Productos.objects.select_for_update()
+        .filter(Q(id_producto__in=codigos) | Q(nombre_producto__in=nombres))
+        .order_by('id_producto')
+    )
+    por_codigo = {producto.id_producto: producto for producto in existentes}
+    por_nombre = {producto.nombre_producto: producto for producto in existentes}
+
+    actualizados, nuevos, ajustes = {}, {}, []
+    # Solo se envían las filas y columnas que cambiaron: bulk_update arma un CASE por campo y fila
+    cambiados, campos_cambiados = {}, set()
+    for linea, codigo, limpios in lote:
+        producto = por_codigo.get(codigo) if codigo else por_nombre.get(limpios['nombre_producto'])
+        if producto is None:
+            if codigo:
+                _agregar_error(resultado, linea, {'id_producto': [f'No existe un producto con el código {codigo}.']})
+                continue
+            if 'precio' not in limpios:
+                _agregar_error(resultado, linea, {'precio': ['El precio es obligatorio para un producto nuevo.']})
+                continue
+            # El stock inicial entra después como movimiento, igual que en crear_producto
+            producto = Productos(stock=0, stock_minimo=Productos._meta.get_field('stock_minimo').default)
+            producto.stock_inicial = 0
+            nuevos[limpios['nombre_producto']] = producto
+            por_nombre[limpios['nombre_producto']] = producto
+
+        cambios = {campo for campo in CAMPOS_ACTUALIZABLES if campo in limpios and getattr(producto, campo) != limpios[campo]}
+        for campo in cambios:
+            setattr(producto, campo, limpios[campo])
+        if producto.pk is None:
+            producto.stock_inicial = limpios.get('stock', producto.stock_inicial)
+            continue
+        actualizados[producto.pk] = producto
+        if cambios:
+            campos_cambiados |= cambios
+            cambiados[producto.pk] = producto
+        if 'stock' in limpios and limpios['stock'] != producto.stock:
+            ajustes.append(MovimientoStock(
+                id_producto_id=producto.pk, tipo=movimientos.AJUSTE, cantidad=limpios['stock'] - producto.stock,
+                id_user_id=id_user, nota='Importación de catálogo',
+            ))
+            producto.stock = limpios['stock']
+
+    if cambiados:
+        _actualizar(list(cambiados.values()), sorted(campos_cambiados))
+    if nuevos:
+        _crear(list(nuevos.values()))
+        ajustes.extend(
+            MovimientoStock(
+                id_producto_id=producto.pk, tipo=movimientos.REPOSICION, cantidad=producto.stock_inicial,
+                id_user_id=id_user, nota='Stock inicial (importación)',
+            )
+            for producto in nuevos.values()
+            if producto.stock_inicial
+        )
+    # Las filas están bloqueadas y los destinos validados, así que no puede quedar stock negativo
+    try:
+        movimientos.aplicar(ajustes)
+    except movimientos.StockInsuficiente:
+        raise ImportacionInvalida('El stock cambió durante la importación.')
+    resultado['creados'] += len(nuevos)
+    resultado['actualizados'] += len(actualizados)
+
+
+def _actualizar(productos, campos):
+    """Guarda `campos` de los productos con el menor número de sentencias.
+
+    En una lista de precios muchos productos terminan con los mismos valores; cada
+    combinación distinta se guarda con un UPDATE ... WHERE id IN (...). Si casi todas
+    las filas son distintas se usa `bulk_update`, que arma un CASE por fila.
+    """
+    grupos = {}
+    for producto in productos:
+        grupos.setdefault(tuple(getattr(producto, campo) for campo in campos), []).append(producto.pk)
+    if len(grupos) > len(productos) // 4:
+        Productos.objects.bulk_update(productos, campos, batch_size=TAMANO_BULK_UPDATE)
+        return
+    for valores, ids in grupos.items():
+        Productos.objects.filter(id_producto__in=ids).update(**dict(zip(campos, valores)))
+
+
+def _crear(productos):
+    """bulk_create que deja asignado el id de cada producto también en MySQL.
+
+    MySQL no devuelve los ids de un INSERT múltiple y el nombre no es único, así que
+    ahí los ids se asignan antes, a partir del más alto (como en `generador`). Si otra
+    transacción crea un producto con uno de esos ids, se vuelven a numerar una vez.
+    """
+    if connection.features.can_return_rows_from_bulk_insert:
+        Productos.objects.bulk_create(productos, batch_size=TAMANO_LOTE)
+        return
+    for intento in range(2):
+        siguiente = (Productos.objects.aggregate(maximo=Max('id_producto'))['maximo'] or 0) + 1
+        for i, producto in enumerate(productos):
+            producto.pk = siguiente + i
+        try:
+            with transaction.atomic():
+                Productos.objects.bulk_create(productos, batch_size=TAMANO_LOTE)
+            return
+        except IntegrityError:
+            if intento:
+                raise
+
+
+def importar_productos(archivo, simular=False, id_user=None, delimitador=','):
+    """Importa un CSV (objeto de texto) y devuelve el resumen.
+
+    El resumen tiene `filas`, `creados`, `actualizados`, `num_errores`, `errores`
+    ({línea: {columna: [mensajes]}}), `segundos` y `filas_por_segundo`. Con
+    `simular=True` todo se valida y ejecuta pero cada lote se deshace, así que un
+    lote no ve los productos que habría creado uno anterior.
+    """
+    lector = csv.DictReader(archivo, delimiter=delimitador)
+    columnas = set(lector.fieldnames or [])
+    if not columnas & {'id_producto', 'nombre_producto'}:
+        raise ImportacionInvalida('El archivo debe tener la columna "id_producto" o "nombre_producto".')
+
+    campos = ProductoForm().fields
+    resultado = {'filas': 0, 'creados': 0, 'actualizados': 0, 'num_errores': 0, 'errores': {}}
+    inicio = time.perf_counter()
+    filas = _filas_validas(lector, campos, resultado)
+    while lote := list(islice(filas, TAMANO_LOTE)):
+        try:
+            with transaction.atomic():
+                _procesar_lote(lote, resultado, id_user)
+                if simular:
+                    raise _Simulacion
+                # bulk_create y bulk_update no disparan señales
+                transaction.on_commit(busqueda.invalidar)
+        except _Simulacion:
+            pass
+        except ImportacionInvalida as e:
+            if simular or not (resultado['creados'] or resultado['actualizados']):
+                raise
+            raise ImportacionInvalida(
+                f'{e} Los lotes anteriores ya se guardaron '
+                f'({resultado["creados"]} creados, {resultado["actualizados"]} actualizados).'
+            ) from e
+
+    resultado['segundos'] = round(time.perf_counter() - inicio, 3)
+    resultado['filas_por_segundo'] = round(resultado['filas'] / resultado['segundos']) if resultado['segundos'] else None
+    return resultado
@@ -0,0 +1,271 @@
+"""Índices de las tablas `managed = False` y un asesor de índices basado en EXPLAIN.
+
+Las tablas de ventas, cajas y turnos vienen de `inspectdb` y las migraciones no
+las tocan, así que sus `Meta.indexes` se aplican con `crear_indices`: se comparan
+con los índices que ya hay en la base (por nombre y por columnas, por si alguien
+ya creó uno equivalente) y se crean los que faltan con el `schema_editor`. En
+MySQL 8 agregar un índice secundario es una operación en línea que no bloquea las
+escrituras.
+
+`asesor_indices` ejecuta EXPLAIN sobre las consultas de las vistas (`CONSULTAS`),
+marca los recorridos completos de tablas y los ordenamientos sin índice
+(filesort) y sugiere un índice con las columnas de igualdad, de rango y de orden
+que la consulta usa sobre esa tabla. Funciona con MySQL y SQLite.
+"""
+import re
+from datetime import timedelta
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import F, Sum
+from django.db.models.expressions import Col
+from django.utils import timezone
+from .models import Cajas, DetallesVenta, Productos, Sucursales, TurnosCaja, Ventas
+from CajasApp.servicios import montos_turno
+from VentasApp.consultas import filtrar_ventas
+
+LOOKUPS_IGUALDAD = {'exact', 'iexact', 'in', 'isnull'}
+FILAS_POR_PAGINA = 26  # lo que pide `pagina_keyset` (25 + 1)
+
+
+# ===== ÍNDICES DECLARADOS EN MODELOS NO GESTIONADOS =====
+
+def _indices_existentes(conexion, tabla):
+    """{nombre: [columnas]} de los índices (incluidas claves primarias y únicas) de la tabla"""
+    with conexion.cursor() as cursor:
+        restricciones = conexion.introspection.get_constraints(cursor, tabla)
+    return {
+        nombre: datos['columns']
+        for nombre, datos in restricciones.items()
+        if datos['index'] or datos['primary_key'] or datos['unique']
+    }
+
+
+def _columnas(modelo, indice):
+    return [modelo._meta.get_field(campo.lstrip('-')).column for campo in indice.fields]
+
+
+def pendientes(using=DEFAULT_DB_ALIAS):
+    """(modelo, índice) declarados en modelos `managed = False` que todavía no están en la base"""
+    conexion = connections[using]
+    tablas = set(conexion.introspection.table_names())
+    faltantes = []
+    for modelo in apps.get_models():
+        opciones = modelo._meta
+        if opciones.managed or not opciones.indexes or opciones.db_table not in tablas:
+            continue
+        existentes = _indices_existentes(conexion, opciones.db_table)
+        for indice in opciones.indexes:
+            if indice.name not in existentes and _columnas(modelo, indice) not in existentes.values():
+                faltantes.append((modelo, indice))
+    return faltantes
+
+
+def sql_crear(faltantes, using=DEFAULT_DB_ALIAS):
+    """Sentencias que crearían los índices, sin ejecutarlas"""
+    with connections[using].schema_editor(collect_sql=True, atomic=False) as editor:
+        for modelo, indice in faltantes:
+            editor.add_index(modelo, indice)
+    return editor.collected_sql
+
+
+def crear(modelo, indice, using=DEFAULT_DB_ALIAS):
+    with connections[using].schema_editor(atomic=False) as editor:
+        editor.add_index(modelo, indice)
+
+
+# ===== ASESOR =====
+
+def _un_id(modelo):
+    """Un id existente para armar la consulta (EXPLAIN no depende mucho del valor)"""
+    return modelo.objects.order_by().values_list(modelo._meta.pk.attname, flat=True).first() or 0
+
+
+def _consultas_ventas():
+    hoy = timezone.localdate()
+    rango = {'desde': (hoy - timedelta(days=30)).isoformat(), 'hasta': hoy.isoformat()}
+    orden = ('-fecha_venta', '-id_venta')
+    return {
+        'lista_ventas': Ventas.objects.select_related('id_turno').order_by(*orden)[:FILAS_POR_PAGINA],
+        'datos_ventas:rango': filtrar_ventas(Ventas.objects.order_by(*orden), rango)[:FILAS_POR_PAGINA],
+        'datos_ventas:sucursal': filtrar_ventas(
+            Ventas.objects.order_by(*orden), {'sucursal': str(_un_id(Sucursales))}
+        )[:FILAS_POR_PAGINA],
+        'resumenes:detalles_del_rango': filtrar_ventas(DetallesVenta.objects.all(), rango, prefijo='id_venta__')
+        .values('id_producto').annotate(cantidad_total=Sum('cantidad')).order_by(),
+        'ventas_de_un_producto': DetallesVenta.objects.filter(id_producto=_un_id(Productos)).values('id_venta'),
+    }
+
+
+def _consultas_cajas():
+    id_turno = _un_id(TurnosCaja)
+    ingresos, egresos, _ = montos_turno()
+    return {
+        'apertura:caja_abierta_en_sucursal': Cajas.objects.filter(
+            id_sucursal_id=Cajas.objects.values_list('id_sucursal_id', flat=True).first() or 0, estado='Abierta',
+        ),
+        'apertura:turno_abierto_de_caja': TurnosCaja.objects.filter(id_caja_id=_un_id(Cajas), fecha_cierre__isnull=True),
+        'cerrar_turnos_vencidos': TurnosCaja.objects.filter(
+            fecha_cierre__isnull=True, fecha_apertura__lt=timezone.now() - timedelta(hours=12),
+        ),
+        'cierre:montos_turno': TurnosCaja.objects.filter(id_turno=id_turno)
+        .annotate(ingresos=ingresos, egresos=egresos).values('ingresos', 'egresos'),
+        'reporte_turno:productos': DetallesVenta.objects.filter(id_venta__id_turno=id_turno)
+        .values('id_producto').annotate(total=Sum('subtotal')).order_by('-total'),
+    }
+
+
+def _consultas_productos():
+    return {
+        'dashboard_stock:bajo_minimo': Productos.objects.filter(stock__lte=F('stock_minimo'))
+        .annotate(faltante=F('stock_minimo') - F('stock'))
+        .order_by('-faltante', 'nombre_producto')
+        .values('id_producto', 'nombre_producto', 'stock', 'stock_minimo', 'faltante'),
+        'lista_productos': Productos.objects.order_by('nombre_producto'),
+    }
+
+
+def consultas():
+    """{nombre: queryset} con las consultas principales de cada vista"""
+    return {**_consultas_ventas(), **_consultas_cajas(), **_consultas_productos()}
+
+
+def _plan(queryset, conexion):
+    """Filas del plan como dicts: `tabla`, `acceso`, `indice`, `filas`, `detalle`"""
+    sql, params = queryset.query.sql_with_params()
+    with conexion.cursor() as cursor:
+        if conexion.vendor == 'mysql':
+            cursor.execute(f'EXPLAIN {sql}', params)
+            columnas = [descripcion[0].lower() for descripcion in cursor.description]
+            return [
+                {
+                    'tabla': fila.get('table'),
+                    'acceso': fila.get('type'),
+                    'indice': fila.get('key'),
+                    'filas': fila.get('rows'),
+                    'detalle': fila.get('extra') or '',
+                }
+                for fila in (dict(zip(columnas, valores)) for valores in cursor.fetchall())
+            ]
+        if conexion.vendor == 'sqlite':
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = []
+            for *_, detalle in cursor.fetchall():
+                coincidencia = re.match(r'(SCAN|SEARCH) (\S+)(?: USING (?:COVERING )?(?:INDEX (\S+)|INTEGER PRIMARY KEY))?', detalle)
+                plan.append({
+                    'tabla': coincidencia.group(2) if coincidencia else None,
+                    'acceso': coincidencia.group(1) if coincidencia else None,
+                    'indice': (coincidencia.group(3) or ('PRIMARY' if 'PRIMARY KEY' in detalle else None))
+                    if coincidencia else None,
+                    'filas': None,
+                    'detalle': detalle,
+                })
+            return plan
+    raise NotImplementedError(f'El asesor no sabe leer EXPLAIN de {conexion.vendor}.')
+
+
+def _problemas(fila):
+    problemas = []
+    detalle = fila['detalle'].upper()
+    if (fila['acceso'] == 'ALL') or (fila['acceso'] == 'SCAN' and fila['indice'] is None):
+        problemas.append('recorrido completo')
+    if 'FILESORT' in detalle or 'TEMP B-TREE FOR ORDER BY' in detalle:
+        problemas.append('ordenamiento sin índice (filesort)')
+    if 'USING TEMPORARY' in detalle or 'TEMP B-TREE FOR GROUP BY' in detalle:
+        problemas.append('tabla temporal')
+    return problemas
+
+
+def _columnas_de_consulta(query):
+    """{tabla: [columnas]} en orden de igualdad, rango y ORDER BY (sin repetir)"""
+    tablas = {alias: union.table_name for alias, union in query.alias_map.items()}
+    igualdad, rango = [], []
+
+    def recorrer(nodo):
+        for hijo in nodo.children:
+            if hasattr(hijo, 'children'):
+                recorrer(hijo)
+            elif isinstance(getattr(hijo, 'lhs', None), Col) and hijo.lhs.alias in tablas:
+                destino = igualdad if hijo.lookup_name in LOOKUPS_IGUALDAD else rango
+                destino.append((tablas[hijo.lhs.alias], hijo.lhs.target.column))
+                # Comparación entre columnas (p. ej. stock <= stock_minimo): no sirve para
+                # buscar en el índice, pero tenerla en él evita leer la fila
+                if isinstance(hijo.rhs, Col) and hijo.rhs.alias in tablas:
+                    rango.append((tablas[hijo.rhs.alias], hijo.rhs.target.column))
+
+    recorrer(query.where)
+    orden = []
+    for campo in query.order_by:
+        if isinstance(campo, str) and '__' not in campo and campo.lstrip('-') not in query.annotations:
+            orden.append((query.get_meta().db_table, query.get_meta().get_field(campo.lstrip('-')).column))
+
+    columnas = {}
+    for tabla, columna in igualdad + rango + orden:
+        if columna not in columnas.setdefault(tabla, []):
+            columnas[tabla].append(columna)
+    return tablas, columnas
+
+
+def _declarados():
+    """{tabla: [(nombre, columnas, gestionado)]} de los índices declarados en los modelos"""
+    declarados = {}
+    for modelo in apps.get_models():
+        for indice in modelo._meta.indexes:
+            declarados.setdefault(modelo._meta.db_table, []).append(
+                (indice.name, _columnas(modelo, indice), modelo._meta.managed)
+            )
+    return declarados
+
+
+def _comparten_prefijo(a, b):
+    return a[:len(b)] == b or b[:len(a)] == a
+
+
+def _sugerencia(tabla, columnas, conexion, declarados, agrupada):
+    if not columnas and agrupada:
+        return f'{tabla}: la tabla temporal y el ordenamiento vienen del GROUP BY; un índice no los evita'
+    if not columnas:
+        return f'{tabla}: la consulta no filtra ni ordena por columnas de esta tabla; revisar si hace falta leerla completa'
+    existentes = _indices_existentes(conexion, tabla)
+    for nombre, columnas_indice in existentes.items():
+        if _comparten_prefijo(columnas_indice, columnas):
+            return (f'{tabla}: ya existe {nombre} ({", ".join(columnas_indice)}) pero el plan no lo usa; '
+                    'revisar las estadísticas (ANALYZE TABLE) o si conviene otro orden de columnas')
+    for nombre, columnas_indice, gestionado in declarados.get(tabla, []):
+        if nombre not in existentes and _comparten_prefijo(columnas_indice, columnas):
+            falta = 'makemigrations y migrate' if gestionado else 'crear_indices'
+            return f'{tabla}: el índice {nombre} está declarado en el modelo pero no en la base; ejecutar {falta}'
+    return f'{tabla}: agregar un índice en ({", ".join(columnas)})'
+
+
+def analizar(nombre, queryset, using=DEFAULT_DB_ALIAS, declarados=None):
+    """Plan, problemas y sugerencias de una consulta"""
+    conexion = connections[using]
+    plan = _plan(queryset, conexion)
+    tablas, columnas = _columnas_de_consulta(queryset.query)
+    declarados = _declarados() if declarados is None else declarados
+    problemas, sugerencias = [], []
+    for fila in plan:
+        encontrados = _problemas(fila)
+        if not encontrados:
+            continue
+        # SQLite informa el ordenamiento sin tabla; es el de la tabla principal
+        tabla = tablas.get(fila['tabla'], fila['tabla']) or queryset.query.get_meta().db_table
+        problemas.append(f'{tabla}: {", ".join(encontrados)}')
+        if tabla in tablas.values():
+            sugerencia = _sugerencia(
+                tabla, columnas.get(tabla, []), conexion, declarados, queryset.query.group_by is not None,
+            )
+            if sugerencia not in sugerencias:
+                sugerencias.append(sugerencia)
+    return {'consulta': nombre, 'plan': plan, 'problemas': problemas, 'sugerencias': sugerencias}
+
+
+def asesorar(nombres=None, using=DEFAULT_DB_ALIAS):
+    """Resultado de `analizar` para cada consulta de `consultas()` (o solo las de `nombres`)"""
+    declarados = _declarados()
+    return [
+        analizar(nombre, queryset, using, declarados)
+        for nombre, queryset in consultas().items()
+        if not nombres or nombre in nombres or nombre.split(':')[0] in nombres
+    ]
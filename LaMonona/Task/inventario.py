@@ -0,0 +1,46 @@
+"""Resumen del estado del stock para el listado de productos y el dashboard.
+
+Los conteos salen de una sola consulta con agregación condicional y la lista de
+productos bajo el mínimo de otra, ya ordenada por faltante. El resultado se guarda
+en la caché con la etiqueta de la tabla `productos`, que cambia con cualquier
+escritura sobre ella (también `update()` y `bulk_create`).
+"""
+from django.db.models import Count, F, Q
+from . import etiquetas
+from .models import Productos
+
+CLAVE_RESUMEN = 'inventario:resumen_stock'
+DURACION_SEGUNDOS = 5 * 60
+NUM_CRITICOS = 5
+
+
+def _calcular():
+    conteos = Productos.objects.aggregate(
+        total=Count('id_producto'),
+        normal=Count('id_producto', filter=Q(stock__gt=F('stock_minimo'))),
+        bajo_stock=Count('id_producto', filter=Q(stock__lte=F('stock_minimo'))),
+        sin_stock=Count('id_producto', filter=Q(stock=0)),
+    )
+    bajo_stock = list(
+        Productos.objects.filter(stock__lte=F('stock_minimo'))
+        .annotate(faltante=F('stock_minimo') - F('stock'))
+        .order_by('-faltante', 'nombre_producto')
+        .values('id_producto', 'nombre_producto', 'stock', 'stock_minimo', 'faltante')
+    )
+    return {
+        **conteos,
+        'productos_bajo_stock': bajo_stock,
+        'productos_sin_stock': [producto for producto in bajo_stock if producto['stock'] == 0],
+        'productos_criticos': bajo_stock[:NUM_CRITICOS],
+    }
+
+
+def resumen_stock():
+    """Conteos por estado de stock y productos bajo el mínimo (los más críticos primero).
+
+    Devuelve un dict con `total`, `normal`, `bajo_stock`, `sin_stock` y las listas
+    `productos_bajo_stock`, `productos_sin_stock` y `productos_criticos`, cuyos
+    elementos son dicts con `id_producto`, `nombre_producto`, `stock`, `stock_minimo`
+    y `faltante`.
+    """
+    return etiquetas.obtener(CLAVE_RESUMEN, _calcular, ['productos'], DURACION_SEGUNDOS)
@@ -0,0 +1,35 @@
+from django.core.management.base import BaseCommand, CommandError
+from Task.altas import alta_masiva
+from Task.importacion import ImportacionInvalida
+
+
+class Command(BaseCommand):
+    help = 'Crea empleados desde un CSV (username, password, nombre, apellido, correo, rol, edad, telefono, direccion).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV (UTF-8, con encabezados).')
+        parser.add_argument('--delimitador', default=',', help='Separador de columnas. Por defecto ",".')
+        parser.add_argument('--procesos', type=int, help='Procesos para hashear contraseñas. Por defecto, uno por CPU.')
+        parser.add_argument('--simular', action='store_true', help='Valida e informa sin crear usuarios.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                resultado = alta_masiva(
+                    archivo, simular=options['simular'], procesos=options['procesos'], delimitador=options['delimitador'],
+                )
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+        except ImportacionInvalida as e:
+            raise CommandError(str(e))
+
+        for linea, errores in resultado['errores'].items():
+            detalle = '; '.join(f'{campo}: {" ".join(mensajes)}' for campo, mensajes in errores.items())
+            self.stderr.write(f'Línea {linea}: {detalle}')
+        if resultado['num_errores'] > len(resultado['errores']):
+            self.stderr.write(f'... y {resultado["num_errores"] - len(resultado["errores"])} errores más.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Simulación: " if options["simular"] else ""}{resultado["filas"]} filas en {resultado["segundos"]} s: '
+            f'{resultado["creados"]} empleados creados, {resultado["num_errores"]} con errores.'
+        ))
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import DEFAULT_DB_ALIAS
+from Task.indices import asesorar
+
+
+class Command(BaseCommand):
+    help = ('Ejecuta EXPLAIN sobre las consultas de las vistas principales, marca recorridos completos '
+            'y ordenamientos sin índice y sugiere índices.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--consulta', action='append', help='Consulta o vista a revisar (se puede repetir).')
+        parser.add_argument('--plan', action='store_true', help='Muestra el plan completo de cada consulta.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        try:
+            resultados = asesorar(options['consulta'], options['database'])
+        except NotImplementedError as e:
+            raise CommandError(str(e))
+        if not resultados:
+            raise CommandError('No hay consultas con ese nombre.')
+
+        con_problemas = 0
+        for resultado in resultados:
+            if resultado['problemas']:
+                con_problemas += 1
+                self.stdout.write(self.style.WARNING(f'{resultado["consulta"]}: {"; ".join(resultado["problemas"])}'))
+                for sugerencia in resultado['sugerencias']:
+                    self.stdout.write(f'  -> {sugerencia}')
+            else:
+                self.stdout.write(f'{resultado["consulta"]}: sin problemas')
+            if options['plan']:
+                for fila in resultado['plan']:
+                    self.stdout.write(
+                        f'    {fila["tabla"]} | {fila["acceso"]} | {fila["indice"] or "-"} | '
+                        f'{fila["filas"] if fila["filas"] is not None else "-"} | {fila["detalle"]}'
+                    )
+        self.stdout.write(f'{con_problemas} de {len(resultados)} consultas con problemas.')
@@ -0,0 +1,42 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from Task.benchmark import VISTAS_CONCURRENCIA, concurrencia
+
+
+class Command(BaseCommand):
+    help = ('Compara cuántas peticiones simultáneas atiende un worker con WSGI (pool de hilos) y con ASGI '
+            '(event loop) en las vistas de lectura, y lo informa en JSON.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Usuario con el que se piden las vistas. Por defecto, el primer superusuario.')
+        parser.add_argument('--vista', action='append', choices=VISTAS_CONCURRENCIA,
+                            help='Vista a medir (se puede repetir). Por defecto, todas.')
+        parser.add_argument('--clientes', type=int, default=50, help='Clientes pidiendo a la vez.')
+        parser.add_argument('--peticiones', type=int, default=500, help='Peticiones por vista y por servidor.')
+        parser.add_argument('--hilos', type=int, default=4, help='Hilos del worker WSGI.')
+        parser.add_argument('--latencia-sql', type=float, default=0,
+                            help='Milisegundos de espera agregados a cada consulta (red hasta la base).')
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON. Por defecto, la salida estándar.')
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario; indícalo con --usuario.')
+        if min(options['clientes'], options['peticiones'], options['hilos']) < 1:
+            raise CommandError('--clientes, --peticiones y --hilos deben ser mayores que cero.')
+
+        resultado = concurrencia(
+            usuario, options['vista'], options['clientes'], options['peticiones'], options['hilos'],
+            options['latencia_sql'], salida=self.stderr.write,
+        )
+        texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto)
+        else:
+            self.stdout.write(texto)
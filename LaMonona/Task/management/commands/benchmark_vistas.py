@@ -0,0 +1,46 @@
+import json
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from Task.benchmark import comparar, ejecutar
+
+
+class Command(BaseCommand):
+    help = 'Mide latencia (p50/p95), consultas SQL y memoria de las vistas principales y las informa en JSON.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--usuario', help='Usuario con el que se piden las vistas. Por defecto, el primer superusuario.')
+        parser.add_argument('--repeticiones', type=int, default=20)
+        parser.add_argument('--calentamiento', type=int, default=2)
+        parser.add_argument('--solo', action='append', help='Escenario o vista a medir (se puede repetir).')
+        parser.add_argument('--salida', help='Archivo donde guardar el JSON. Por defecto, la salida estándar.')
+        parser.add_argument('--comparar', help='JSON de una corrida anterior para marcar regresiones.')
+
+    def handle(self, *args, **options):
+        if options['usuario']:
+            usuario = User.objects.filter(username=options['usuario']).first()
+        else:
+            usuario = User.objects.filter(is_superuser=True, is_active=True).order_by('id').first()
+        if usuario is None:
+            raise CommandError('No se encontró el usuario; indícalo con --usuario.')
+        if options['repeticiones'] < 1:
+            raise CommandError('--repeticiones debe ser mayor que cero.')
+
+        resultado = ejecutar(
+            usuario, options['repeticiones'], options['calentamiento'], options['solo'], salida=self.stderr.write,
+        )
+        texto = json.dumps(resultado, indent=2, ensure_ascii=False)
+        if options['salida']:
+            with open(options['salida'], 'w', encoding='utf-8') as archivo:
+                archivo.write(texto)
+        else:
+            self.stdout.write(texto)
+
+        if options['comparar']:
+            try:
+                with open(options['comparar'], encoding='utf-8') as archivo:
+                    anterior = json.load(archivo)
+            except (OSError, ValueError) as e:
+                raise CommandError(f'No se pudo leer {options["comparar"]}: {e}')
+            for linea in comparar(anterior, resultado):
+                self.stderr.write(linea)
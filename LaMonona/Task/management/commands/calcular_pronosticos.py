@@ -0,0 +1,20 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from Task.pronosticos import recalcular
+
+
+class Command(BaseCommand):
+    help = 'Recalcula el pronóstico de reposición de todos los productos (ejecutar cada noche, p. ej. desde cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--hasta', help='Último día de ventas a considerar (YYYY-MM-DD). Por defecto, ayer.')
+
+    def handle(self, *args, **options):
+        try:
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else None
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+
+        total = recalcular(hasta)
+        self.stdout.write(self.style.SUCCESS(f'Pronósticos recalculados para {total} productos.'))
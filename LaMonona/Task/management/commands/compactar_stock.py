@@ -0,0 +1,22 @@
+from datetime import date, datetime
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from Task.movimientos import compactar
+
+
+class Command(BaseCommand):
+    help = 'Guarda una foto del stock de cada producto a una fecha de corte (ejecutar a diario, p. ej. desde cron).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fecha', help='Día de corte (YYYY-MM-DD); la foto se toma a las 00:00. Por defecto, hoy.')
+
+    def handle(self, *args, **options):
+        try:
+            dia = date.fromisoformat(options['fecha']) if options['fecha'] else timezone.localdate()
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+
+        corte = timezone.make_aware(datetime.combine(dia, datetime.min.time()))
+        creadas = compactar(corte)
+        self.stdout.write(self.style.SUCCESS(f'Fotos de stock al {corte:%Y-%m-%d %H:%M}: {creadas} nuevas.'))
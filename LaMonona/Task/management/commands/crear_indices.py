@@ -0,0 +1,31 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from Task.indices import crear, pendientes, sql_crear
+
+
+class Command(BaseCommand):
+    help = ('Crea los índices declarados en los modelos managed = False (ventas, turnos, cajas...), '
+            'que las migraciones no aplican. Los que ya existen se saltan.')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sql', action='store_true', help='Solo muestra las sentencias, sin ejecutarlas.')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        faltantes = pendientes(options['database'])
+        if not faltantes:
+            self.stdout.write(self.style.SUCCESS('Todos los índices declarados ya existen.'))
+            return
+        if options['sql']:
+            for sentencia in sql_crear(faltantes, options['database']):
+                self.stdout.write(sentencia)
+            return
+        for modelo, indice in faltantes:
+            inicio = time.perf_counter()
+            crear(modelo, indice, options['database'])
+            self.stdout.write(
+                f'{indice.name} en {modelo._meta.db_table} ({", ".join(indice.fields)}): {time.perf_counter() - inicio:.1f} s'
+            )
+        self.stdout.write(self.style.SUCCESS(f'{len(faltantes)} índices creados.'))
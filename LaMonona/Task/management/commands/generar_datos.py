@@ -0,0 +1,48 @@
+from datetime import date
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from Task.generador import HASTA, Escala, Generador
+
+
+class Command(BaseCommand):
+    help = 'Llena la base con datos sintéticos reproducibles (sucursales, cajas, empleados, productos, ventas y gastos).'
+
+    def add_arguments(self, parser):
+        escala = Escala()
+        parser.add_argument('--sucursales', type=int, default=escala.sucursales)
+        parser.add_argument('--cajas-por-sucursal', type=int, default=escala.cajas_por_sucursal)
+        parser.add_argument('--empleados-por-sucursal', type=int, default=escala.empleados_por_sucursal)
+        parser.add_argument('--productos', type=int, default=escala.productos)
+        parser.add_argument('--lineas-venta', type=int, default=escala.lineas_venta,
+                            help='Total aproximado de líneas de venta (p. ej. 10000000).')
+        parser.add_argument('--lineas-por-venta', type=int, default=escala.lineas_por_venta,
+                            help='Promedio de líneas por venta.')
+        parser.add_argument('--dias', type=int, default=escala.dias, help='Días hacia atrás desde --hasta.')
+        parser.add_argument('--hasta', type=date.fromisoformat, default=HASTA,
+                            help=f'Último día con ventas (AAAA-MM-DD). Por defecto {HASTA.isoformat()}, '
+                                 'para que los datos sean reproducibles; usa la fecha de hoy para ver ventas recientes.')
+        parser.add_argument('--gastos-por-turno', type=int, default=escala.gastos_por_turno)
+        parser.add_argument('--semilla', type=int, default=42,
+                            help='Misma semilla, mismos datos (partiendo de una base vacía: los ids siguen al máximo de cada tabla).')
+        parser.add_argument('--forzar', action='store_true', help='Permite correrlo con DEBUG = False.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['forzar']:
+            raise CommandError('DEBUG está apagado: esto parece producción. Usa --forzar si de verdad es una base de pruebas.')
+        if min(options['sucursales'], options['cajas_por_sucursal'], options['empleados_por_sucursal'],
+               options['productos'], options['lineas_por_venta'], options['dias']) < 1:
+            raise CommandError('Las cantidades deben ser mayores que cero.')
+
+        escala = Escala(
+            sucursales=options['sucursales'],
+            cajas_por_sucursal=options['cajas_por_sucursal'],
+            empleados_por_sucursal=options['empleados_por_sucursal'],
+            productos=options['productos'],
+            lineas_venta=options['lineas_venta'],
+            lineas_por_venta=options['lineas_por_venta'],
+            dias=options['dias'],
+            gastos_por_turno=options['gastos_por_turno'],
+        )
+        Generador(escala, semilla=options['semilla'], salida=self.stdout.write, hasta=options['hasta']).generar()
+        self.stdout.write(self.style.SUCCESS('Datos generados.'))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+from Task.importacion import ImportacionInvalida, importar_productos
+
+
+class Command(BaseCommand):
+    help = 'Crea o actualiza productos desde un CSV (id_producto, nombre_producto, descripcion, precio, stock, stock_minimo).'
+
+    def add_arguments(self, parser):
+        parser.add_argument('archivo', help='Ruta del CSV (UTF-8, con encabezados).')
+        parser.add_argument('--delimitador', default=',', help='Separador de columnas. Por defecto ",".')
+        parser.add_argument('--simular', action='store_true', help='Valida e informa sin guardar cambios.')
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['archivo'], encoding='utf-8-sig', newline='') as archivo:
+                resultado = importar_productos(archivo, simular=options['simular'], delimitador=options['delimitador'])
+        except OSError as e:
+            raise CommandError(f'No se pudo leer el archivo: {e}')
+        except ImportacionInvalida as e:
+            raise CommandError(str(e))
+
+        for linea, errores in resultado['errores'].items():
+            detalle = '; '.join(f'{campo}: {" ".join(mensajes)}' for campo, mensajes in errores.items())
+            self.stderr.write(f'Línea {linea}: {detalle}')
+        if resultado['num_errores'] > len(resultado['errores']):
+            self.stderr.write(f'... y {resultado["num_errores"] - len(resultado["errores"])} errores más.')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Simulación: " if options["simular"] else ""}{resultado["filas"]} filas en {resultado["segundos"]} s '
+            f'({resultado["filas_por_segundo"]} filas/s): {resultado["creados"]} creados, '
+            f'{resultado["actualizados"]} actualizados, {resultado["num_errores"]} con errores.'
+        ))
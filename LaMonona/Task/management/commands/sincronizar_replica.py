@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand, CommandError
+from Task.replicas import ReplicaInvalida, sincronizar
+
+
+class Command(BaseCommand):
+    help = ("Copia los datos de 'default' a la base 'reporting' para probar en local las lecturas "
+            "de reportes desde una réplica. No usar con una réplica real.")
+
+    def handle(self, *args, **options):
+        try:
+            copiadas = sincronizar(salida=self.stdout.write)
+        except ReplicaInvalida as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'{len(copiadas)} tablas, {sum(copiadas.values())} filas copiadas.'))
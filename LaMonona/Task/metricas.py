@@ -0,0 +1,197 @@
+"""Métricas por vista: latencia, número de consultas SQL y tiempo en la base.
+
+`MetricasMiddleware` mide cada petición y la acumula bajo el nombre de la URL
+resuelta (p. ej. 'lista_productos'). Las consultas se cuentan con un
+`execute_wrapper` que se instala en cada conexión al crearse y que suma en la
+medición de la petición actual (una `ContextVar`), así también se cuentan las
+consultas que una vista async hace con `sync_to_async`. Si una vista pasa su
+presupuesto de consultas (`settings.PRESUPUESTOS_CONSULTAS`) se registra una
+advertencia.
+
+Los valores se acumulan en memoria en cada proceso y `/metricas/` los expone en
+formato de texto de Prometheus; con varios workers, cada uno informa los suyos.
+"""
+import logging
+import threading
+import time
+from bisect import bisect_left
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+LIMITES_LATENCIA = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LIMITES_CONSULTAS = (1, 2, 5, 10, 20, 50, 100, 200)
+PRESUPUESTO_POR_DEFECTO = 30
+SIN_VISTA = 'sin_vista'  # 404 y rutas sin nombre
+
+_medicion = ContextVar('medicion_consultas', default=None)
+_lock = threading.Lock()
+_vistas = {}  # (vista, método) -> _Acumulado
+
+
+class Medicion:
+    """Consultas y tiempo en la base de una petición (o de un bloque en las pruebas)"""
+
+    def __init__(self):
+        self.consultas = 0
+        self.segundos_sql = 0.0
+
+
+class _Acumulado:
+    def __init__(self):
+        self.peticiones = 0
+        self.latencia = [0] * (len(LIMITES_LATENCIA) + 1)
+        self.segundos = 0.0
+        self.consultas = [0] * (len(LIMITES_CONSULTAS) + 1)
+        self.total_consultas = 0
+        self.segundos_sql = 0.0
+        self.fuera_de_presupuesto = 0
+
+
+def presupuesto(vista):
+    """Máximo de consultas SQL permitido para una vista"""
+    presupuestos = getattr(settings, 'PRESUPUESTOS_CONSULTAS', {})
+    return presupuestos.get(vista, getattr(settings, 'PRESUPUESTO_CONSULTAS_POR_DEFECTO', PRESUPUESTO_POR_DEFECTO))
+
+
+def _contar(execute, sql, params, many, context):
+    medicion = _medicion.get()
+    if medicion is None:
+        return execute(sql, params, many, context)
+    inicio = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        medicion.consultas += 1
+        medicion.segundos_sql += time.perf_counter() - inicio
+
+
+@receiver(connection_created)
+def _instalar(sender, connection, **kwargs):
+    if _contar not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_contar)
+
+
+def medir():
+    """Empieza a contar las consultas del contexto actual; devuelve (medicion, token para `terminar`)"""
+    medicion = Medicion()
+    return medicion, _medicion.set(medicion)
+
+
+def terminar(token):
+    _medicion.reset(token)
+
+
+def registrar(vista, metodo, segundos, medicion):
+    limite = presupuesto(vista)
+    excedida = medicion.consultas > limite
+    with _lock:
+        acumulado = _vistas.setdefault((vista, metodo), _Acumulado())
+        acumulado.peticiones += 1
+        acumulado.latencia[bisect_left(LIMITES_LATENCIA, segundos)] += 1
+        acumulado.segundos += segundos
+        acumulado.consultas[bisect_left(LIMITES_CONSULTAS, medicion.consultas)] += 1
+        acumulado.total_consultas += medicion.consultas
+        acumulado.segundos_sql += medicion.segundos_sql
+        acumulado.fuera_de_presupuesto += excedida
+    if excedida:
+        logger.warning(
+            'La vista %s (%s) hizo %s consultas SQL (presupuesto: %s) en %.3f s',
+            vista, metodo, medicion.consultas, limite, segundos,
+        )
+
+
+def _nombre_vista(request):
+    coincidencia = getattr(request, 'resolver_match', None)
+    return (coincidencia.view_name if coincidencia else None) or SIN_VISTA
+
+
+class MetricasMiddleware:
+    """Mide cada petición; va primero en MIDDLEWARE para incluir las consultas de sesión y usuario"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        medicion, token = medir()
+        inicio = time.perf_counter()
+        try:
+            return self.get_response(request)
+        finally:
+            registrar(_nombre_vista(request), request.method, time.perf_counter() - inicio, medicion)
+            terminar(token)
+
+    async def __acall__(self, request):
+        medicion, token = medir()
+        inicio = time.perf_counter()
+        try:
+            return await self.get_response(request)
+        finally:
+            registrar(_nombre_vista(request), request.method, time.perf_counter() - inicio, medicion)
+            terminar(token)
+
+
+def _etiquetas(**valores):
+    return ','.join(f'{nombre}="{valor}"' for nombre, valor in valores.items())
+
+
+def _histograma(lineas, nombre, etiquetas, limites, cubetas, suma, cuenta):
+    acumulada = 0
+    for limite, cantidad in zip(limites, cubetas):
+        acumulada += cantidad
+        lineas.append(f'{nombre}_bucket{{{etiquetas},le="{limite}"}} {acumulada}')
+    lineas.append(f'{nombre}_bucket{{{etiquetas},le="+Inf"}} {cuenta}')
+    lineas.append(f'{nombre}_sum{{{etiquetas}}} {suma}')
+    lineas.append(f'{nombre}_count{{{etiquetas}}} {cuenta}')
+
+
+def exportar():
+    """Métricas acumuladas en formato de texto de Prometheus"""
+    with _lock:
+        vistas = sorted(
+            (clave, {**acumulado.__dict__, 'latencia': list(acumulado.latencia), 'consultas': list(acumulado.consultas)})
+            for clave, acumulado in _vistas.items()
+        )
+    lineas = [
+        '# HELP lamonona_peticion_segundos Latencia de las peticiones por vista.',
+        '# TYPE lamonona_peticion_segundos histogram',
+    ]
+    for (vista, metodo), datos in vistas:
+        _histograma(lineas, 'lamonona_peticion_segundos', _etiquetas(vista=vista, metodo=metodo),
+                    LIMITES_LATENCIA, datos['latencia'], round(datos['segundos'], 6), datos['peticiones'])
+    lineas += [
+        '# HELP lamonona_consultas_sql Consultas SQL por petición.',
+        '# TYPE lamonona_consultas_sql histogram',
+    ]
+    for (vista, metodo), datos in vistas:
+        _histograma(lineas, 'lamonona_consultas_sql', _etiquetas(vista=vista, metodo=metodo),
+                    LIMITES_CONSULTAS, datos['consultas'], datos['total_consultas'], datos['peticiones'])
+    lineas += [
+        '# HELP lamonona_sql_segundos_total Tiempo total en la base de datos.',
+        '# TYPE lamonona_sql_segundos_total counter',
+    ]
+    lineas += [
+        f'lamonona_sql_segundos_total{{{_etiquetas(vista=vista, metodo=metodo)}}} {round(datos["segundos_sql"], 6)}'
+        for (vista, metodo), datos in vistas
+    ]
+    lineas += [
+        '# HELP lamonona_fuera_de_presupuesto_total Peticiones que superaron el presupuesto de consultas.',
+        '# TYPE lamonona_fuera_de_presupuesto_total counter',
+    ]
+    lineas += [
+        f'lamonona_fuera_de_presupuesto_total{{{_etiquetas(vista=vista, metodo=metodo)}}} {datos["fuera_de_presupuesto"]}'
+        for (vista, metodo), datos in vistas
+    ]
+    return '\n'.join(lineas) + '\n'
@@ -0,0 +1,139 @@
+"""Empleado y rol del usuario autenticado, resueltos una vez por sesión.
+
+`PerfilMiddleware` agrega `request.empleado` (una instancia de `Empleados` con su
+`id_user` ya cargado, o None si el usuario no es empleado) y `request.rol` (el
+nombre de su grupo: 'vendedor', 'administrador' o None). Se resuelven recién al
+usarse, con una sola consulta que une auth_user, empleados y auth_user_groups, y
+el resultado queda en la sesión. Cada usuario tiene un número de versión en la
+caché compartida: guardar o borrar su usuario, su empleado o sus grupos (p. ej.
+con `EditarEmpleadoForm` o al activarlo/desactivarlo) cambia la versión y la
+próxima petición de cualquiera de sus sesiones vuelve a consultar.
+"""
+import uuid
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils.functional import SimpleLazyObject
+from .models import AuthUser, AuthUserGroups, Empleados
+
+CLAVE_SESION = 'perfil'
+# La contraseña y las fechas no se guardan en la sesión; quedan diferidas en la instancia
+CAMPOS_USUARIO = ['id', 'username', 'first_name', 'last_name', 'email', 'is_superuser', 'is_staff', 'is_active']
+CAMPOS_EMPLEADO = ['id_empleado', 'nombre', 'edad', 'telefono', 'correo', 'direccion', 'apellido']
+
+
+def _clave_version(id_user):
+    return f'perfil:{id_user}:version'
+
+
+def invalidar(id_user):
+    """Obliga a todas las sesiones del usuario a volver a leer su empleado y su rol"""
+    cache.set(_clave_version(id_user), uuid.uuid4().hex, None)
+
+
+def version(id_user):
+    """Versión vigente de los datos de autorización del usuario (perfil y permisos)"""
+    clave = _clave_version(id_user)
+    valor = cache.get(clave)
+    if valor is None:
+        cache.add(clave, uuid.uuid4().hex, None)
+        valor = cache.get(clave)
+    return valor
+
+
+def _consultar(id_user):
+    """Datos del usuario, de su empleado y su rol con una sola consulta (None si no existe)"""
+    fila = (
+        AuthUser.objects.filter(id=id_user)
+        .values(
+            *CAMPOS_USUARIO,
+            *[f'empleados__{campo}' for campo in CAMPOS_EMPLEADO],
+            'authusergroups__group__name',
+        )
+        .order_by('authusergroups__group__name')
+        .first()
+    )
+    if fila is None:
+        return None
+    return {
+        'usuario': {campo: fila[campo] for campo in CAMPOS_USUARIO},
+        'empleado': (
+            {campo: fila[f'empleados__{campo}'] for campo in CAMPOS_EMPLEADO}
+            if fila['empleados__id_empleado'] is not None else None
+        ),
+        'rol': fila['authusergroups__group__name'],
+    }
+
+
+def perfil(request):
+    """Datos del perfil del usuario de la petición, desde la sesión si siguen vigentes"""
+    if hasattr(request, '_perfil'):
+        return request._perfil
+    datos = None
+    if request.user.is_authenticated:
+        version_actual = version(request.user.pk)
+        guardado = request.session.get(CLAVE_SESION)
+        if guardado and guardado['version'] == version_actual and guardado['id_user'] == request.user.pk:
+            datos = guardado
+        else:
+            datos = _consultar(request.user.pk)
+            if datos is not None:
+                datos.update(version=version_actual, id_user=request.user.pk)
+                request.session[CLAVE_SESION] = datos
+    request._perfil = datos
+    return datos
+
+
+def _instancia(modelo, valores):
+    # from_db espera los valores en el orden de los campos del modelo
+    campos = [campo.attname for campo in modelo._meta.concrete_fields if campo.attname in valores]
+    return modelo.from_db('default', campos, [valores[campo] for campo in campos])
+
+
+def _empleado(request):
+    datos = perfil(request)
+    if not datos or datos['empleado'] is None:
+        return None
+    usuario = _instancia(AuthUser, datos['usuario'])
+    empleado = _instancia(Empleados, {**datos['empleado'], 'id_user': usuario.id})
+    empleado.id_user = usuario
+    return empleado
+
+
+class PerfilMiddleware:
+    """Agrega `request.empleado` y `request.rol`; va después de `AuthenticationMiddleware`
+
+    Los dos se resuelven al usarse, así que en una vista async solo pueden leerse
+    dentro de `sync_to_async` (p. ej. al renderizar la plantilla).
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.empleado = SimpleLazyObject(lambda: _empleado(request))
+        request.rol = SimpleLazyObject(lambda: (perfil(request) or {}).get('rol'))
+        return self.get_response(request)
+
+
+@receiver(post_save, sender=AuthUser)
+@receiver(post_delete, sender=AuthUser)
+def _al_cambiar_usuario(sender, instance, **kwargs):
+    transaction.on_commit(lambda: invalidar(instance.pk))
+
+
+@receiver(post_save, sender=Empleados)
+@receiver(post_delete, sender=Empleados)
+@receiver(post_save, sender=AuthUserGroups)
+@receiver(post_delete, sender=AuthUserGroups)
+def _al_cambiar_empleado_o_grupo(sender, instance, **kwargs):
+    id_user = instance.id_user_id if sender is Empleados else instance.user_id
+    transaction.on_commit(lambda: invalidar(id_user))
@@ -5,6 +5,9 @@
 #   * Make sure each ForeignKey and OneToOneField has `on_delete` set to the desired behavior
 #   * Remove `managed = False` lines if you wish to allow Django to create, modify, and delete the table
 # Feel free to rename the models, but don't rename db_table values or field names.
+#
+# Los `indexes` de los modelos `managed = False` no los crean las migraciones:
+# se aplican con `python manage.py crear_indices` (ver Task/indices.py).
 from django.db import models
 
 
@@ -86,6 +89,7 @@ class Cajas(models.Model):
     class Meta:
         managed = False
         db_table = 'cajas'
+        indexes = [models.Index(fields=['id_sucursal', 'estado'], name='cajas_sucursal_estado')]
 
 
 class DetallesVenta(models.Model):
@@ -98,6 +102,7 @@ class DetallesVenta(models.Model):
     class Meta:
         managed = False
         db_table = 'detalles_venta'
+        indexes = [models.Index(fields=['id_producto', 'id_venta'], name='detalles_producto_venta')]
 
 
 class DjangoAdminLog(models.Model):
@@ -170,6 +175,7 @@ class Gastos(models.Model):
     class Meta:
         managed = False
         db_table = 'gastos'
+        indexes = [models.Index(fields=['id_turno', 'monto'], name='gastos_turno_monto')]
 
 
 class Productos(models.Model):
@@ -183,6 +189,7 @@ class Productos(models.Model):
     class Meta:
         managed = True  # Changed to True so Django can manage this model
         db_table = 'productos'
+        indexes = [models.Index(fields=['stock', 'stock_minimo'], name='productos_stock_minimo')]
         
     def __str__(self):
         return self.nombre_producto
@@ -226,6 +233,10 @@ class TurnosCaja(models.Model):
     class Meta:
         managed = False
         db_table = 'turnos_caja'
+        indexes = [
+            models.Index(fields=['id_caja', 'fecha_cierre'], name='turnos_caja_cierre'),
+            models.Index(fields=['fecha_cierre', 'fecha_apertura'], name='turnos_cierre_apertura'),
+        ]
 
 
 class Ventas(models.Model):
@@ -238,3 +249,102 @@ class Ventas(models.Model):
     class Meta:
         managed = False
         db_table = 'ventas'
+        indexes = [
+            models.Index(fields=['fecha_venta', 'id_venta'], name='ventas_fecha_id'),
+            models.Index(fields=['id_turno', 'total_venta'], name='ventas_turno_total'),
+        ]
+
+
+# ===== TABLAS DE RESUMEN (se actualizan en la misma transacción que cada venta) =====
+
+class ResumenVentasDiario(models.Model):
+    fecha = models.DateField()
+    id_sucursal = models.ForeignKey(Sucursales, models.DO_NOTHING, db_column='id_sucursal')
+    id_caja = models.ForeignKey(Cajas, models.DO_NOTHING, db_column='id_caja')
+    id_turno = models.ForeignKey(TurnosCaja, models.DO_NOTHING, db_column='id_turno')
+    num_ventas = models.IntegerField(default=0)
+    total_ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'resumen_ventas_diario'
+        unique_together = (('fecha', 'id_sucursal', 'id_caja', 'id_turno'),)
+
+
+class ResumenProductoDiario(models.Model):
+    fecha = models.DateField()
+    id_producto = models.ForeignKey(Productos, models.DO_NOTHING, db_column='id_producto')
+    cantidad = models.IntegerField(default=0)
+    total_ventas = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'resumen_producto_diario'
+        unique_together = (('fecha', 'id_producto'),)
+
+
+class VentaIdempotencia(models.Model):
+    """Clave generada por la terminal para cada venta; el índice único evita duplicados al reintentar"""
+    clave = models.CharField(max_length=64, unique=True)
+    id_venta = models.ForeignKey(Ventas, models.DO_NOTHING, db_column='id_venta')
+    fecha_registro = models.DateTimeField()
+
+    class Meta:
+        managed = True
+        db_table = 'ventas_idempotencia'
+
+
+# ===== MOVIMIENTOS DE STOCK =====
+# `Productos.stock` solo cambia a través de un movimiento (ver Task/movimientos.py).
+# Las fotos guardan el stock de cada producto en una fecha de corte, para que
+# reconstruir el stock de una fecha no obligue a sumar toda la historia.
+
+class MovimientoStock(models.Model):
+    TIPOS = [
+        ('venta', 'Venta'),
+        ('reposicion', 'Reposición'),
+        ('ajuste', 'Ajuste'),
+        ('devolucion', 'Devolución'),
+    ]
+
+    id_movimiento = models.BigAutoField(primary_key=True)
+    id_producto = models.ForeignKey(Productos, models.DO_NOTHING, db_column='id_producto')
+    tipo = models.CharField(max_length=20, choices=TIPOS)
+    cantidad = models.IntegerField(help_text='Positiva si entra stock, negativa si sale')
+    fecha = models.DateTimeField()
+    id_venta = models.ForeignKey(Ventas, models.DO_NOTHING, db_column='id_venta', blank=True, null=True)
+    id_user = models.ForeignKey(AuthUser, models.DO_NOTHING, db_column='id_user', blank=True, null=True)
+    nota = models.CharField(max_length=255, blank=True, null=True)
+
+    class Meta:
+        managed = True
+        db_table = 'movimientos_stock'
+        indexes = [models.Index(fields=['id_producto', 'fecha'], name='movimientos_producto_fecha')]
+
+
+class FotoStock(models.Model):
+    fecha = models.DateTimeField(help_text='Incluye los movimientos con fecha menor o igual')
+    id_producto = models.ForeignKey(Productos, models.DO_NOTHING, db_column='id_producto')
+    stock = models.IntegerField()
+
+    class Meta:
+        managed = True
+        db_table = 'fotos_stock'
+        unique_together = (('id_producto', 'fecha'),)
+
+
+class PronosticoProducto(models.Model):
+    """Pronóstico de demanda por producto, recalculado cada noche (Task/pronosticos.py)"""
+    id_producto = models.OneToOneField(Productos, models.DO_NOTHING, db_column='id_producto', primary_key=True)
+    fecha_calculo = models.DateTimeField()
+    stock = models.IntegerField(help_text='Stock al momento del cálculo')
+    velocidad_diaria = models.FloatField()
+    media_movil_7 = models.FloatField()
+    dias_hasta_agotar = models.FloatField(blank=True, null=True, help_text='Vacío si el producto no tiene ventas')
+    fecha_agotamiento = models.DateField(blank=True, null=True)
+    cantidad_sugerida = models.IntegerField(default=0)
+
+    class Meta:
+        managed = True
+        db_table = 'pronosticos_productos'
+        indexes = [models.Index(fields=['dias_hasta_agotar'], name='pronosticos_dias_agotar')]
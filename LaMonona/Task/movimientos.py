@@ -0,0 +1,153 @@
+"""Libro de movimientos de stock.
+
+Todo cambio de `Productos.stock` (ventas, reposiciones, ajustes y devoluciones) se
+registra como un `MovimientoStock` y se aplica con un UPDATE relativo
+(`stock = stock + cantidad`), así que dos cambios simultáneos sobre el mismo
+producto se suman en lugar de pisarse. Los movimientos no se borran: al borrar
+una venta se registra su devolución y sus movimientos quedan sin venta. Solo al
+eliminar un producto sin ventas se van con él (`olvidar_producto`). `compactar`
+guarda fotos periódicas del stock para que `stock_en` pueda reconstruir una fecha
+pasada sumando solo los movimientos posteriores a la foto.
+"""
+from datetime import datetime
+
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Q, Subquery, Sum, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+from . import avisos, etiquetas
+from .models import FotoStock, MovimientoStock, Productos
+
+VENTA = 'venta'
+REPOSICION = 'reposicion'
+AJUSTE = 'ajuste'
+DEVOLUCION = 'devolucion'
+
+
+class StockInsuficiente(Exception):
+    """Algún producto de los movimientos quedaría con stock negativo"""
+
+
+def aplicar(movimientos):
+    """Aplica y registra una lista de `MovimientoStock` sin guardar.
+
+    El stock de todos los productos se actualiza con un solo UPDATE condicional. Si
+    algún producto quedaría negativo se lanza `StockInsuficiente`: los demás ya se
+    actualizaron, así que debe llamarse dentro de `transaction.atomic()` para que la
+    excepción deshaga también el resto de la operación. Los productos que cambian de
+    estado (stock bajo, sin stock o repuesto) se publican en `avisos` al confirmar la
+    transacción.
+    """
+    if not movimientos:
+        return
+    deltas = {}
+    for movimiento in movimientos:
+        deltas[movimiento.id_producto_id] = deltas.get(movimiento.id_producto_id, 0) + movimiento.cantidad
+
+    # Se agrupan los productos por cantidad: la consulta crece con las cantidades distintas, no con los productos
+    por_delta = {}
+    for id_producto, delta in deltas.items():
+        por_delta.setdefault(delta, []).append(id_producto)
+    condicion = Q()
+    for delta, ids in por_delta.items():
+        condicion |= Q(id_producto__in=ids, stock__gte=-delta) if delta < 0 else Q(id_producto__in=ids)
+    cambio = Case(
+        *[When(id_producto__in=ids, then=Value(delta)) for delta, ids in por_delta.items()],
+        output_field=IntegerField(),
+    )
+    if Productos.objects.filter(condicion).update(stock=F('stock') + cambio) != len(deltas):
+        raise StockInsuficiente()
+
+    ahora = timezone.now()
+    for movimiento in movimientos:
+        movimiento.fecha = movimiento.fecha or ahora
+    MovimientoStock.objects.bulk_create(movimientos)
+    # El update() ya cambia la etiqueta de la tabla; estas son las de cada producto
+    etiquetas.invalidar_al_confirmar(*(f'producto:{id_producto}' for id_producto in deltas))
+
+    cambios = avisos.cambios_de_estado(
+        (id_producto, nombre, stock - deltas[id_producto], stock, minimo)
+        for id_producto, nombre, stock, minimo in Productos.objects.filter(id_producto__in=deltas).values_list(
+            'id_producto', 'nombre_producto', 'stock', 'stock_minimo'
+        )
+    )
+    if cambios:
+        transaction.on_commit(lambda: avisos.publicar(cambios))
+
+
+def ajustar(id_producto, cantidad, tipo=AJUSTE, id_user=None, nota=None):
+    """Suma `cantidad` (puede ser negativa) al stock de un producto; `StockInsuficiente` si quedaría negativo"""
+    with transaction.atomic():
+        aplicar([MovimientoStock(
+            id_producto_id=id_producto, tipo=tipo, cantidad=cantidad, id_user_id=id_user, nota=nota,
+        )])
+
+
+def olvidar_producto(id_producto):
+    """Borra los movimientos y fotos de un producto que se va a eliminar (en la misma transacción)"""
+    MovimientoStock.objects.filter(id_producto=id_producto).delete()
+    FotoStock.objects.filter(id_producto=id_producto).delete()
+
+
+# ===== RECONSTRUCCIÓN Y FOTOS =====
+
+def _suma_movimientos(**filtros):
+    return Coalesce(
+        Subquery(
+            MovimientoStock.objects.filter(id_producto=OuterRef('id_producto'), **filtros)
+            .order_by()
+            .values('id_producto')
+            .annotate(total=Sum('cantidad'))
+            .values('total')[:1],
+            output_field=IntegerField(),
+        ),
+        Value(0),
+    )
+
+
+def _stock_al_corte(fecha):
+    """Stock al corte calculado hacia atrás: stock actual menos lo que se movió después"""
+    return F('stock') - _suma_movimientos(fecha__gt=fecha)
+
+
+def stock_en(fecha, productos=None):
+    """{id_producto: stock} al momento `fecha`, con una sola consulta.
+
+    Parte de la última foto anterior a `fecha` y suma los movimientos entre la foto y
+    `fecha`. Los productos sin foto previa se calculan desde el stock actual restando
+    los movimientos posteriores.
+    """
+    fotos = FotoStock.objects.filter(id_producto=OuterRef('id_producto'), fecha__lte=fecha).order_by('-fecha')
+    queryset = Productos.objects.annotate(
+        fecha_foto=Subquery(fotos.values('fecha')[:1]),
+        stock_foto=Subquery(fotos.values('stock')[:1]),
+    ).annotate(
+        stock_en_fecha=Case(
+            When(fecha_foto__isnull=True, then=_stock_al_corte(fecha)),
+            default=F('stock_foto') + _suma_movimientos(fecha__gt=OuterRef('fecha_foto'), fecha__lte=fecha),
+            output_field=IntegerField(),
+        )
+    )
+    if productos is not None:
+        queryset = queryset.filter(id_producto__in=productos)
+    return dict(queryset.values_list('id_producto', 'stock_en_fecha'))
+
+
+def compactar(corte=None):
+    """Guarda una foto del stock de cada producto al `corte` (por defecto, el inicio de hoy).
+
+    El stock de la foto se calcula en la misma consulta que lee el stock actual, así
+    que es consistente aunque haya ventas en curso. Si ya existía una foto para ese
+    corte no se duplica. Devuelve el número de fotos creadas.
+    """
+    if corte is None:
+        corte = timezone.make_aware(datetime.combine(timezone.localdate(), datetime.min.time()))
+    existentes = set(FotoStock.objects.filter(fecha=corte).values_list('id_producto_id', flat=True))
+    fotos = [
+        FotoStock(fecha=corte, id_producto_id=id_producto, stock=stock)
+        for id_producto, stock in Productos.objects.annotate(al_corte=_stock_al_corte(corte))
+        .values_list('id_producto', 'al_corte')
+        if id_producto not in existentes
+    ]
+    FotoStock.objects.bulk_create(fotos, batch_size=1000, ignore_conflicts=True)
+    return len(fotos)
@@ -0,0 +1,113 @@
+"""Permisos efectivos de cada usuario guardados en la caché compartida.
+
+`ModelBackend` calcula los permisos con dos consultas (los del usuario y los de sus
+grupos) la primera vez que cada petición pregunta por uno. `PermisosCacheBackend`
+guarda el conjunto ya calculado en la caché bajo una clave que incluye dos
+versiones: la del usuario (la misma de `middleware`, que cambia con su usuario,
+sus grupos o sus permisos directos) y una global que cambia cuando se modifican
+los permisos de algún grupo. Con la caché caliente, `@permission_required` y
+`user.has_perm` no consultan la base.
+
+El rol del usuario ya está en `request.rol`, guardado en la sesión con la misma
+versión por usuario.
+"""
+import uuid
+
+from django.contrib.auth.backends import ModelBackend
+from django.contrib.auth.models import Group, Permission, User
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import m2m_changed, post_delete, post_migrate, post_save
+from django.dispatch import receiver
+from . import middleware
+from .models import AuthGroupPermissions, AuthPermission, AuthUserUserPermissions
+
+CLAVE_VERSION_GLOBAL = 'permisos:version'
+DURACION = 60 * 60 * 24
+
+
+def invalidar_todos():
+    """Obliga a recalcular los permisos de todos los usuarios"""
+    cache.set(CLAVE_VERSION_GLOBAL, uuid.uuid4().hex, None)
+
+
+def _version_global():
+    version = cache.get(CLAVE_VERSION_GLOBAL)
+    if version is None:
+        cache.add(CLAVE_VERSION_GLOBAL, uuid.uuid4().hex, None)
+        version = cache.get(CLAVE_VERSION_GLOBAL)
+    return version
+
+
+def _clave(id_user):
+    return f'permisos:{id_user}:{middleware.version(id_user)}:{_version_global()}'
+
+
+class PermisosCacheBackend(ModelBackend):
+    """`ModelBackend` que lee el conjunto de permisos de la caché compartida"""
+
+    def get_all_permissions(self, user_obj, obj=None):
+        if not user_obj.is_active or user_obj.is_anonymous or obj is not None:
+            return set()
+        if not hasattr(user_obj, '_perm_cache'):
+            clave = _clave(user_obj.pk)
+            permisos = cache.get(clave)
+            if permisos is None:
+                permisos = super().get_all_permissions(user_obj)
+                cache.set(clave, permisos, DURACION)
+            user_obj._perm_cache = permisos
+        return user_obj._perm_cache
+
+
+def _invalidar_al_confirmar(ids_user):
+    ids_user = list(ids_user)
+    transaction.on_commit(lambda: [middleware.invalidar(id_user) for id_user in ids_user])
+
+
+@receiver(post_save, sender=AuthUserUserPermissions)
+@receiver(post_delete, sender=AuthUserUserPermissions)
+def _al_cambiar_permiso_de_usuario(sender, instance, **kwargs):
+    _invalidar_al_confirmar([instance.user_id])
+
+
+@receiver(post_save, sender=User)
+def _al_guardar_usuario(sender, instance, update_fields=None, **kwargs):
+    # Cada inicio de sesión guarda last_login; eso no cambia permisos
+    if update_fields is None or set(update_fields) != {'last_login'}:
+        _invalidar_al_confirmar([instance.pk])
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+@receiver(m2m_changed, sender=User.user_permissions.through)
+def _al_cambiar_usuario(sender, instance, action, reverse, pk_set, **kwargs):
+    # Desde el admin de Django (User.groups / User.user_permissions), en cualquier sentido
+    if not action.startswith('post_'):
+        return
+    if not reverse:
+        _invalidar_al_confirmar([instance.pk])
+    elif action == 'post_clear':
+        transaction.on_commit(invalidar_todos)
+    else:
+        _invalidar_al_confirmar(pk_set)
+
+
+@receiver(m2m_changed, sender=Group.permissions.through)
+def _al_cambiar_permisos_de_grupo(sender, action, **kwargs):
+    if action.startswith('post_'):
+        transaction.on_commit(invalidar_todos)
+
+
+@receiver(post_save, sender=AuthGroupPermissions)
+@receiver(post_delete, sender=AuthGroupPermissions)
+@receiver(post_save, sender=AuthPermission)
+@receiver(post_delete, sender=AuthPermission)
+@receiver(post_delete, sender=Group)
+@receiver(post_delete, sender=Permission)
+def _al_cambiar_permisos(sender, **kwargs):
+    transaction.on_commit(invalidar_todos)
+
+
+@receiver(post_migrate)
+def _al_migrar(sender, **kwargs):
+    # migrate crea permisos con bulk_create, que no dispara señales
+    invalidar_todos()
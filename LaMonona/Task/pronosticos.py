@@ -0,0 +1,133 @@
+"""Pronóstico de reposición: velocidad de venta y días hasta agotar cada producto.
+
+Las ventas diarias salen de `ResumenProductoDiario` (una consulta para todo el
+catálogo) y se arman en una matriz productos x días; todos los cálculos se hacen
+sobre esa matriz con NumPy, sin recorrer productos en Python. El resultado se
+guarda en `PronosticoProducto` con el comando `calcular_pronosticos` (cada noche),
+y el dashboard solo lee esa tabla.
+"""
+import math
+from datetime import timedelta
+
+import numpy as np
+from django.db import transaction
+from django.utils import timezone
+from .etiquetas import cacheado
+from .models import Productos, PronosticoProducto, ResumenProductoDiario
+
+DIAS_HISTORIA = 91         # 13 semanas completas: cada día de la semana aparece las mismas veces
+VENTANA_CORTA = 7
+VENTANA_LARGA = 28
+PLAZO_ENTREGA_DIAS = 3
+DIAS_COBERTURA = 14
+Z_SERVICIO = 1.65          # ~95 % de probabilidad de no quedarse sin stock durante la entrega
+# Con pocas ventas el patrón semanal es ruido: los factores se acercan a 1 hasta juntar estas unidades
+VENTAS_PARA_ESTACIONALIDAD = 28
+
+
+def matriz_ventas(hasta, dias=DIAS_HISTORIA):
+    """(ids, stock, ventas, primer_dia): `ventas[i, d]` son las unidades del producto `ids[i]` el día `primer_dia + d`"""
+    primer_dia = hasta - timedelta(days=dias - 1)
+    productos = list(Productos.objects.order_by('id_producto').values_list('id_producto', 'stock'))
+    ids = np.array([id_producto for id_producto, _ in productos], dtype=np.int64)
+    stock = np.array([stock for _, stock in productos], dtype=float)
+    ventas = np.zeros((len(ids), dias))
+
+    filas = list(
+        ResumenProductoDiario.objects.filter(fecha__range=(primer_dia, hasta))
+        .values_list('id_producto_id', 'fecha', 'cantidad')
+    )
+    if filas and len(ids):
+        de_producto, fechas, cantidades = zip(*filas)
+        de_producto = np.array(de_producto, dtype=np.int64)
+        posicion = np.minimum(np.searchsorted(ids, de_producto), len(ids) - 1)
+        existe = ids[posicion] == de_producto  # un producto borrado puede seguir en el resumen
+        columna = np.array([fecha.toordinal() for fecha in fechas]) - primer_dia.toordinal()
+        np.add.at(ventas, (posicion[existe], columna[existe]), np.array(cantidades, dtype=float)[existe])
+    return ids, stock, ventas, primer_dia
+
+
+def calcular(stock, ventas, primer_dia):
+    """Pronóstico vectorizado a partir de la matriz de ventas diarias.
+
+    Devuelve un dict de arreglos (uno por producto): `velocidad_diaria`,
+    `media_movil_7`, `dias_hasta_agotar` (NaN sin ventas) y `cantidad_sugerida`.
+    """
+    dias = ventas.shape[1]
+    larga = ventas[:, -VENTANA_LARGA:]
+    media_movil = ventas[:, -VENTANA_CORTA:].mean(axis=1)
+    velocidad = (media_movil + larga.mean(axis=1)) / 2
+    desviacion = larga.std(axis=1)
+
+    # Estacionalidad semanal: promedio de cada día de la semana respecto del promedio general
+    dia_semana = (np.arange(dias) + primer_dia.weekday()) % 7
+    por_dia = np.stack([ventas[:, dia_semana == dia].mean(axis=1) for dia in range(7)], axis=1)
+    media = ventas.mean(axis=1, keepdims=True)
+    factores = np.divide(por_dia, media, out=np.ones_like(por_dia), where=media > 0)
+    peso = np.minimum(ventas.sum(axis=1, keepdims=True) / VENTAS_PARA_ESTACIONALIDAD, 1)
+    factores = peso * factores + (1 - peso)
+
+    # Demanda de los próximos 7 días (el día 1 es hoy). El stock dura `k` semanas
+    # completas, más los días de la semana siguiente cuya demanda acumulada no llega
+    # al resto, más el día en que ese resto se termina
+    siguientes = (primer_dia.weekday() + dias + np.arange(7)) % 7
+    semana = velocidad[:, None] * factores[:, siguientes]
+    demanda_semanal = semana.sum(axis=1)
+    con_ventas = demanda_semanal > 0
+    semanas = np.floor(np.divide(stock, demanda_semanal, out=np.zeros_like(stock), where=con_ventas))
+    resto = stock - semanas * demanda_semanal
+    hay_resto = resto > 1e-9
+    dias_cubiertos = (np.cumsum(semana, axis=1) < resto[:, None] - 1e-9).sum(axis=1)
+    dias_hasta_agotar = np.where(con_ventas, semanas * 7 + dias_cubiertos + hay_resto, np.nan)
+
+    horizonte = PLAZO_ENTREGA_DIAS + DIAS_COBERTURA
+    objetivo = velocidad * horizonte + Z_SERVICIO * desviacion * math.sqrt(PLAZO_ENTREGA_DIAS)
+    cantidad_sugerida = np.maximum(np.ceil(objetivo - stock), 0).astype(int)
+
+    return {
+        'velocidad_diaria': velocidad,
+        'media_movil_7': media_movil,
+        'dias_hasta_agotar': dias_hasta_agotar,
+        'cantidad_sugerida': cantidad_sugerida,
+    }
+
+
+def recalcular(hasta=None):
+    """Recalcula y reemplaza la tabla de pronósticos; por defecto usa las ventas hasta ayer"""
+    hoy = timezone.localdate()
+    hasta = hasta or hoy - timedelta(days=1)
+    ids, stock, ventas, primer_dia = matriz_ventas(hasta)
+    resultado = calcular(stock, ventas, primer_dia)
+
+    ahora = timezone.now()
+    pronosticos = []
+    for i, id_producto in enumerate(ids.tolist()):
+        dias = resultado['dias_hasta_agotar'][i]
+        sin_ventas = bool(np.isnan(dias))
+        pronosticos.append(PronosticoProducto(
+            id_producto_id=id_producto,
+            fecha_calculo=ahora,
+            stock=int(stock[i]),
+            velocidad_diaria=round(float(resultado['velocidad_diaria'][i]), 4),
+            media_movil_7=round(float(resultado['media_movil_7'][i]), 4),
+            dias_hasta_agotar=None if sin_ventas else float(dias),
+            fecha_agotamiento=None if sin_ventas else hasta + timedelta(days=max(int(dias), 1)),
+            cantidad_sugerida=int(resultado['cantidad_sugerida'][i]),
+        ))
+    with transaction.atomic():
+        PronosticoProducto.objects.all().delete()
+        PronosticoProducto.objects.bulk_create(pronosticos, batch_size=1000)
+    return len(pronosticos)
+
+
+@cacheado(['pronosticos_productos', 'productos'])
+def proximos_a_agotarse(limite=10):
+    """Productos con menos días de stock según el último cálculo (para el dashboard)"""
+    return list(
+        PronosticoProducto.objects.filter(dias_hasta_agotar__isnull=False)
+        .order_by('dias_hasta_agotar')
+        .values(
+            'id_producto', 'id_producto__nombre_producto', 'stock', 'velocidad_diaria',
+            'dias_hasta_agotar', 'fecha_agotamiento', 'cantidad_sugerida', 'fecha_calculo',
+        )[:limite]
+    )
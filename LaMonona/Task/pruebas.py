@@ -0,0 +1,60 @@
+"""Utilidades para las pruebas: runner con tablas de prueba y presupuestos de consultas."""
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from . import metricas
+
+APPS_PROPIAS = ['Task', 'CajasApp', 'VentasApp']
+
+
+class ModelosGestionadosRunner(DiscoverRunner):
+    """Crea en la base de prueba las tablas de los modelos `managed = False`.
+
+    Los modelos salen de `inspectdb` y las migraciones no se versionan, así que
+    las tablas de las apps propias se crean directamente desde los modelos. La
+    caché de prueba es en memoria para no mezclarse con la del servidor.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        self._cache_en_memoria = override_settings(
+            CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+        )
+        self._cache_en_memoria.enable()
+        for modelo in apps.get_models():
+            # auth_* y django_* ya las crean las apps de Django
+            if not modelo._meta.managed and not modelo._meta.db_table.startswith(('auth_', 'django_')):
+                modelo._meta.managed = True
+        settings.MIGRATION_MODULES = {**settings.MIGRATION_MODULES, **{app: None for app in APPS_PROPIAS}}
+        super().setup_test_environment(**kwargs)
+
+    def teardown_test_environment(self, **kwargs):
+        super().teardown_test_environment(**kwargs)
+        self._cache_en_memoria.disable()
+
+
+class PresupuestoConsultasMixin:
+    """Para `TestCase`: verifica que una petición no supere el presupuesto de su vista"""
+
+    @contextmanager
+    def assertPresupuesto(self, vista):
+        with CaptureQueriesContext(connection) as consultas:
+            yield
+        limite = metricas.presupuesto(vista)
+        detalle = '\n'.join(consulta['sql'] for consulta in consultas.captured_queries)
+        self.assertLessEqual(
+            len(consultas), limite,
+            f'La vista {vista} hizo {len(consultas)} consultas (presupuesto: {limite}):\n{detalle}',
+        )
+
+    def get_con_presupuesto(self, vista, args=None, datos=None, estado=200):
+        """GET a la vista por su nombre; verifica el estado, la vista resuelta y el presupuesto"""
+        with self.assertPresupuesto(vista):
+            respuesta = self.client.get(reverse(vista, args=args), datos)
+        self.assertEqual(respuesta.status_code, estado)
+        self.assertEqual(respuesta.resolver_match.view_name, vista)
+        return respuesta
@@ -0,0 +1,110 @@
+"""Caché en memoria de datos de referencia: sucursales, cajas y su estado.
+
+Son tablas chicas que cambian poco pero se leen en casi todas las pantallas de
+cajas. Cada proceso guarda una copia y la compara contra un número de versión en
+la caché compartida (`settings.CACHES['default']`); cualquier save/delete de
+`Sucursales`, `Cajas` o `TurnosCaja` cambia la versión y todos los procesos
+recargan la copia en su siguiente lectura, sin reiniciar.
+"""
+import threading
+import uuid
+from collections import namedtuple
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import Cajas, Sucursales, TurnosCaja
+
+CLAVE_VERSION = 'referencias:version'
+
+Sucursal = namedtuple('Sucursal', 'id_sucursal nombre_sucursal direccion')
+Caja = namedtuple('Caja', 'id_caja id_sucursal nombre_sucursal ubicacion estado id_turno_abierto')
+
+_lock = threading.Lock()
+_copia = {'version': None, 'sucursales': {}, 'cajas': {}}
+
+
+def invalidar():
+    """Cambia la versión para que todos los procesos recarguen los datos de referencia"""
+    cache.set(CLAVE_VERSION, uuid.uuid4().hex, None)
+
+
+def _datos():
+    version = cache.get(CLAVE_VERSION)
+    if version is None:
+        cache.add(CLAVE_VERSION, uuid.uuid4().hex, None)
+        version = cache.get(CLAVE_VERSION)
+    if version == _copia['version']:
+        return _copia
+
+    with _lock:
+        if version != _copia['version']:
+            sucursales = {
+                fila[0]: Sucursal(*fila)
+                for fila in Sucursales.objects.order_by('id_sucursal').values_list('id_sucursal', 'nombre_sucursal', 'direccion')
+            }
+            turnos_abiertos = dict(
+                TurnosCaja.objects.filter(fecha_cierre__isnull=True).values_list('id_caja_id', 'id_turno')
+            )
+            cajas = {
+                id_caja: Caja(
+                    id_caja,
+                    id_sucursal,
+                    sucursales[id_sucursal].nombre_sucursal if id_sucursal in sucursales else '',
+                    ubicacion,
+                    estado,
+                    turnos_abiertos.get(id_caja),
+                )
+                for id_caja, id_sucursal, ubicacion, estado in Cajas.objects.order_by('id_caja').values_list(
+                    'id_caja', 'id_sucursal_id', 'ubicacion', 'estado'
+                )
+            }
+            _copia.update(version=version, sucursales=sucursales, cajas=cajas)
+    return _copia
+
+
+def sucursales():
+    return list(_datos()['sucursales'].values())
+
+
+def cajas():
+    return list(_datos()['cajas'].values())
+
+
+def sucursal(id_sucursal):
+    return _datos()['sucursales'].get(id_sucursal)
+
+
+def caja(id_caja):
+    return _datos()['cajas'].get(id_caja)
+
+
+# ===== Para formularios: opciones y conversión a instancias sin consultar la base =====
+
+def opciones_sucursales():
+    return [(s.id_sucursal, s.nombre_sucursal) for s in sucursales()]
+
+
+def opciones_cajas():
+    return [(c.id_caja, f'Caja #{c.id_caja} - {c.nombre_sucursal} ({c.ubicacion or "sin ubicación"})') for c in cajas()]
+
+
+def instancia_sucursal(valor):
+    datos = sucursal(int(valor))
+    return Sucursales(**datos._asdict()) if datos else None
+
+
+def instancia_caja(valor):
+    datos = caja(int(valor))
+    if datos is None:
+        return None
+    return Cajas(id_caja=datos.id_caja, id_sucursal_id=datos.id_sucursal, ubicacion=datos.ubicacion, estado=datos.estado)
+
+
+@receiver([post_save, post_delete], sender=Sucursales)
+@receiver([post_save, post_delete], sender=Cajas)
+@receiver([post_save, post_delete], sender=TurnosCaja)
+def _al_cambiar(sender, **kwargs):
+    # Después del commit: si se invalida antes, otro proceso podría recargar los datos viejos
+    transaction.on_commit(invalidar)
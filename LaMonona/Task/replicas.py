@@ -0,0 +1,318 @@
+"""Lecturas de reportes en una réplica de solo lectura (alias `reporting`).
+
+Las vistas de reportes, exportaciones y dashboards se marcan con `@de_reporte`.
+Mientras corren, `ReporteRouter` manda sus lecturas al alias `reporting`; todo
+lo demás (y toda escritura) va a `default`. Se lee del primario aunque la vista
+sea de reporte cuando:
+
+- no hay réplica configurada (`DATABASES['reporting']`);
+- hay una transacción abierta en `default`;
+- la petición ya escribió, o la sesión escribió hace menos de
+  `REPLICA_RETRASO_MAXIMO` segundos (así quien registra una venta la ve en su
+  reporte aunque la réplica todavía no la tenga);
+- el retraso de la réplica (`SHOW REPLICA STATUS`, consultado como mucho cada
+  `REPLICA_VERIFICAR_CADA` segundos por proceso) supera `REPLICA_RETRASO_MAXIMO`
+  o no se puede conocer.
+
+Para probar en local, `sincronizar_replica` copia los datos de `default` a una
+segunda base (SQLite o MySQL) configurada como `reporting`.
+"""
+import functools
+import logging
+import re
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.apps import apps
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections, transaction
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from django.http import StreamingHttpResponse
+
+logger = logging.getLogger(__name__)
+
+ALIAS = 'reporting'
+CLAVE_SESION = 'replica:primario_hasta'
+RETRASO_MAXIMO = 5  # segundos
+VERIFICAR_CADA = 10  # segundos
+TAMANO_LOTE = 5000
+
+_ESCRITURA = re.compile(r'\s*(INSERT|UPDATE|DELETE|REPLACE)\b', re.IGNORECASE)
+
+_reporte = ContextVar('lectura_de_reporte', default=False)
+_peticion = ContextVar('peticion_replica', default=None)
+_lock = threading.Lock()
+_verificacion = {'hasta': 0.0, 'al_dia': False}
+
+
+class Peticion:
+    """Si la petición actual debe leer del primario"""
+
+    def __init__(self, fijada=False):
+        self.fijada = fijada
+        self.escribio = False
+
+
+def hay_replica():
+    return ALIAS in settings.DATABASES
+
+
+def retraso_maximo():
+    return getattr(settings, 'REPLICA_RETRASO_MAXIMO', RETRASO_MAXIMO)
+
+
+# ===== RETRASO DE LA RÉPLICA =====
+
+def _estado_replicacion(conexion):
+    """Fila de SHOW REPLICA STATUS como dict, o None si la base no replica de nadie"""
+    with conexion.cursor() as cursor:
+        try:
+            cursor.execute('SHOW REPLICA STATUS')
+        except DatabaseError:
+            cursor.execute('SHOW SLAVE STATUS')  # MySQL anterior a 8.0.22
+        fila = cursor.fetchone()
+        if fila is None:
+            return None
+        return dict(zip([descripcion[0] for descripcion in cursor.description], fila))
+
+
+def retraso_replica():
+    """Segundos de retraso de la réplica; 0 si es una copia local sin replicación y None si no se sabe"""
+    conexion = connections[ALIAS]
+    if conexion.vendor != 'mysql':
+        return 0
+    try:
+        estado = _estado_replicacion(conexion)
+    except DatabaseError as e:
+        logger.warning('No se pudo consultar el estado de la réplica (¿falta el permiso REPLICATION CLIENT?): %s', e)
+        return None
+    if estado is None:
+        return 0
+    # NULL cuando la replicación está detenida
+    retraso = estado.get('Seconds_Behind_Source', estado.get('Seconds_Behind_Master'))
+    return None if retraso is None else int(retraso)
+
+
+def replica_al_dia():
+    """Si el retraso de la réplica está dentro de `REPLICA_RETRASO_MAXIMO` (resultado guardado unos segundos)"""
+    ahora = time.monotonic()
+    if ahora < _verificacion['hasta']:
+        return _verificacion['al_dia']
+    with _lock:
+        if ahora >= _verificacion['hasta']:
+            retraso = retraso_replica()
+            al_dia = retraso is not None and retraso <= retraso_maximo()
+            if not al_dia and _verificacion['al_dia']:
+                logger.warning('Réplica con %s s de retraso: los reportes se leen del primario', retraso)
+            _verificacion['al_dia'] = al_dia
+            _verificacion['hasta'] = ahora + getattr(settings, 'REPLICA_VERIFICAR_CADA', VERIFICAR_CADA)
+    return _verificacion['al_dia']
+
+
+# ===== ROUTER =====
+
+def alias_lectura():
+    """Alias del que leería ahora una consulta de reporte"""
+    if not _reporte.get() or not hay_replica():
+        return DEFAULT_DB_ALIAS
+    peticion = _peticion.get()
+    if peticion is not None and (peticion.fijada or peticion.escribio):
+        return DEFAULT_DB_ALIAS
+    if connections[DEFAULT_DB_ALIAS].in_atomic_block or not replica_al_dia():
+        return DEFAULT_DB_ALIAS
+    return ALIAS
+
+
+class ReporteRouter:
+    def db_for_read(self, model, **hints):
+        return alias_lectura()
+
+    def db_for_write(self, model, **hints):
+        # Explícito: sin esto, guardar una instancia leída de la réplica escribiría en ella
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return {obj1._state.db, obj2._state.db} <= {DEFAULT_DB_ALIAS, ALIAS}
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # La réplica recibe el esquema por replicación (o de `sincronizar_replica`)
+        return db != ALIAS
+
+
+@contextmanager
+def lectura_de_reporte():
+    """Las lecturas del bloque pueden ir a la réplica"""
+    token = _reporte.set(True)
+    try:
+        yield
+    finally:
+        _reporte.reset(token)
+
+
+@contextmanager
+def lectura_del_primario():
+    """Dentro de una vista de reporte, lecturas que no pueden estar atrasadas"""
+    token = _reporte.set(False)
+    try:
+        yield
+    finally:
+        _reporte.reset(token)
+
+
+def _en_contexto(contenido, peticion):
+    """Recorre un iterador de respuesta en streaming como lectura de reporte"""
+    iterador = iter(contenido)
+    while True:
+        token_reporte, token_peticion = _reporte.set(True), _peticion.set(peticion)
+        try:
+            parte = next(iterador, None)
+        finally:
+            _peticion.reset(token_peticion)
+            _reporte.reset(token_reporte)
+        if parte is None:
+            return
+        yield parte
+
+
+def de_reporte(vista):
+    """Decorador de vistas de solo lectura (reportes, exportaciones, dashboards).
+
+    Las respuestas en streaming generan su contenido después de que la vista
+    devuelve; ese recorrido también lee de la réplica.
+    """
+    if iscoroutinefunction(vista):
+        @functools.wraps(vista)
+        async def envoltura_async(request, *args, **kwargs):
+            with lectura_de_reporte():
+                return await vista(request, *args, **kwargs)
+        return envoltura_async
+
+    @functools.wraps(vista)
+    def envoltura(request, *args, **kwargs):
+        with lectura_de_reporte():
+            respuesta = vista(request, *args, **kwargs)
+        if isinstance(respuesta, StreamingHttpResponse) and not respuesta.is_async:
+            respuesta.streaming_content = _en_contexto(respuesta.streaming_content, _peticion.get())
+        return respuesta
+    return envoltura
+
+
+# ===== LEER LO PROPIO DESPUÉS DE ESCRIBIR =====
+
+class ReplicaMiddleware:
+    """Fija la sesión al primario un rato después de cada escritura; va después de `SessionMiddleware`"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not hay_replica():
+            return self.get_response(request)
+        peticion = Peticion(fijada=request.session.get(CLAVE_SESION, 0) > time.time())
+        token = _peticion.set(peticion)
+        try:
+            respuesta = self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        if peticion.escribio:
+            request.session[CLAVE_SESION] = time.time() + retraso_maximo()
+        return respuesta
+
+    async def __acall__(self, request):
+        if not hay_replica():
+            return await self.get_response(request)
+        peticion = Peticion(fijada=await request.session.aget(CLAVE_SESION, 0) > time.time())
+        # Las consultas de la vista corren en otros hilos con una copia del contexto,
+        # pero `peticion` es el mismo objeto y ahí se marca si escribió
+        token = _peticion.set(peticion)
+        try:
+            respuesta = await self.get_response(request)
+        finally:
+            _peticion.reset(token)
+        if peticion.escribio:
+            await request.session.aset(CLAVE_SESION, time.time() + retraso_maximo())
+        return respuesta
+
+
+def _detectar_escritura(execute, sql, params, many, context):
+    peticion = _peticion.get()
+    if peticion is not None and not peticion.escribio and _ESCRITURA.match(sql):
+        peticion.escribio = True
+    return execute(sql, params, many, context)
+
+
+@receiver(connection_created)
+def _instalar(sender, connection, **kwargs):
+    if connection.alias == DEFAULT_DB_ALIAS and _detectar_escritura not in connection.execute_wrappers:
+        connection.execute_wrappers.append(_detectar_escritura)
+
+
+# ===== RÉPLICA LOCAL =====
+
+class ReplicaInvalida(Exception):
+    pass
+
+
+def _modelos_por_tabla():
+    """{tabla: modelo} de todas las tablas de los modelos instalados (una vez cada una)"""
+    modelos = {}
+    for modelo in apps.get_models(include_auto_created=True):
+        if not modelo._meta.proxy:
+            modelos.setdefault(modelo._meta.db_table, modelo)
+    return modelos
+
+
+def sincronizar(salida=None):
+    """Copia todas las tablas de `default` a la réplica local, creando las que falten.
+
+    Solo para una base de prueba: se niega a escribir en una réplica real o en la
+    misma base que `default`. Devuelve {tabla: filas copiadas}.
+    """
+    salida = salida or (lambda mensaje: None)
+    if not hay_replica():
+        raise ReplicaInvalida(f"No hay una base '{ALIAS}' en DATABASES.")
+    primario, replica = settings.DATABASES[DEFAULT_DB_ALIAS], settings.DATABASES[ALIAS]
+    if all(primario.get(clave) == replica.get(clave) for clave in ('ENGINE', 'NAME', 'HOST', 'PORT')):
+        raise ReplicaInvalida(f"'{ALIAS}' apunta a la misma base que '{DEFAULT_DB_ALIAS}'.")
+    origen, destino = connections[DEFAULT_DB_ALIAS], connections[ALIAS]
+    if destino.vendor == 'mysql' and _estado_replicacion(destino) is not None:
+        raise ReplicaInvalida(f"'{ALIAS}' es una réplica real; escribir en ella rompería la replicación.")
+
+    tablas_origen = set(origen.introspection.table_names())
+    modelos = {tabla: modelo for tabla, modelo in _modelos_por_tabla().items() if tabla in tablas_origen}
+    with destino.schema_editor() as editor:
+        for tabla, modelo in modelos.items():
+            # create_model también crea las tablas de los ManyToMany del modelo
+            if not modelo._meta.auto_created and tabla not in destino.introspection.table_names():
+                editor.create_model(modelo)
+
+    copiadas = {}
+    with destino.constraint_checks_disabled(), transaction.atomic(using=ALIAS):
+        for tabla, modelo in modelos.items():
+            inicio = time.perf_counter()
+            campos = [campo.attname for campo in modelo._meta.concrete_fields]
+            with destino.cursor() as cursor:
+                cursor.execute(f'DELETE FROM {destino.ops.quote_name(tabla)}')
+            filas = modelo._base_manager.using(DEFAULT_DB_ALIAS).order_by().values_list(*campos)
+            lote, copiadas[tabla] = [], 0
+            for fila in filas.iterator(chunk_size=TAMANO_LOTE):
+                lote.append(modelo(**dict(zip(campos, fila))))
+                if len(lote) == TAMANO_LOTE:
+                    modelo._base_manager.using(ALIAS).bulk_create(lote)
+                    copiadas[tabla] += len(lote)
+                    lote = []
+            modelo._base_manager.using(ALIAS).bulk_create(lote)
+            copiadas[tabla] += len(lote)
+            salida(f'{tabla}: {copiadas[tabla]} filas en {time.perf_counter() - inicio:.1f} s')
+    return copiadas
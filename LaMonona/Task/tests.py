@@ -0,0 +1,647 @@
+import asyncio
+import io
+import json
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
+from django.contrib.auth.models import Group, Permission, User
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import Sum
+from django.contrib.sessions.backends.cache import SessionStore
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from . import altas, avisos, busqueda, etiquetas, importacion, indices, metricas, middleware, movimientos, pronosticos, replicas
+from .models import (
+    AuthUserGroups, Cajas, DetallesVenta, Empleados, FotoStock, MovimientoStock, Productos, PronosticoProducto, ResumenProductoDiario,
+    Sucursales, TurnosCaja, Ventas,
+)
+from .forms import EditarEmpleadoForm
+from .pruebas import PresupuestoConsultasMixin
+from VentasApp.servicios import borrar_venta, registrar_venta
+
+
+class PresupuestosTaskTests(PresupuestoConsultasMixin, TestCase):
+    """Consultas por petición de las vistas de Task, con varios registros para detectar N+1"""
+
+    @classmethod
+    def setUpTestData(cls):
+        vendedor = Group.objects.create(name='vendedor')
+        cls.admin = User.objects.create_user('admin', 'admin@lamonona.com', 'clave', is_staff=True)
+        Empleados.objects.create(nombre='Ana', apellido='Admin', correo='admin@lamonona.com', id_user_id=cls.admin.id)
+        for i in range(5):
+            usuario = User.objects.create_user(f'vendedor{i}', f'v{i}@lamonona.com', 'clave')
+            usuario.groups.add(vendedor)
+            Empleados.objects.create(nombre=f'Vendedor {i}', apellido='Pérez', correo=f'v{i}@lamonona.com', id_user_id=usuario.id)
+        Productos.objects.bulk_create(
+            Productos(nombre_producto=f'Camión {i}', precio=Decimal('10.00'), stock=i, stock_minimo=3)
+            for i in range(8)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def test_inicio(self):
+        self.get_con_presupuesto('inicio', estado=302)
+
+    def test_perfil(self):
+        self.get_con_presupuesto('user')
+
+    def test_lista_de_usuarios(self):
+        self.get_con_presupuesto('userlist')
+        respuesta = self.get_con_presupuesto('datos_usuarios', datos={'length': 10, 'search[value]': 'pérez'})
+        self.assertEqual(respuesta.json()['recordsFiltered'], 5)
+
+    def test_productos(self):
+        self.get_con_presupuesto('lista_productos')
+        self.get_con_presupuesto('dashboard_stock')
+        respuesta = self.get_con_presupuesto('buscar_productos', datos={'q': 'camion'})
+        self.assertEqual(len(respuesta.json()['resultados']), 8)
+
+    def test_metricas(self):
+        self.client.get(reverse('lista_productos'))
+        texto = self.get_con_presupuesto('metricas').content.decode()
+        self.assertIn('lamonona_peticion_segundos_count{vista="lista_productos",metodo="GET"}', texto)
+        self.assertIn('lamonona_consultas_sql_bucket{vista="lista_productos",metodo="GET",le="+Inf"}', texto)
+
+    @override_settings(PRESUPUESTOS_CONSULTAS={'lista_productos': 0})
+    def test_advertencia_fuera_de_presupuesto(self):
+        with self.assertLogs(metricas.logger, 'WARNING') as registro:
+            self.client.get(reverse('lista_productos'))
+        self.assertIn('lista_productos', registro.output[0])
+
+
+class AsesorIndicesTests(TestCase):
+    """El asesor lee el plan de todas las consultas; en la base de prueba los índices de Meta ya existen"""
+
+    def setUp(self):
+        if connection.vendor not in ('mysql', 'sqlite'):
+            self.skipTest(f'EXPLAIN de {connection.vendor} no soportado')
+
+    def test_todas_las_consultas(self):
+        resultados = indices.asesorar()
+        self.assertEqual([resultado['consulta'] for resultado in resultados], list(indices.consultas()))
+        for resultado in resultados:
+            self.assertTrue(resultado['plan'], resultado['consulta'])
+
+    def test_sugiere_columnas_de_filtro_y_orden(self):
+        _, columnas = indices._columnas_de_consulta(
+            Productos.objects.filter(stock=0).order_by('nombre_producto').query
+        )
+        self.assertEqual(columnas, {'productos': ['stock', 'nombre_producto']})
+
+
+class CacheEtiquetadaTests(TestCase):
+    """Las entradas se recalculan cuando se confirma una escritura sobre sus tablas o instancias"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.producto = Productos.objects.create(nombre_producto='Pelota', precio=Decimal('5.00'), stock=3, stock_minimo=1)
+
+    def setUp(self):
+        cache.clear()
+        self.calculos = 0
+
+    def _stock(self, etiquetas_entrada):
+        def calcular():
+            self.calculos += 1
+            return Productos.objects.get(pk=self.producto.pk).stock
+        return etiquetas.obtener('prueba', calcular, etiquetas_entrada)
+
+    def test_update_invalida_la_etiqueta_de_la_tabla(self):
+        self.assertEqual(self._stock(['productos']), 3)
+        self.assertEqual(self._stock(['productos']), 3)
+        self.assertEqual(self.calculos, 1)
+        with self.captureOnCommitCallbacks(execute=True):
+            Productos.objects.filter(pk=self.producto.pk).update(stock=7)
+        self.assertEqual(self._stock(['productos']), 7)
+        self.assertEqual(self.calculos, 2)
+
+    def test_save_invalida_la_etiqueta_de_la_instancia(self):
+        etiqueta = f'producto:{self.producto.pk}'
+        self._stock([etiqueta])
+        with self.captureOnCommitCallbacks(execute=True):
+            Productos.objects.create(nombre_producto='Otro', precio=Decimal('1.00'), stock=1, stock_minimo=1)
+        self._stock([etiqueta])
+        self.assertEqual(self.calculos, 1)
+        self.producto.stock = 9
+        with self.captureOnCommitCallbacks(execute=True):
+            self.producto.save()
+        self.assertEqual(self._stock([etiqueta]), 9)
+        self.assertEqual(self.calculos, 2)
+
+
+class MovimientosStockTests(TestCase):
+    """El stock solo cambia por movimientos, y se puede reconstruir a una fecha pasada"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pelota = Productos.objects.create(nombre_producto='Pelota', precio=Decimal('5.00'), stock=10, stock_minimo=1)
+        cls.yoyo = Productos.objects.create(nombre_producto='Yoyo', precio=Decimal('2.00'), stock=1, stock_minimo=1)
+
+    def _movimiento(self, producto, cantidad, fecha=None):
+        return MovimientoStock(id_producto_id=producto.pk, tipo=movimientos.AJUSTE, cantidad=cantidad, fecha=fecha)
+
+    def _stock(self, producto):
+        return Productos.objects.get(pk=producto.pk).stock
+
+    def test_aplicar_suma_por_producto(self):
+        movimientos.aplicar([
+            self._movimiento(self.pelota, -2), self._movimiento(self.pelota, 3), self._movimiento(self.yoyo, -1),
+        ])
+        self.assertEqual(self._stock(self.pelota), 11)
+        self.assertEqual(self._stock(self.yoyo), 0)
+        self.assertEqual(MovimientoStock.objects.count(), 3)
+
+    def test_aplicar_sin_stock_deshace_todo(self):
+        with self.assertRaises(movimientos.StockInsuficiente):
+            with transaction.atomic():
+                movimientos.aplicar([self._movimiento(self.pelota, -2), self._movimiento(self.yoyo, -5)])
+        self.assertEqual(self._stock(self.pelota), 10)
+        self.assertEqual(self._stock(self.yoyo), 1)
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_ajustar_sin_stock_no_cambia_nada(self):
+        with self.assertRaises(movimientos.StockInsuficiente):
+            movimientos.ajustar(self.yoyo.pk, -2)
+        self.assertEqual(self._stock(self.yoyo), 1)
+        self.assertFalse(MovimientoStock.objects.exists())
+
+    def test_stock_en_y_compactar(self):
+        ahora = timezone.now()
+        movimientos.aplicar([
+            self._movimiento(self.pelota, 5, ahora - timedelta(days=3)),
+            self._movimiento(self.pelota, -4, ahora - timedelta(days=1)),
+        ])
+        antes, corte = ahora - timedelta(days=4), ahora - timedelta(days=2)
+        esperado = {antes: 10, corte: 15, ahora: 11}
+        for fecha, stock in esperado.items():
+            self.assertEqual(movimientos.stock_en(fecha, [self.pelota.pk]), {self.pelota.pk: stock})
+
+        self.assertEqual(movimientos.compactar(corte), 2)
+        self.assertEqual(movimientos.compactar(corte), 0)
+        self.assertEqual(FotoStock.objects.get(id_producto=self.pelota, fecha=corte).stock, 15)
+        # Con la foto se llega a los mismos valores, antes y después del corte
+        for fecha, stock in esperado.items():
+            self.assertEqual(movimientos.stock_en(fecha)[self.pelota.pk], stock)
+        self.assertEqual(movimientos.stock_en(ahora)[self.yoyo.pk], 1)
+
+
+class ImportacionProductosTests(TestCase):
+    CSV = (
+        'id_producto,nombre_producto,precio,stock\n'
+        '{pelota},,7.50,4\n'
+        ',Yoyo,2.00,3\n'
+        ',Trompo,1.00,\n'
+        ',Cometa,,5\n'
+        '999,,1.00,1\n'
+    )
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pelota = Productos.objects.create(nombre_producto='Pelota', precio=Decimal('5.00'), stock=10, stock_minimo=1)
+
+    def _importar(self, **kwargs):
+        return importacion.importar_productos(io.StringIO(self.CSV.format(pelota=self.pelota.pk)), **kwargs)
+
+    def _comprobar_importacion(self, resultado):
+        self.assertEqual((resultado['filas'], resultado['creados'], resultado['actualizados']), (5, 2, 1))
+        self.assertEqual(sorted(resultado['errores']), [5, 6])
+        pelota = Productos.objects.get(pk=self.pelota.pk)
+        self.assertEqual((pelota.precio, pelota.stock), (Decimal('7.50'), 4))
+        yoyo = Productos.objects.get(nombre_producto='Yoyo')
+        self.assertEqual(yoyo.stock, 3)
+        self.assertEqual(Productos.objects.get(nombre_producto='Trompo').stock, 0)
+        stock_por_movimientos = dict(
+            MovimientoStock.objects.values_list('id_producto').annotate(total=Sum('cantidad'))
+        )
+        self.assertEqual(stock_por_movimientos, {pelota.pk: -6, yoyo.pk: 3})
+
+    def test_crea_y_actualiza_por_lotes(self):
+        with mock.patch.object(importacion, 'TAMANO_LOTE', 2):
+            self._comprobar_importacion(self._importar())
+
+    def test_ids_asignados_sin_returning(self):
+        # Como en MySQL: los ids de los productos nuevos no vuelven del INSERT
+        with mock.patch.object(type(connection.features), 'can_return_rows_from_bulk_insert', False):
+            self._comprobar_importacion(self._importar())
+
+    def test_simular_no_guarda(self):
+        resultado = self._importar(simular=True)
+        self.assertEqual((resultado['creados'], resultado['actualizados']), (2, 1))
+        self.assertEqual(Productos.objects.get(pk=self.pelota.pk).stock, 10)
+        self.assertEqual(Productos.objects.count(), 1)
+        self.assertFalse(MovimientoStock.objects.exists())
+
+
+class AvisosStockTests(SimpleTestCase):
+    AVISOS = [
+        {'id_producto': i, 'nombre_producto': f'Producto {i}', 'stock': 0, 'stock_minimo': 5,
+         'estado_anterior': 'bajo', 'estado': 'agotado'}
+        for i in range(200)
+    ]
+
+    def test_paquetes_dentro_del_limite(self):
+        paquetes = list(avisos._paquetes(self.AVISOS, 2048))
+        self.assertGreater(len(paquetes), 1)
+        self.assertTrue(all(len(datos) <= 2048 for datos in paquetes))
+        self.assertEqual([aviso for datos in paquetes for aviso in json.loads(datos)], self.AVISOS)
+
+    def test_una_advertencia_por_publicacion_descartada(self):
+        cola = asyncio.Queue(maxsize=avisos.MAX_PENDIENTES)
+        with self.assertLogs(avisos.logger, 'WARNING') as registro:
+            avisos._encolar(cola, self.AVISOS)
+        self.assertEqual(cola.qsize(), avisos.MAX_PENDIENTES)
+        self.assertEqual(len(registro.output), 1)
+        self.assertIn('100 de 200', registro.output[0])
+
+
+class PronosticosTests(TestCase):
+    """Series constantes: sin estacionalidad ni desviación, el pronóstico se calcula a mano"""
+    HASTA = date(2024, 6, 30)
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.pelota = Productos.objects.create(nombre_producto='Pelota', precio=Decimal('5.00'), stock=30, stock_minimo=1)
+        cls.yoyo = Productos.objects.create(nombre_producto='Yoyo', precio=Decimal('2.00'), stock=0, stock_minimo=1)
+        cls.trompo = Productos.objects.create(nombre_producto='Trompo', precio=Decimal('1.00'), stock=5, stock_minimo=1)
+        ResumenProductoDiario.objects.bulk_create([
+            ResumenProductoDiario(fecha=cls.HASTA - timedelta(days=dia), id_producto=producto, cantidad=cantidad)
+            for producto, cantidad in ((cls.pelota, 4), (cls.yoyo, 2))
+            for dia in range(pronosticos.DIAS_HISTORIA)
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.assertEqual(pronosticos.recalcular(self.HASTA), 3)
+
+    def test_fecha_de_agotamiento_y_cantidad_sugerida(self):
+        pelota = PronosticoProducto.objects.get(id_producto=self.pelota)
+        self.assertAlmostEqual(pelota.velocidad_diaria, 4)
+        # 30 unidades a 4 por día: una semana completa (28) y el 8.º día se acaba
+        self.assertEqual(pelota.dias_hasta_agotar, 8)
+        self.assertEqual(pelota.fecha_agotamiento, self.HASTA + timedelta(days=8))
+        # 4 por día durante la entrega y la cobertura (3 + 14 días), menos el stock
+        self.assertEqual(pelota.cantidad_sugerida, 4 * 17 - 30)
+
+    def test_sin_stock(self):
+        yoyo = PronosticoProducto.objects.get(id_producto=self.yoyo)
+        self.assertEqual(yoyo.dias_hasta_agotar, 0)
+        self.assertEqual(yoyo.fecha_agotamiento, self.HASTA + timedelta(days=1))
+        self.assertEqual(yoyo.cantidad_sugerida, 2 * 17)
+
+    def test_sin_ventas(self):
+        trompo = PronosticoProducto.objects.get(id_producto=self.trompo)
+        self.assertEqual((trompo.velocidad_diaria, trompo.cantidad_sugerida), (0, 0))
+        self.assertIsNone(trompo.dias_hasta_agotar)
+        self.assertIsNone(trompo.fecha_agotamiento)
+        self.assertEqual(
+            [fila['id_producto'] for fila in pronosticos.proximos_a_agotarse()], [self.yoyo.pk, self.pelota.pk]
+        )
+
+
+# Un hasher rápido; los procesos del pool no ven este override, así que también prueba que reciben el hasher
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class AltaMasivaTests(TestCase):
+    CSV = (
+        'username,password,nombre,apellido,correo,rol,edad\n'
+        'ana,clave-ana-1,Ana,Pérez,ana@example.com,vendedor,30\n'
+        'beto,clave-beto-2,Beto,Gómez,beto@example.com,vendedor,25\n'
+        'caro,clave-caro-3,Caro,Díaz,caro@example.com,administrador,41\n'
+        'dani,clave-dani-4,Dani,Ruiz,dani@example.com,vendedor,22\n'
+        'ana,otra-clave,Ana,Otra,otra@example.com,vendedor,30\n'
+        'eva,clave-eva-5,Eva,Sosa,eva@example.com,gerente,33\n'
+    )
+
+    def test_crea_usuarios_empleados_y_grupos(self):
+        resultado = altas.alta_masiva(io.StringIO(self.CSV), procesos=2)
+        self.assertEqual((resultado['filas'], resultado['creados'], resultado['num_errores']), (6, 4, 2))
+        self.assertEqual(sorted(resultado['errores']), [6, 7])
+
+        for username, numero in [('ana', 1), ('beto', 2), ('caro', 3), ('dani', 4)]:
+            contrasena = f'clave-{username}-{numero}'
+            usuario = User.objects.get(username=username)
+            self.assertTrue(usuario.password.startswith('md5$'))
+            self.assertTrue(usuario.check_password(contrasena), username)
+            self.assertEqual(Empleados.objects.get(id_user_id=usuario.pk).correo, f'{username}@example.com')
+        self.assertEqual(
+            sorted(User.objects.filter(groups__name='vendedor').values_list('username', flat=True)), ['ana', 'beto', 'dani']
+        )
+        caro = User.objects.get(username='caro')
+        self.assertTrue(caro.is_superuser and caro.groups.filter(name='administrador').exists())
+
+    def test_simular_no_crea_nada(self):
+        resultado = altas.alta_masiva(io.StringIO(self.CSV), simular=True)
+        self.assertEqual(resultado['num_errores'], 2)
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Group.objects.exists())
+
+
+class ProductosVistasTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = User.objects.create_superuser('admin', 'admin@lamonona.com', 'clave')
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.admin)
+
+    def _crear(self, nombre, stock):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('crear_producto'), {
+                'nombre_producto': nombre, 'precio': '5.00', 'stock': stock, 'stock_minimo': 1,
+            })
+        return Productos.objects.get(nombre_producto=nombre)
+
+    def _mensajes(self, respuesta):
+        return [str(mensaje) for mensaje in get_messages(respuesta.wsgi_request)]
+
+    def test_eliminar_producto_con_movimientos(self):
+        producto = self._crear('Pelota', 5)
+        movimientos.compactar()
+        self.assertTrue(MovimientoStock.objects.filter(id_producto=producto).exists())
+        self.assertTrue(FotoStock.objects.filter(id_producto=producto).exists())
+
+        respuesta = self.client.post(reverse('eliminar_producto', args=[producto.pk]))
+        self.assertRedirects(respuesta, reverse('lista_productos'), fetch_redirect_response=False)
+        self.assertFalse(Productos.objects.filter(pk=producto.pk).exists())
+        self.assertFalse(MovimientoStock.objects.exists())
+        self.assertFalse(FotoStock.objects.exists())
+        connection.check_constraints()
+
+    def test_eliminar_producto_con_pronostico(self):
+        producto = self._crear('Trompo', 0)
+        pronosticos.recalcular()
+        self.assertTrue(PronosticoProducto.objects.filter(id_producto=producto).exists())
+        self.client.post(reverse('eliminar_producto', args=[producto.pk]))
+        self.assertFalse(Productos.objects.filter(pk=producto.pk).exists())
+        self.assertFalse(PronosticoProducto.objects.exists())
+        connection.check_constraints()
+
+    def test_editar_sin_stock_suficiente_guarda_lo_demas(self):
+        producto = self._crear('Globo', 5)
+        # Mientras se editaba se vendieron 4: bajar el stock mostrado (5) a 0 lo dejaría en -4
+        Productos.objects.filter(pk=producto.pk).update(stock=1)
+        respuesta = self.client.post(reverse('editar_producto', args=[producto.pk]), {
+            'nombre_producto': 'Globo rojo', 'precio': '6.00', 'stock': 0, 'stock_minimo': 1, 'stock_anterior': 5,
+        })
+        producto.refresh_from_db()
+        self.assertEqual((producto.nombre_producto, producto.stock), ('Globo rojo', 1))
+        mensajes = self._mensajes(respuesta)
+        self.assertTrue(any('pero no el stock' in mensaje for mensaje in mensajes))
+        self.assertFalse(any('actualizado exitosamente' in mensaje for mensaje in mensajes))
+
+    def _turno(self):
+        empleado = Empleados.objects.create(nombre='Ana', apellido='Admin', correo='admin@lamonona.com', id_user_id=self.admin.id)
+        caja = Cajas.objects.create(id_sucursal=Sucursales.objects.create(nombre_sucursal='Centro'), estado='Abierta')
+        return TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+
+    def test_eliminar_producto_de_una_venta_borrada(self):
+        producto = self._crear('Cometa', 5)
+        venta = registrar_venta(self._turno().id_turno, [{'id_producto': producto.pk, 'cantidad': 2}])
+        borrar_venta(venta)
+        self.assertTrue(ResumenProductoDiario.objects.filter(id_producto=producto).exists())
+        self.client.post(reverse('eliminar_producto', args=[producto.pk]))
+        self.assertFalse(Productos.objects.filter(pk=producto.pk).exists())
+        connection.check_constraints()
+
+    def test_no_elimina_producto_con_ventas(self):
+        producto = self._crear('Yoyo', 5)
+        venta = Ventas.objects.create(id_turno=self._turno(), fecha_venta=timezone.now(), total_venta=Decimal('5.00'))
+        DetallesVenta.objects.create(id_venta=venta, id_producto=producto, cantidad=1, subtotal=Decimal('5.00'))
+
+        respuesta = self.client.post(reverse('eliminar_producto', args=[producto.pk]))
+        self.assertIn('tiene ventas registradas', self._mensajes(respuesta)[-1])
+        self.assertTrue(Productos.objects.filter(pk=producto.pk).exists())
+        self.assertTrue(MovimientoStock.objects.filter(id_producto=producto).exists())
+
+
+class PerfilMiddlewareTests(TestCase):
+    """El empleado y el rol se leen con una consulta y quedan en la sesión hasta que cambian"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('vero', 'vero@lamonona.com', 'clave')
+        cls.usuario.groups.add(Group.objects.create(name='vendedor'))
+        Empleados.objects.create(nombre='Vero', apellido='Venta', correo='vero@lamonona.com', id_user_id=cls.usuario.id)
+
+    def setUp(self):
+        cache.clear()
+        self.sesion = SessionStore()
+
+    def _peticion(self):
+        """Una petición nueva de la misma sesión, ya pasada por el middleware"""
+        peticion = RequestFactory().get('/')
+        peticion.user = User.objects.get(pk=self.usuario.pk)
+        peticion.session = self.sesion
+        return middleware.PerfilMiddleware(lambda peticion: peticion)(peticion)
+
+    def _editar(self, **cambios):
+        empleado = Empleados.objects.select_related('id_user').get(id_user_id=self.usuario.pk)
+        datos = {
+            'username': 'vero', 'nombre': 'Vero', 'apellido': 'Venta', 'correo': 'vero@lamonona.com',
+            'edad': 30, 'rol': 'vendedor', 'is_active': True, **cambios,
+        }
+        form = EditarEmpleadoForm(datos, instance=empleado)
+        self.assertTrue(form.is_valid(), form.errors)
+        with self.captureOnCommitCallbacks(execute=True):
+            form.save()
+
+    def test_una_consulta_y_despues_la_sesion(self):
+        peticion = self._peticion()
+        with self.assertNumQueries(1):
+            self.assertEqual(peticion.rol, 'vendedor')
+            self.assertEqual(peticion.empleado.nombre, 'Vero')
+            self.assertEqual(peticion.empleado.id_user.username, 'vero')
+        peticion = self._peticion()
+        with self.assertNumQueries(0):
+            self.assertEqual(peticion.rol, 'vendedor')
+            self.assertEqual(peticion.empleado.correo, 'vero@lamonona.com')
+
+    def test_cambio_de_rol_invalida_la_sesion(self):
+        self.assertEqual(self._peticion().rol, 'vendedor')
+        self._editar(rol='administrador')
+        peticion = self._peticion()
+        with self.assertNumQueries(1):
+            self.assertEqual(peticion.rol, 'administrador')
+            self.assertTrue(peticion.empleado.id_user.is_staff)
+
+    def test_desactivar_invalida_la_sesion(self):
+        self.assertTrue(self._peticion().empleado.id_user.is_active)
+        self._editar(is_active=False)
+        self.assertFalse(self._peticion().empleado.id_user.is_active)
+
+    def test_usuario_que_no_es_empleado(self):
+        admin = User.objects.create_user('root', 'root@lamonona.com', 'clave')
+        peticion = RequestFactory().get('/')
+        peticion.user, peticion.session = admin, SessionStore()
+        middleware.PerfilMiddleware(lambda peticion: peticion)(peticion)
+        # Son objetos diferidos: se comparan por valor, no con `is None`
+        self.assertFalse(peticion.rol)
+        self.assertFalse(peticion.empleado)
+
+
+class PermisosCacheTests(TestCase):
+    """Los permisos salen de la caché y se recalculan al cambiar grupos o sus permisos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('pepa', 'pepa@lamonona.com', 'clave')
+        cls.encargados = Group.objects.create(name='encargados')
+        cls.agregar = Permission.objects.get(codename='add_productos', content_type__app_label='Task')
+
+    def setUp(self):
+        cache.clear()
+
+    def _puede(self, permiso='Task.add_productos'):
+        """Como en una petición nueva: otra instancia del usuario, sin permisos en memoria"""
+        return User.objects.get(pk=self.usuario.pk).has_perm(permiso)
+
+    def _cambiar(self, funcion, *args, **kwargs):
+        with self.captureOnCommitCallbacks(execute=True):
+            funcion(*args, **kwargs)
+
+    def test_segunda_consulta_sin_base(self):
+        self._cambiar(self.usuario.user_permissions.add, self.agregar)
+        self.assertTrue(self._puede())
+        usuario = User.objects.get(pk=self.usuario.pk)
+        with self.assertNumQueries(0):
+            self.assertTrue(usuario.has_perm('Task.add_productos'))
+            self.assertFalse(usuario.has_perm('Task.delete_productos'))
+            self.assertTrue(usuario.has_perm('Task.add_productos'))
+
+    def test_alta_y_baja_en_un_grupo(self):
+        self._cambiar(self.encargados.permissions.add, self.agregar)
+        self.assertFalse(self._puede())
+        self._cambiar(self.usuario.groups.add, self.encargados)
+        self.assertTrue(self._puede())
+        self._cambiar(self.usuario.groups.remove, self.encargados)
+        self.assertFalse(self._puede())
+
+        # Igual con el modelo de la tabla, como lo hacen los formularios de empleados
+        self._cambiar(AuthUserGroups.objects.create, user_id=self.usuario.pk, group_id=self.encargados.pk)
+        self.assertTrue(self._puede())
+        self._cambiar(AuthUserGroups.objects.filter(user_id=self.usuario.pk).get().delete)
+        self.assertFalse(self._puede())
+
+    def test_cambio_de_permisos_del_grupo(self):
+        self._cambiar(self.usuario.groups.add, self.encargados)
+        self.assertFalse(self._puede())
+        self._cambiar(self.encargados.permissions.add, self.agregar)
+        self.assertTrue(self._puede())
+        self._cambiar(self.encargados.permissions.remove, self.agregar)
+        self.assertFalse(self._puede())
+
+    def test_vista_protegida(self):
+        self.client.force_login(self.usuario)
+        self.assertEqual(self.client.get(reverse('crear_producto')).status_code, 403)
+        self._cambiar(self.usuario.groups.add, self.encargados)
+        self._cambiar(self.encargados.permissions.add, self.agregar)
+        self.assertEqual(self.client.get(reverse('crear_producto')).status_code, 200)
+
+
+class BusquedaProductosTests(TestCase):
+    """Índice de prefijos sin acentos: ranking, límite y reconstrucción al cambiar el catálogo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        for nombre, descripcion in [
+            ('Pelota camión', 'de plástico'),
+            ('Camioneta azul', 'a fricción'),
+            ('Muñeca', 'con camión de regalo'),
+            ('Camión rojo', 'juguete de madera'),
+            ('Camión', None),
+            ('Yoyo', 'de madera'),
+        ]:
+            Productos.objects.create(nombre_producto=nombre, descripcion=descripcion, precio=Decimal('1.00'), stock=1, stock_minimo=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def _nombres(self, texto, limite=10):
+        return [fila['nombre_producto'] for fila in busqueda.buscar_productos(texto, limite)]
+
+    def test_sin_acentos_y_sin_mayusculas(self):
+        self.assertEqual(self._nombres('camion'), self._nombres('CAMIÓN'))
+        self.assertEqual(self._nombres('muneca'), ['Muñeca'])
+
+    def test_ranking(self):
+        # Nombres que empiezan con la consulta (los cortos primero), luego otros nombres, luego descripciones
+        self.assertEqual(
+            self._nombres('camion'), ['Camión', 'Camión rojo', 'Camioneta azul', 'Pelota camión', 'Muñeca'],
+        )
+        self.assertEqual(self._nombres('madera'), ['Yoyo', 'Camión rojo'])
+        self.assertEqual(self._nombres('rojo cam'), ['Camión rojo'])
+        self.assertEqual(self._nombres('c'), [])
+
+    def test_limite(self):
+        self.assertEqual(self._nombres('camion', limite=2), ['Camión', 'Camión rojo'])
+        self.assertEqual(len(self._nombres('camion', limite=0)), 1)
+        self.client.force_login(User.objects.create_user('caja', 'caja@lamonona.com', 'clave'))
+        respuesta = self.client.get(reverse('buscar_productos'), {'q': 'camion', 'limite': 3})
+        self.assertEqual(len(respuesta.json()['resultados']), 3)
+        respuesta = self.client.get(reverse('buscar_productos'), {'q': 'camion', 'limite': 'muchos'})
+        self.assertEqual(len(respuesta.json()['resultados']), 5)
+
+    def test_se_reconstruye_al_guardar_y_borrar(self):
+        self.assertEqual(self._nombres('bomberos'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            bomberos = Productos.objects.create(nombre_producto='Camión de bomberos', precio=Decimal('9.00'), stock=1, stock_minimo=1)
+        self.assertEqual(self._nombres('bomberos'), ['Camión de bomberos'])
+
+        # Un cambio de precio no toca el índice
+        version = cache.get(busqueda.CLAVE_VERSION)
+        bomberos.precio = Decimal('8.00')
+        with self.captureOnCommitCallbacks(execute=True):
+            bomberos.save(update_fields=['precio'])
+        self.assertEqual(cache.get(busqueda.CLAVE_VERSION), version)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            bomberos.delete()
+        self.assertEqual(busqueda.indice().buscar('bomberos'), [])
+
+    def test_se_reconstruye_despues_de_importar(self):
+        self._nombres('camion')
+        with self.captureOnCommitCallbacks(execute=True):
+            importacion.importar_productos(io.StringIO('nombre_producto,precio\nTrompo musical,3.00\n'))
+        self.assertEqual(self._nombres('musical'), ['Trompo musical'])
+
+
+@mock.patch.object(replicas, 'replica_al_dia', return_value=True)
+@mock.patch.object(replicas, 'hay_replica', return_value=True)
+class ReplicaRouterTests(SimpleTestCase):
+    router = replicas.ReporteRouter()
+
+    def test_solo_las_lecturas_de_reporte_van_a_la_replica(self, *_):
+        self.assertEqual(self.router.db_for_read(Ventas), 'default')
+        with replicas.lectura_de_reporte():
+            self.assertEqual(self.router.db_for_read(Ventas), replicas.ALIAS)
+            with replicas.lectura_del_primario():
+                self.assertEqual(self.router.db_for_read(Ventas), 'default')
+
+    def test_las_escrituras_van_al_primario(self, *_):
+        venta = Ventas(id_venta=1)
+        venta._state.db = replicas.ALIAS
+        self.assertEqual(self.router.db_for_write(Ventas, instance=venta), 'default')
+        self.assertFalse(self.router.allow_migrate(replicas.ALIAS, 'Task'))
+
+    def test_despues_de_escribir_lee_del_primario(self, *_):
+        peticion = replicas.Peticion()
+        token = replicas._peticion.set(peticion)
+        try:
+            with replicas.lectura_de_reporte():
+                replicas._detectar_escritura(lambda *args: None, 'SELECT 1', None, False, {})
+                self.assertEqual(self.router.db_for_read(Ventas), replicas.ALIAS)
+                replicas._detectar_escritura(lambda *args: None, ' UPDATE productos SET stock = 1', None, False, {})
+                self.assertEqual(self.router.db_for_read(Ventas), 'default')
+        finally:
+            replicas._peticion.reset(token)
+
+    def test_replica_atrasada(self, hay_replica, al_dia):
+        al_dia.return_value = False
+        with replicas.lectura_de_reporte():
+            self.assertEqual(self.router.db_for_read(Ventas), 'default')
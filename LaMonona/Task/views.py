@@ -1,8 +1,13 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, logout, authenticate
 from django.contrib.auth.forms import UserCreationForm, AuthenticationForm
-from .models import Empleados, AuthUser, AuthUserGroups, AuthUserUserPermissions, Ventas, Productos, Cajas
+from .models import Empleados, AuthUser, AuthUserGroups, AuthUserUserPermissions, DetallesVenta, Ventas, Productos, PronosticoProducto, ResumenProductoDiario, Cajas
 from .forms import EmpleadoCreationForm, EditarEmpleadoForm, EditarPerfilForm, CambiarContraseñaForm, ProductoForm
+from . import altas, asincrono, avisos, busqueda, directorio, importacion, metricas, movimientos, pronosticos
+from .importacion import ImportacionInvalida
+from .inventario import resumen_stock
+from .replicas import de_reporte
+from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth.decorators import login_required, permission_required
 from django.core.exceptions import PermissionDenied
@@ -12,11 +17,16 @@ from django.contrib.auth import update_session_auth_hash
 from django.contrib.auth.views import PasswordResetConfirmView
 from django.urls import reverse_lazy
 from django.contrib.auth.forms import PasswordChangeForm
-from django.http import JsonResponse
+from django.http import Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.core.serializers.json import DjangoJSONEncoder
 from django.db.models import Count
 from django.db.models.functions import TruncMonth,TruncWeek
 from django.utils.translation import activate
 from django.db.models import Count, Sum, F
+import asyncio
+import csv
+import hmac
+import io
 import logging
 import json
 
@@ -24,31 +34,31 @@ logger = logging.getLogger(__name__)
 
 @login_required
 def inicio(request):
-    try:
-        # Obtenemos el AuthUser desde tu tabla
-        auth_user = AuthUser.objects.get(username=request.user.username)
-
-        # Buscamos si es empleado
-        Empleados.objects.get(id_user=auth_user)
-        # Si existe → es empleado
+    # request.empleado y request.rol vienen de PerfilMiddleware (guardados en la sesión)
+    if request.empleado:
         return redirect('lista_cajas')
-
-    except AuthUser.DoesNotExist:
-        # Esto casi nunca pasa
-        messages.error(request, "Usuario no existe en AuthUser")
-        return redirect('signin')
-
-    except Empleados.DoesNotExist:
-        # No es empleado → admin
-        return redirect('userlist')
+    # No es empleado → admin
+    return redirect('userlist')
 
 # Esta vista ahora mostrará la lista de usuarios si el usuario está autenticado
 
 @login_required
 def user_list(request):
-    # Muestra todos los usuarios (admins)
-    users = AuthUser.objects.all()
-    return render(request, 'userlist.html', {'users': users})
+    # Las filas se cargan desde `datos_usuarios` (DataTables en modo serverSide)
+    return render(request, 'userlist.html')
+
+
+@login_required
+@require_http_methods(["GET"])
+def datos_usuarios(request):
+    """Página del directorio de empleados en JSON: búsqueda, orden y paginación en el servidor"""
+    if not request.user.is_staff:
+        raise PermissionDenied("Solo los administradores pueden ver el directorio de usuarios.")
+    try:
+        draw = int(request.GET.get('draw', 0) or 0)
+    except ValueError:
+        draw = 0
+    return JsonResponse({'draw': draw, **directorio.pagina_cacheada(request.GET)})
 
 
 # La vista original de combined_charts no es necesaria si userlist_view ya la maneja,
@@ -73,8 +83,9 @@ def exit(request):
 
 @login_required
 def user_profile(request):
-    auth_user = get_object_or_404(AuthUser, username=request.user.username)
-    empleado = get_object_or_404(Empleados, id_user=auth_user)
+    if not request.empleado:
+        raise Http404("El usuario no es un empleado.")
+    empleado = request.empleado
     edit_form = EditarPerfilForm(instance=empleado)
     password_form = CambiarContraseñaForm()
     return render(request, 'user.html', {
@@ -115,11 +126,33 @@ def add_user(request):
 
 
 
+@login_required
+@require_http_methods(["POST"])
+def alta_masiva_usuarios(request):
+    """Crea empleados desde un CSV (campo "archivo") y devuelve el resumen en JSON"""
+    if not request.user.is_staff:
+        raise PermissionDenied("Solo los administradores pueden crear usuarios.")
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return JsonResponse({'success': False, 'errors': {'archivo': ['Selecciona un archivo CSV.']}}, status=400)
+    try:
+        resultado = altas.alta_masiva(
+            io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline=''),
+            # Solo superuser puede crear administradores, igual que en add_user
+            permitir_administradores=request.user.is_superuser,
+            simular=request.POST.get('simular') == '1',
+            delimitador=request.POST.get('delimitador') or ',',
+        )
+    except (ImportacionInvalida, UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'success': False, 'errors': {'archivo': [str(e)]}}, status=400)
+    return JsonResponse({'success': True, 'resultado': resultado})
+
+
 @login_required
 @require_http_methods(["GET", "POST"])
 def edit_user(request, user_id):
     try:
-        empleado = Empleados.objects.get(id_user__id=user_id)
+        empleado = directorio.empleados_con_rol().get(id_user__id=user_id)
     except Empleados.DoesNotExist:
         return JsonResponse({'success': False, 'errors': 'Empleado no encontrado.'})
 
@@ -198,11 +231,14 @@ class CustomPasswordResetConfirmView(PasswordResetConfirmView):
 @login_required
 @require_http_methods(["POST"])
 def edit_profile(request, user_id):
-    empleado = get_object_or_404(Empleados, id_user__id=user_id)
-    
     # Solo el propietario del perfil o un administrador pueden editarlo
     if str(request.user.id) != str(user_id) and not request.user.is_staff:
         raise PermissionDenied("Solo puedes editar tu propio perfil o ser administrador.")
+
+    if str(request.user.id) == str(user_id) and request.empleado:
+        empleado = request.empleado
+    else:
+        empleado = get_object_or_404(Empleados.objects.select_related('id_user'), id_user__id=user_id)
     
     # No permitir que no-super administradores editen super administradores
     if empleado.id_user.is_superuser and not request.user.is_superuser:
@@ -222,19 +258,20 @@ def edit_profile(request, user_id):
 # ===== VISTAS PARA GESTIÓN DE PRODUCTOS Y STOCK =====
 
 @login_required
-def lista_productos(request):
+async def lista_productos(request):
     """Lista todos los productos con alertas de stock bajo"""
-    productos = Productos.objects.all().order_by('nombre_producto')
-    productos_bajo_stock = productos.filter(stock__lte=F('stock_minimo'))
-    productos_sin_stock = productos.filter(stock=0)
-    
+    productos, resumen = await asyncio.gather(
+        asincrono.listar(Productos.objects.order_by('nombre_producto')),
+        asincrono.leer(resumen_stock),
+    )
+
     context = {
         'productos': productos,
-        'productos_bajo_stock': productos_bajo_stock,
-        'productos_sin_stock': productos_sin_stock,
-        'alertas_count': productos_bajo_stock.count(),
+        'productos_bajo_stock': resumen['productos_bajo_stock'],
+        'productos_sin_stock': resumen['productos_sin_stock'],
+        'alertas_count': resumen['bajo_stock'],
     }
-    return render(request, 'productos/lista.html', context)
+    return await asincrono.arender(request, 'productos/lista.html', context)
 
 @login_required
 @permission_required('Task.add_productos', raise_exception=True)
@@ -243,7 +280,16 @@ def crear_producto(request):
     if request.method == 'POST':
         form = ProductoForm(request.POST)
         if form.is_valid():
-            producto = form.save()
+            # El stock inicial entra como movimiento, para que el libro cuadre con el stock
+            with transaction.atomic():
+                producto = form.save(commit=False)
+                stock_inicial = producto.stock
+                producto.stock = 0
+                producto.save()
+                if stock_inicial:
+                    movimientos.ajustar(producto.id_producto, stock_inicial, tipo=movimientos.REPOSICION,
+                                        id_user=request.user.id, nota='Stock inicial')
+                    producto.stock = stock_inicial
             messages.success(request, f'Producto "{producto.nombre_producto}" creado exitosamente.')
             return redirect('lista_productos')
         else:
@@ -262,8 +308,28 @@ def editar_producto(request, producto_id):
     if request.method == 'POST':
         form = ProductoForm(request.POST, instance=producto)
         if form.is_valid():
-            producto_editado = form.save()
-            messages.success(request, f'Producto "{producto_editado.nombre_producto}" actualizado exitosamente.')
+            with transaction.atomic():
+                producto_editado = form.save(commit=False)
+                producto_editado.save(update_fields=['nombre_producto', 'descripcion', 'precio', 'stock_minimo'])
+                aplicado = True
+                diferencia = form.diferencia_stock()
+                if diferencia:
+                    # `ajustar` deshace solo su savepoint: los demás campos se guardan igual
+                    try:
+                        movimientos.ajustar(
+                            producto_editado.id_producto, diferencia, id_user=request.user.id, nota='Edición de producto'
+                        )
+                    except movimientos.StockInsuficiente:
+                        aplicado = False
+            producto_editado.refresh_from_db(fields=['stock'])
+            if aplicado:
+                messages.success(request, f'Producto "{producto_editado.nombre_producto}" actualizado exitosamente.')
+            else:
+                messages.warning(
+                    request,
+                    f'Se guardaron los demás datos de "{producto_editado.nombre_producto}", pero no el stock: '
+                    f'quedaría negativo (stock actual: {producto_editado.stock}).',
+                )
             
             # Verificar si el stock está bajo después de la edición
             if producto_editado.necesita_restock:
@@ -289,34 +355,109 @@ def eliminar_producto(request, producto_id):
     
     if request.method == 'POST':
         nombre_producto = producto.nombre_producto
-        producto.delete()
+        with transaction.atomic():
+            # Bloqueado: una venta del producto no puede entrar entre la revisión y el borrado
+            Productos.objects.select_for_update().filter(id_producto=producto_id).exists()
+            if DetallesVenta.objects.filter(id_producto=producto_id).exists():
+                messages.error(request, f'No se puede eliminar "{nombre_producto}": tiene ventas registradas.')
+                return redirect('lista_productos')
+            # Sin ventas, su libro de stock solo registra altas y ajustes: se borra con él
+            movimientos.olvidar_producto(producto_id)
+            # El pronóstico y los resúmenes son derivados; sin ventas, los resúmenes están en cero
+            PronosticoProducto.objects.filter(id_producto=producto_id).delete()
+            ResumenProductoDiario.objects.filter(id_producto=producto_id).delete()
+            producto.delete()
         messages.success(request, f'Producto "{nombre_producto}" eliminado exitosamente.')
         return redirect('lista_productos')
     
     return render(request, 'productos/eliminar.html', {'producto': producto})
 
 @login_required
-def dashboard_stock(request):
+@permission_required(['Task.add_productos', 'Task.change_productos'], raise_exception=True)
+@require_http_methods(["POST"])
+def importar_productos(request):
+    """Importa un CSV de productos (campo "archivo") y devuelve el resumen en JSON"""
+    archivo = request.FILES.get('archivo')
+    if archivo is None:
+        return JsonResponse({'success': False, 'errors': {'archivo': ['Selecciona un archivo CSV.']}}, status=400)
+    try:
+        resultado = importacion.importar_productos(
+            io.TextIOWrapper(archivo.file, encoding='utf-8-sig', newline=''),
+            simular=request.POST.get('simular') == '1',
+            id_user=request.user.id,
+            delimitador=request.POST.get('delimitador') or ',',
+        )
+    except (ImportacionInvalida, UnicodeDecodeError, csv.Error) as e:
+        return JsonResponse({'success': False, 'errors': {'archivo': [str(e)]}}, status=400)
+    return JsonResponse({'success': True, 'resultado': resultado})
+
+@login_required
+@require_http_methods(["GET"])
+def buscar_productos(request):
+    """Autocompletado de productos para el punto de venta (?q=texto&limite=10)"""
+    try:
+        limite = int(request.GET.get('limite', 10))
+    except ValueError:
+        limite = 10
+    resultados = busqueda.buscar_productos(request.GET.get('q', ''), limite)
+    return JsonResponse({'success': True, 'resultados': resultados})
+
+def _evento_sse(tipo, datos):
+    return f'event: {tipo}\ndata: {json.dumps(datos, cls=DjangoJSONEncoder)}\n\n'
+
+
+@login_required
+async def eventos_stock(request):
+    """Flujo SSE con los cambios de estado de stock para el dashboard (requiere servir con ASGI)"""
+    async def flujo():
+        async with avisos.escuchar() as cola:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    aviso = await asyncio.wait_for(cola.get(), timeout=avisos.LATIDO_SEGUNDOS)
+                except asyncio.TimeoutError:
+                    # Comentario SSE: mantiene viva la conexión a través de proxies
+                    yield ': latido\n\n'
+                    continue
+                yield _evento_sse('stock', aviso)
+
+    response = StreamingHttpResponse(flujo(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@login_required
+@de_reporte
+async def dashboard_stock(request):
     """Dashboard con alertas de stock y estadísticas"""
-    
-    productos_total = Productos.objects.count()
-    productos_bajo_stock = Productos.objects.filter(stock__lte=F('stock_minimo'))
-    productos_sin_stock = Productos.objects.filter(stock=0)
-    productos_stock_normal = Productos.objects.filter(stock__gt=F('stock_minimo'))
-    
-    # Productos que más necesitan restock (ordenados por diferencia entre stock y stock_minimo)
-    productos_criticos = productos_bajo_stock.extra(
-        select={'diferencia': 'stock_minimo - stock'}
-    ).order_by('-diferencia')[:5]
-    
+    resumen, proximos = await asyncio.gather(
+        asincrono.leer(resumen_stock),
+        asincrono.leer(pronosticos.proximos_a_agotarse),
+    )
+
     context = {
-        'productos_total': productos_total,
-        'productos_bajo_stock': productos_bajo_stock,
-        'productos_sin_stock': productos_sin_stock,
-        'productos_stock_normal': productos_stock_normal,
-        'productos_criticos': productos_criticos,
-        'alertas_count': productos_bajo_stock.count(),
-        'sin_stock_count': productos_sin_stock.count(),
+        'productos_total': resumen['total'],
+        'productos_bajo_stock': resumen['productos_bajo_stock'],
+        'productos_sin_stock': resumen['productos_sin_stock'],
+        'stock_normal_count': resumen['normal'],
+        # Productos que más necesitan restock (mayor diferencia entre stock_minimo y stock)
+        'productos_criticos': resumen['productos_criticos'],
+        'alertas_count': resumen['bajo_stock'],
+        'sin_stock_count': resumen['sin_stock'],
+        # Calculado cada noche por `calcular_pronosticos`; aquí solo se lee
+        'proximos_a_agotarse': proximos,
     }
     
-    return render(request, 'productos/dashboard.html', context)
\ No newline at end of file
+    return await asincrono.arender(request, 'productos/dashboard.html', context)
+
+
+@require_http_methods(["GET"])
+def metricas_prometheus(request):
+    """Métricas por vista en formato de texto de Prometheus (staff o token de METRICAS_TOKEN)"""
+    token = settings.METRICAS_TOKEN
+    autorizacion = request.headers.get('Authorization', '')
+    con_token = bool(token) and hmac.compare_digest(autorizacion, f'Bearer {token}')
+    if not con_token and not request.user.is_staff:
+        raise PermissionDenied("Se necesita un token o una cuenta de administrador.")
+    return HttpResponse(metricas.exportar(), content_type='text/plain; version=0.0.4; charset=utf-8')
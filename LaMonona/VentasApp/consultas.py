@@ -0,0 +1,97 @@
+from datetime import datetime, time, timedelta
+
+from django.db.models import Q
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+
+def rango_fechas(params):
+    """Convierte los parámetros `desde`/`hasta` (YYYY-MM-DD) en datetimes con zona horaria.
+
+    `hasta` es inclusivo: se devuelve el inicio del día siguiente para filtrar con `__lt`.
+    """
+    try:
+        desde = parse_date(params.get('desde') or '')
+        hasta = parse_date(params.get('hasta') or '')
+    except ValueError:
+        desde = hasta = None
+    return limites_dias(desde, hasta)
+
+
+def limites_dias(desde, hasta):
+    """Inicio de `desde` y del día siguiente a `hasta` en la zona horaria local (o None)"""
+    inicio = timezone.make_aware(datetime.combine(desde, time.min)) if desde else None
+    fin = timezone.make_aware(datetime.combine(hasta + timedelta(days=1), time.min)) if hasta else None
+    return inicio, fin
+
+
+def filtrar_ventas(queryset, params, campo_fecha='fecha_venta', prefijo=''):
+    """Aplica los filtros comunes de ventas (fechas, sucursal y cliente) a un queryset.
+
+    `prefijo` permite reutilizar los filtros sobre modelos relacionados,
+    por ejemplo `id_venta__` cuando se parte de `DetallesVenta`.
+    """
+    inicio, fin = rango_fechas(params)
+    if inicio:
+        queryset = queryset.filter(**{f'{prefijo}{campo_fecha}__gte': inicio})
+    if fin:
+        queryset = queryset.filter(**{f'{prefijo}{campo_fecha}__lt': fin})
+
+    sucursal = params.get('sucursal')
+    if sucursal and sucursal.isdigit():
+        queryset = queryset.filter(**{f'{prefijo}id_turno__id_caja__id_sucursal_id': int(sucursal)})
+
+    busqueda = (params.get('search[value]') or params.get('q') or '').strip()
+    if busqueda:
+        queryset = queryset.filter(**{f'{prefijo}nombre_cliente__icontains': busqueda})
+    return queryset
+
+
+def codificar_cursor(venta):
+    """Cursor opaco con la posición (fecha_venta, id_venta) de la última fila enviada"""
+    return f'{venta.fecha_venta.isoformat()}|{venta.id_venta}'
+
+
+def decodificar_cursor(cursor):
+    """Devuelve (fecha_venta, id_venta) o None si el cursor no es válido"""
+    if not cursor or '|' not in cursor:
+        return None
+    fecha, _, id_venta = cursor.rpartition('|')
+    fecha = parse_datetime(fecha)
+    if fecha is None or not id_venta.isdigit():
+        return None
+    return fecha, int(id_venta)
+
+
+def _consulta_keyset(queryset, cursor, tamano):
+    queryset = queryset.order_by('-fecha_venta', '-id_venta')
+    posicion = decodificar_cursor(cursor)
+    if posicion:
+        fecha, id_venta = posicion
+        queryset = queryset.filter(
+            Q(fecha_venta__lt=fecha) | Q(fecha_venta=fecha, id_venta__lt=id_venta)
+        )
+    # Pedimos una fila extra solo para saber si hay otra página
+    return queryset[:tamano + 1]
+
+
+def _pagina(filas, tamano):
+    hay_mas = len(filas) > tamano
+    filas = filas[:tamano]
+    siguiente = codificar_cursor(filas[-1]) if hay_mas and filas else None
+    return filas, siguiente
+
+
+def pagina_keyset(queryset, cursor=None, tamano=25):
+    """Pagina por búsqueda (keyset) en orden descendente de fecha_venta/id_venta.
+
+    En vez de OFFSET se filtra por la posición de la última fila vista, así que el
+    costo de cada página depende solo de `tamano` y no de cuántas ventas hay antes.
+    Devuelve (filas, siguiente_cursor); `siguiente_cursor` es None en la última página.
+    """
+    return _pagina(list(_consulta_keyset(queryset, cursor, tamano)), tamano)
+
+
+async def apagina_keyset(queryset, cursor=None, tamano=25):
+    """`pagina_keyset` con el ORM async"""
+    return _pagina([fila async for fila in _consulta_keyset(queryset, cursor, tamano)], tamano)
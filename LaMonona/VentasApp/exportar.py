@@ -0,0 +1,176 @@
+import csv
+import zipfile
+from datetime import datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.utils import timezone
+
+TAMANO_LOTE = 2000
+
+# Columnas de cada exportación: (encabezado, campo de values_list)
+COLUMNAS_VENTAS = [
+    ('ID Venta', 'id_venta'),
+    ('Fecha', 'fecha_venta'),
+    ('Cliente', 'nombre_cliente'),
+    ('Total', 'total_venta'),
+    ('Turno', 'id_turno_id'),
+    ('Caja', 'id_turno__id_caja_id'),
+    ('Sucursal', 'id_turno__id_caja__id_sucursal__nombre_sucursal'),
+]
+
+COLUMNAS_DETALLES = [
+    ('ID Venta', 'id_venta_id'),
+    ('Fecha', 'id_venta__fecha_venta'),
+    ('Cliente', 'id_venta__nombre_cliente'),
+    ('Turno', 'id_venta__id_turno_id'),
+    ('Caja', 'id_venta__id_turno__id_caja_id'),
+    ('Sucursal', 'id_venta__id_turno__id_caja__id_sucursal__nombre_sucursal'),
+    ('ID Producto', 'id_producto_id'),
+    ('Producto', 'id_producto__nombre_producto'),
+    ('Cantidad', 'cantidad'),
+    ('Subtotal', 'subtotal'),
+]
+
+
+class _Eco:
+    """Pseudo-archivo que devuelve lo escrito en lugar de guardarlo (patrón de la doc de Django)"""
+
+    def write(self, valor):
+        return valor
+
+
+def _filas(queryset, columnas):
+    """Recorre el queryset en orden de clave primaria, por lotes (keyset), sin cargarlo completo en memoria.
+
+    `iterator()` no alcanza: con mysqlclient Django no usa cursores del lado del
+    servidor y el resultado completo queda en el cliente. Cada lote es una consulta
+    `pk > último ORDER BY pk LIMIT TAMANO_LOTE`.
+    """
+    campos = [campo for _, campo in columnas]
+    pk = queryset.model._meta.pk.attname
+    queryset = queryset.order_by(pk).values_list(*campos, pk)
+    lote = list(queryset[:TAMANO_LOTE])
+    while lote:
+        for fila in lote:
+            yield fila[:-1]
+        if len(lote) < TAMANO_LOTE:
+            return
+        lote = list(queryset.filter(**{f'{pk}__gt': lote[-1][-1]})[:TAMANO_LOTE])
+
+
+def _texto(valor):
+    if isinstance(valor, datetime):
+        return timezone.localtime(valor).strftime('%Y-%m-%d %H:%M:%S')
+    return '' if valor is None else str(valor)
+
+
+def csv_por_lotes(queryset, columnas):
+    """Genera el CSV línea por línea; el primer fragmento (BOM + encabezados) sale de inmediato"""
+    escritor = csv.writer(_Eco())
+    yield '\ufeff' + escritor.writerow([encabezado for encabezado, _ in columnas])
+    for fila in _filas(queryset, columnas):
+        yield escritor.writerow([_texto(valor) for valor in fila])
+
+
+# ===== XLSX =====
+# Un .xlsx es un zip con varias partes XML. zipfile puede escribir en un flujo sin
+# `seek` (usa descriptores de datos), así que la hoja se comprime y se envía por
+# partes a medida que se generan las filas, sin armar el libro en memoria.
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="{nombre}" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_HOJA_INICIO = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main"><sheetData>'
+)
+_HOJA_FIN = '</sheetData></worksheet>'
+
+
+class _Buffer:
+    """Destino de zipfile que acumula bytes hasta que el generador los entrega"""
+
+    def __init__(self):
+        self.partes = []
+        self.posicion = 0
+
+    def write(self, datos):
+        self.partes.append(bytes(datos))
+        self.posicion += len(datos)
+        return len(datos)
+
+    def tell(self):
+        return self.posicion
+
+    def flush(self):
+        pass
+
+    def vaciar(self):
+        datos = b''.join(self.partes)
+        self.partes = []
+        return datos
+
+
+def _celda(valor):
+    if isinstance(valor, (int, float, Decimal)) and not isinstance(valor, bool):
+        return f'<c t="n"><v>{valor}</v></c>'
+    return f'<c t="inlineStr"><is><t>{escape(_texto(valor))}</t></is></c>'
+
+
+def _fila_xml(valores):
+    return '<row>' + ''.join(_celda(valor) for valor in valores) + '</row>'
+
+
+def xlsx_por_lotes(queryset, columnas, nombre_hoja='Ventas'):
+    """Genera un .xlsx de una hoja enviando los bytes comprimidos lote por lote"""
+    buffer = _Buffer()
+    with zipfile.ZipFile(buffer, mode='w', compression=zipfile.ZIP_DEFLATED) as libro:
+        libro.writestr('[Content_Types].xml', _CONTENT_TYPES)
+        libro.writestr('_rels/.rels', _RELS)
+        libro.writestr('xl/workbook.xml', _WORKBOOK.format(nombre=escape(nombre_hoja)))
+        libro.writestr('xl/_rels/workbook.xml.rels', _WORKBOOK_RELS)
+        yield buffer.vaciar()
+
+        with libro.open('xl/worksheets/sheet1.xml', mode='w', force_zip64=True) as hoja:
+            hoja.write((_HOJA_INICIO + _fila_xml(encabezado for encabezado, _ in columnas)).encode())
+            lote = []
+            for fila in _filas(queryset, columnas):
+                lote.append(_fila_xml(fila))
+                if len(lote) >= TAMANO_LOTE:
+                    hoja.write(''.join(lote).encode())
+                    lote = []
+                    yield buffer.vaciar()
+            hoja.write((''.join(lote) + _HOJA_FIN).encode())
+    yield buffer.vaciar()
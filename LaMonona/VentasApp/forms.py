@@ -36,3 +36,32 @@ class VentaForm(forms.ModelForm):
                 Submit('submit', '💾 Guardar Venta', css_class='btn btn-primary'),
             )
         )
+
+
+class CheckoutForm(forms.Form):
+    id_turno = forms.IntegerField(min_value=1, label='Turno de Caja')
+    nombre_cliente = forms.CharField(max_length=100, required=False, label='Nombre del Cliente')
+
+
+class VentaLoteForm(CheckoutForm):
+    clave = forms.CharField(max_length=64, label='Clave de idempotencia')
+    fecha_venta = forms.DateTimeField(required=False, label='Fecha de Venta')
+
+
+class LineaVentaForm(forms.Form):
+    id_producto = forms.IntegerField(min_value=1, label='Producto')
+    cantidad = forms.IntegerField(min_value=1, label='Cantidad')
+
+
+def validar_lineas(lineas):
+    """Valida la lista de líneas de un carrito; devuelve (lineas_limpias, errores)"""
+    if not isinstance(lineas, list) or not lineas:
+        return [], {'lineas': ['La venta debe tener al menos un producto.']}
+    limpias, errores = [], {}
+    for i, linea in enumerate(lineas):
+        form = LineaVentaForm(linea if isinstance(linea, dict) else {})
+        if form.is_valid():
+            limpias.append(form.cleaned_data)
+        else:
+            errores[f'lineas.{i}'] = form.errors
+    return limpias, errores
@@ -0,0 +1,27 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from VentasApp.resumenes import reconstruir
+
+
+class Command(BaseCommand):
+    help = 'Recalcula las tablas de resumen de ventas para un rango de fechas a partir de ventas y detalles_venta.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--desde', help='Fecha inicial (YYYY-MM-DD). Por defecto, hoy.')
+        parser.add_argument('--hasta', help='Fecha final inclusiva (YYYY-MM-DD). Por defecto, igual a --desde.')
+
+    def handle(self, *args, **options):
+        try:
+            desde = date.fromisoformat(options['desde']) if options['desde'] else timezone.localdate()
+            hasta = date.fromisoformat(options['hasta']) if options['hasta'] else desde
+        except ValueError as e:
+            raise CommandError(f'Fecha inválida: {e}')
+        if hasta < desde:
+            raise CommandError('--hasta no puede ser anterior a --desde.')
+
+        filas_ventas, filas_productos = reconstruir(desde, hasta)
+        self.stdout.write(self.style.SUCCESS(
+            f'Resúmenes {desde} a {hasta}: {filas_ventas} filas por turno, {filas_productos} filas por producto.'
+        ))
@@ -0,0 +1,125 @@
+"""Generación de reportes PDF (xhtml2pdf) fuera del ciclo de la petición.
+
+El HTML se arma en la vista con la plantilla de Django y el PDF se dibuja en un
+pool de procesos. Cada resultado se guarda en disco con el nombre del hash de su
+plantilla y datos, así que pedir el mismo reporte dos veces no lo vuelve a generar.
+Este módulo no importa modelos: los procesos del pool solo necesitan `_dibujar_pdf`.
+"""
+import hashlib
+import json
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.template.loader import render_to_string
+
+LISTO = 'listo'
+PENDIENTE = 'pendiente'
+ERROR = 'error'
+
+# Un ".pendiente" más viejo que esto se considera abandonado (p. ej. el proceso murió)
+PENDIENTE_VENCE_SEGUNDOS = 10 * 60
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _directorio():
+    directorio = Path(getattr(settings, 'REPORTES_PDF_DIR', Path(settings.BASE_DIR) / 'reportes_pdf'))
+    directorio.mkdir(parents=True, exist_ok=True)
+    return directorio
+
+
+def _obtener_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=getattr(settings, 'REPORTES_PDF_PROCESOS', 2),
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+        return _pool
+
+
+def clave_reporte(plantilla, datos):
+    """Hash estable de la plantilla y los datos del reporte"""
+    contenido = json.dumps({'plantilla': plantilla, 'datos': datos}, sort_keys=True, cls=DjangoJSONEncoder)
+    return hashlib.sha256(contenido.encode('utf-8')).hexdigest()
+
+
+def ruta_pdf(clave):
+    return _directorio() / f'{clave}.pdf'
+
+
+def estado(clave):
+    """LISTO, PENDIENTE, ERROR o None si el reporte nunca se pidió"""
+    directorio = _directorio()
+    if (directorio / f'{clave}.pdf').exists():
+        return LISTO
+    pendiente = directorio / f'{clave}.pendiente'
+    if pendiente.exists():
+        if time.time() - pendiente.stat().st_mtime < PENDIENTE_VENCE_SEGUNDOS:
+            return PENDIENTE
+        pendiente.unlink(missing_ok=True)
+    if (directorio / f'{clave}.error').exists():
+        return ERROR
+    return None
+
+
+def mensaje_error(clave):
+    try:
+        return (_directorio() / f'{clave}.error').read_text(encoding='utf-8')
+    except FileNotFoundError:
+        return ''
+
+
+def solicitar(plantilla, datos):
+    """Devuelve (clave, estado); si el PDF no existe, lo encola para generarlo.
+
+    El archivo `.pendiente` se crea con O_EXCL, así que aunque varios procesos web
+    pidan el mismo reporte a la vez solo uno lo manda a generar.
+    """
+    clave = clave_reporte(plantilla, datos)
+    actual = estado(clave)
+    if actual in (LISTO, PENDIENTE):
+        return clave, actual
+
+    directorio = _directorio()
+    (directorio / f'{clave}.error').unlink(missing_ok=True)
+    try:
+        descriptor = os.open(directorio / f'{clave}.pendiente', os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return clave, PENDIENTE
+    os.close(descriptor)
+
+    html = render_to_string(plantilla, datos)
+    futuro = _obtener_pool().submit(_dibujar_pdf, html, str(directorio / f'{clave}.pdf'))
+    futuro.add_done_callback(lambda f: _terminar(clave, f))
+    return clave, PENDIENTE
+
+
+def _terminar(clave, futuro):
+    directorio = _directorio()
+    error = futuro.exception()
+    if error is not None:
+        (directorio / f'{clave}.error').write_text(str(error) or error.__class__.__name__, encoding='utf-8')
+    (directorio / f'{clave}.pendiente').unlink(missing_ok=True)
+
+
+def _dibujar_pdf(html, destino):
+    """Se ejecuta en el pool: escribe el PDF en un temporal y lo renombra al terminar"""
+    from xhtml2pdf import pisa
+
+    temporal = f'{destino}.{os.getpid()}.tmp'
+    with open(temporal, 'wb') as archivo:
+        resultado = pisa.CreatePDF(html, dest=archivo, encoding='utf-8')
+    if resultado.err:
+        os.remove(temporal)
+        raise RuntimeError(f'xhtml2pdf reportó {resultado.err} error(es) al generar el PDF')
+    os.replace(temporal, destino)
+    return destino
@@ -0,0 +1,53 @@
+from django.db.models import Count, Sum
+from Task.models import DetallesVenta, Gastos, TurnosCaja, Ventas
+from .resumenes import productos_mas_vendidos, ventas_por_periodo
+
+
+def datos_reporte_turno(id_turno):
+    """Datos del reporte de cierre de turno, o None si el turno no existe.
+
+    Todo se devuelve como valores simples para poder calcular el hash del reporte.
+    """
+    turno = (
+        TurnosCaja.objects.filter(id_turno=id_turno)
+        .values(
+            'id_turno', 'fecha_apertura', 'fecha_cierre', 'ingresos_totales', 'egresos_totales', 'saldo_final',
+            'id_caja', 'id_caja__ubicacion', 'id_caja__id_sucursal__nombre_sucursal',
+            'id_empleado__nombre', 'id_empleado__apellido',
+        )
+        .first()
+    )
+    if turno is None:
+        return None
+
+    ventas = Ventas.objects.filter(id_turno=id_turno).aggregate(num_ventas=Count('id_venta'), total=Sum('total_venta'))
+    productos = list(
+        DetallesVenta.objects.filter(id_venta__id_turno=id_turno)
+        .values('id_producto', 'id_producto__nombre_producto')
+        .annotate(cantidad=Sum('cantidad'), total=Sum('subtotal'))
+        .order_by('-total')
+    )
+    gastos = list(
+        Gastos.objects.filter(id_turno=id_turno).order_by('fecha_gasto').values('fecha_gasto', 'concepto', 'monto')
+    )
+    return {
+        'turno': turno,
+        'ventas': ventas,
+        'productos': productos,
+        'gastos': gastos,
+        'total_gastos': sum((gasto['monto'] for gasto in gastos), 0),
+    }
+
+
+def datos_reporte_ventas(desde, hasta, sucursal=None):
+    """Datos del reporte de ventas por día y productos más vendidos (desde los resúmenes)"""
+    dias = ventas_por_periodo(desde, hasta, periodo='dia', sucursal=sucursal)
+    return {
+        'desde': desde,
+        'hasta': hasta,
+        'sucursal': sucursal,
+        'dias': dias,
+        'num_ventas': sum(dia['num_ventas'] or 0 for dia in dias),
+        'total_ventas': sum((dia['total_ventas'] or 0 for dia in dias), 0),
+        'productos': productos_mas_vendidos(desde, hasta, limite=20),
+    }
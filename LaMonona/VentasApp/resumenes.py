@@ -0,0 +1,214 @@
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Case, Count, F, Q, Sum, Value, When
+from django.db.models.functions import TruncDate, TruncMonth, TruncWeek
+from django.utils import timezone
+from Task.etiquetas import cacheado
+from Task.models import DetallesVenta, ResumenProductoDiario, ResumenVentasDiario, TurnosCaja, Ventas
+from .consultas import limites_dias
+
+CLAVE_VENTAS = ('fecha', 'id_sucursal_id', 'id_caja_id', 'id_turno_id')
+CLAVE_PRODUCTOS = ('fecha', 'id_producto_id')
+TAMANO_LOTE = 1000
+
+
+def ubicacion_turnos(ids_turno):
+    """{id_turno: (id_caja, id_sucursal)} en una sola consulta"""
+    return {
+        id_turno: (id_caja, id_sucursal)
+        for id_turno, id_caja, id_sucursal in TurnosCaja.objects.filter(id_turno__in=set(ids_turno)).values_list(
+            'id_turno', 'id_caja_id', 'id_caja__id_sucursal_id'
+        )
+    }
+
+
+def _incrementar(modelo, campos_clave, deltas):
+    """Suma `deltas` ({clave: {campo: delta}}) a las filas de resumen, creando las que falten.
+
+    Se hace con un SELECT ... FOR UPDATE de las claves, un UPDATE con CASE para las
+    existentes y un bulk_create para las nuevas. Si otra transacción crea la misma
+    fila en paralelo, el índice único lo detecta y se reintenta una vez.
+    """
+    if not deltas:
+        return
+    campos = sorted({campo for valores in deltas.values() for campo in valores})
+
+    def filtro(clave):
+        return Q(**dict(zip(campos_clave, clave)))
+
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                condicion = Q()
+                for clave in deltas:
+                    condicion |= filtro(clave)
+                existentes = set(
+                    modelo.objects.select_for_update().filter(condicion).order_by(*campos_clave).values_list(*campos_clave)
+                )
+
+                if existentes:
+                    condicion_existentes = Q()
+                    for clave in existentes:
+                        condicion_existentes |= filtro(clave)
+                    cambios = {}
+                    for campo in campos:
+                        cambios[campo] = F(campo) + Case(
+                            *[When(filtro(clave), then=Value(deltas[clave].get(campo, 0))) for clave in existentes],
+                            default=Value(0),
+                            output_field=modelo._meta.get_field(campo).clone(),
+                        )
+                    modelo.objects.filter(condicion_existentes).update(**cambios)
+
+                nuevas = [
+                    modelo(**dict(zip(campos_clave, clave)), **valores)
+                    for clave, valores in deltas.items()
+                    if clave not in existentes
+                ]
+                modelo.objects.bulk_create(nuevas)
+            return
+        except IntegrityError:
+            if intento:
+                raise
+
+
+def acumular_ventas(ventas, signo=1, turnos=None):
+    """Aplica ventas a las tablas de resumen; con `signo=-1` las descuenta.
+
+    Cada venta es un dict con `fecha_venta`, `id_turno`, `total_venta` y opcionalmente
+    `detalles`, una lista de (id_producto, cantidad, subtotal). `turnos` permite pasar
+    el resultado de `ubicacion_turnos` si quien llama ya lo tiene. Debe llamarse
+    dentro de la transacción que escribe la venta.
+    """
+    ventas = list(ventas)
+    if not ventas:
+        return
+    if turnos is None:
+        turnos = ubicacion_turnos(venta['id_turno'] for venta in ventas)
+
+    por_turno = defaultdict(lambda: {'num_ventas': 0, 'total_ventas': Decimal('0')})
+    por_producto = defaultdict(lambda: {'cantidad': 0, 'total_ventas': Decimal('0')})
+    for venta in ventas:
+        fecha = timezone.localdate(venta['fecha_venta'])
+        id_caja, id_sucursal = turnos[venta['id_turno']]
+        resumen = por_turno[(fecha, id_sucursal, id_caja, venta['id_turno'])]
+        resumen['num_ventas'] += signo
+        resumen['total_ventas'] += signo * Decimal(venta['total_venta'])
+        for id_producto, cantidad, subtotal in venta.get('detalles', ()):
+            resumen = por_producto[(fecha, id_producto)]
+            resumen['cantidad'] += signo * cantidad
+            resumen['total_ventas'] += signo * Decimal(subtotal)
+
+    _incrementar(ResumenVentasDiario, CLAVE_VENTAS, por_turno)
+    _incrementar(ResumenProductoDiario, CLAVE_PRODUCTOS, por_producto)
+
+
+def datos_venta(venta, detalles=None):
+    """Convierte una instancia de `Ventas` al formato que espera `acumular_ventas`"""
+    datos = {
+        'fecha_venta': venta.fecha_venta,
+        'id_turno': venta.id_turno_id,
+        'total_venta': venta.total_venta,
+    }
+    if detalles is None and venta.pk:
+        detalles = DetallesVenta.objects.filter(id_venta=venta).values_list('id_producto_id', 'cantidad', 'subtotal')
+    datos['detalles'] = list(detalles or ())
+    return datos
+
+
+def reconstruir(desde, hasta):
+    """Recalcula desde cero los resúmenes de las fechas [desde, hasta] (fechas locales).
+
+    Devuelve (filas_ventas, filas_productos) insertadas.
+    """
+    inicio, fin = limites_dias(desde, hasta)
+    with transaction.atomic():
+        ResumenVentasDiario.objects.filter(fecha__range=(desde, hasta)).delete()
+        ResumenProductoDiario.objects.filter(fecha__range=(desde, hasta)).delete()
+
+        ventas = (
+            Ventas.objects.filter(fecha_venta__gte=inicio, fecha_venta__lt=fin)
+            .annotate(dia=TruncDate('fecha_venta'))
+            .values('dia', 'id_turno', 'id_turno__id_caja', 'id_turno__id_caja__id_sucursal')
+            .annotate(num=Count('id_venta'), total=Sum('total_venta'))
+            .order_by()
+        )
+        filas_ventas = _insertar_por_lotes(ResumenVentasDiario, (
+            ResumenVentasDiario(
+                fecha=fila['dia'],
+                id_sucursal_id=fila['id_turno__id_caja__id_sucursal'],
+                id_caja_id=fila['id_turno__id_caja'],
+                id_turno_id=fila['id_turno'],
+                num_ventas=fila['num'],
+                total_ventas=fila['total'] or 0,
+            )
+            for fila in ventas.iterator(chunk_size=TAMANO_LOTE)
+        ))
+
+        detalles = (
+            DetallesVenta.objects.filter(id_venta__fecha_venta__gte=inicio, id_venta__fecha_venta__lt=fin)
+            .annotate(dia=TruncDate('id_venta__fecha_venta'))
+            .values('dia', 'id_producto')
+            .annotate(cantidad_total=Sum('cantidad'), total=Sum('subtotal'))
+            .order_by()
+        )
+        filas_productos = _insertar_por_lotes(ResumenProductoDiario, (
+            ResumenProductoDiario(
+                fecha=fila['dia'],
+                id_producto_id=fila['id_producto'],
+                cantidad=fila['cantidad_total'] or 0,
+                total_ventas=fila['total'] or 0,
+            )
+            for fila in detalles.iterator(chunk_size=TAMANO_LOTE)
+        ))
+    return filas_ventas, filas_productos
+
+
+def _insertar_por_lotes(modelo, filas):
+    total = 0
+    lote = []
+    for fila in filas:
+        lote.append(fila)
+        if len(lote) >= TAMANO_LOTE:
+            modelo.objects.bulk_create(lote)
+            total += len(lote)
+            lote = []
+    if lote:
+        modelo.objects.bulk_create(lote)
+        total += len(lote)
+    return total
+
+
+# ===== CONSULTAS DE REPORTE (leen solo las tablas de resumen) =====
+
+PERIODOS = {
+    'dia': F('fecha'),
+    'semana': TruncWeek('fecha'),
+    'mes': TruncMonth('fecha'),
+}
+
+
+@cacheado(['resumen_ventas_diario', 'sucursales'])
+def ventas_por_periodo(desde, hasta, periodo='dia', sucursal=None):
+    """Número de ventas y total por día/semana/mes (y sucursal) en el rango de fechas"""
+    resumen = ResumenVentasDiario.objects.filter(fecha__range=(desde, hasta))
+    if sucursal:
+        resumen = resumen.filter(id_sucursal_id=sucursal)
+    return list(
+        resumen.annotate(periodo=PERIODOS.get(periodo, PERIODOS['dia']))
+        .values('periodo', 'id_sucursal', 'id_sucursal__nombre_sucursal')
+        .annotate(num_ventas=Sum('num_ventas'), total_ventas=Sum('total_ventas'))
+        .order_by('periodo', 'id_sucursal')
+    )
+
+
+@cacheado(['resumen_producto_diario', 'productos'])
+def productos_mas_vendidos(desde, hasta, limite=10):
+    """Productos con más unidades vendidas en el rango de fechas"""
+    return list(
+        ResumenProductoDiario.objects.filter(fecha__range=(desde, hasta))
+        .values('id_producto', 'id_producto__nombre_producto')
+        .annotate(cantidad=Sum('cantidad'), total_ventas=Sum('total_ventas'))
+        .order_by('-cantidad')[:limite]
+    )
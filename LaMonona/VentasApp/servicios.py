@@ -0,0 +1,279 @@
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.utils import timezone
+from Task import etiquetas, movimientos
+from Task.models import DetallesVenta, MovimientoStock, Productos, TurnosCaja, VentaIdempotencia, Ventas
+from .resumenes import acumular_ventas, datos_venta
+
+CENTAVOS = Decimal('0.01')
+
+CREADA = 'creada'
+DUPLICADA = 'duplicada'
+RECHAZADA = 'rechazada'
+
+
+class VentaRechazada(Exception):
+    """La venta no se puede registrar; `errores` tiene el mismo formato que `form.errors`"""
+
+    def __init__(self, errores):
+        super().__init__(errores)
+        self.errores = errores
+
+
+def agrupar_lineas(lineas):
+    """Suma las cantidades de un mismo producto: {id_producto: cantidad} en el orden del carrito"""
+    cantidades = {}
+    for linea in lineas:
+        id_producto = linea['id_producto']
+        cantidades[id_producto] = cantidades.get(id_producto, 0) + linea['cantidad']
+    return cantidades
+
+
+def productos_sin_stock(cantidades):
+    """Nombres de los productos cuyo stock no alcanza para la cantidad pedida"""
+    productos = Productos.objects.filter(id_producto__in=cantidades).values_list('id_producto', 'nombre_producto', 'stock')
+    return [
+        f'{nombre} (disponible: {stock}, solicitado: {cantidades[id_producto]})'
+        for id_producto, nombre, stock in productos
+        if stock < cantidades[id_producto]
+    ]
+
+
+def movimientos_venta(detalles):
+    """Un movimiento de salida por cada línea de venta (los detalles ya tienen su venta asignada)"""
+    return [
+        MovimientoStock(
+            id_producto_id=detalle.id_producto_id,
+            tipo=movimientos.VENTA,
+            cantidad=-detalle.cantidad,
+            id_venta=detalle.id_venta,
+        )
+        for detalle in detalles
+    ]
+
+
+def construir_detalles(cantidades, precios):
+    """Crea los `DetallesVenta` (sin guardar) y calcula el total con Decimal"""
+    detalles = []
+    total = Decimal('0.00')
+    for id_producto, cantidad in cantidades.items():
+        subtotal = (precios[id_producto] * cantidad).quantize(CENTAVOS)
+        total += subtotal
+        detalles.append(DetallesVenta(id_producto_id=id_producto, cantidad=cantidad, subtotal=subtotal))
+    return detalles, total
+
+
+def registrar_venta(id_turno, lineas, nombre_cliente=None, fecha_venta=None):
+    """Registra una venta completa (encabezado + detalles) y descuenta el stock.
+
+    Todo ocurre en una transacción y con un número fijo de consultas, sin importar
+    cuántas líneas tenga el carrito; las tablas de resumen se actualizan en la misma
+    transacción. Los precios y totales se calculan en el servidor.
+    Lanza `VentaRechazada` si el turno no está abierto, falta algún producto o no hay stock.
+    """
+    cantidades = agrupar_lineas(lineas)
+    if not cantidades:
+        raise VentaRechazada({'lineas': ['La venta debe tener al menos un producto.']})
+
+    try:
+        with transaction.atomic():
+            # El turno queda bloqueado hasta confirmar la venta: `cerrar_turno` espera y sus
+            # montos la incluyen. Se revisa el cierre después de obtener el bloqueo.
+            fila = TurnosCaja.objects.select_for_update().filter(id_turno=id_turno).values_list(
+                'id_caja_id', 'id_caja__id_sucursal_id', 'fecha_cierre'
+            ).first()
+            if fila is None or fila[2] is not None:
+                raise VentaRechazada({'id_turno': ['El turno no existe o ya está cerrado.']})
+            turno = fila[:2]
+
+            precios = dict(Productos.objects.filter(id_producto__in=cantidades).values_list('id_producto', 'precio'))
+            faltantes = [str(id_producto) for id_producto in cantidades if id_producto not in precios]
+            if faltantes:
+                raise VentaRechazada({'lineas': [f'Productos inexistentes: {", ".join(faltantes)}.']})
+
+            detalles, total = construir_detalles(cantidades, precios)
+            venta = Ventas.objects.create(
+                id_turno_id=id_turno,
+                nombre_cliente=nombre_cliente or None,
+                fecha_venta=fecha_venta or timezone.now(),
+                total_venta=total,
+            )
+            for detalle in detalles:
+                detalle.id_venta = venta
+            # Si algún producto no alcanza, la excepción deshace también el encabezado
+            movimientos.aplicar(movimientos_venta(detalles))
+            DetallesVenta.objects.bulk_create(detalles)
+
+            acumular_ventas([{
+                'fecha_venta': venta.fecha_venta,
+                'id_turno': id_turno,
+                'total_venta': total,
+                'detalles': [(d.id_producto_id, d.cantidad, d.subtotal) for d in detalles],
+            }], turnos={id_turno: turno})
+    except movimientos.StockInsuficiente:
+        # Se lee después del rollback, con el stock que había antes de la venta
+        raise VentaRechazada({'stock': productos_sin_stock(cantidades) or ['Stock insuficiente.']})
+
+    return venta
+
+
+def borrar_venta(venta):
+    """Borra una venta con sus detalles, la descuenta de los resúmenes y devuelve su stock.
+
+    El libro de movimientos no pierde filas: se registra una devolución por cada
+    producto vendido y los movimientos de la venta quedan sin venta asociada.
+    """
+    with transaction.atomic():
+        acumular_ventas([datos_venta(venta)], signo=-1)
+        vendidos = MovimientoStock.objects.filter(id_venta=venta)
+        devoluciones = [
+            MovimientoStock(
+                id_producto_id=id_producto, tipo=movimientos.DEVOLUCION, cantidad=-cantidad,
+                nota=f'Venta #{venta.id_venta} eliminada',
+            )
+            for id_producto, cantidad in vendidos.values_list('id_producto_id').annotate(cantidad=Sum('cantidad'))
+            if cantidad
+        ]
+        vendidos.update(id_venta=None)
+        movimientos.aplicar(devoluciones)
+        DetallesVenta.objects.filter(id_venta=venta).delete()
+        VentaIdempotencia.objects.filter(id_venta=venta).delete()
+        venta.delete()
+
+
+def registrar_lote(ventas):
+    """Registra un lote de ventas enviado por una terminal, de forma idempotente.
+
+    Cada venta es un dict con `clave`, `id_turno`, `lineas` y opcionalmente
+    `nombre_cliente` y `fecha_venta`. Devuelve un resultado por venta, en el mismo
+    orden: `creada`, `duplicada` (la clave ya se había registrado) o `rechazada`
+    (p. ej. si su turno no existe o ya está cerrado). Los turnos del lote quedan
+    bloqueados hasta el final, así que no se pueden cerrar a mitad del registro.
+    Si otro proceso registra la misma clave a la vez, el índice único de
+    `VentaIdempotencia` lo detecta y el lote se reintenta una vez.
+    """
+    for intento in range(2):
+        try:
+            with transaction.atomic():
+                return _registrar_lote(ventas)
+        except IntegrityError:
+            if intento:
+                raise
+
+
+def _registrar_lote(ventas):
+    resultados = [{'clave': venta['clave']} for venta in ventas]
+    claves = {venta['clave'] for venta in ventas}
+    registradas = dict(
+        VentaIdempotencia.objects.filter(clave__in=claves).values_list('clave', 'id_venta_id')
+    )
+    # Bloqueados (en orden, para no cruzarse con otro lote): no se pueden cerrar durante el registro
+    turnos, cerrados = {}, set()
+    for id_turno, id_caja, id_sucursal, fecha_cierre in (
+        TurnosCaja.objects.select_for_update()
+        .filter(id_turno__in={venta['id_turno'] for venta in ventas})
+        .order_by('id_turno')
+        .values_list('id_turno', 'id_caja_id', 'id_caja__id_sucursal_id', 'fecha_cierre')
+    ):
+        turnos[id_turno] = (id_caja, id_sucursal)
+        if fecha_cierre is not None:
+            cerrados.add(id_turno)
+
+    # Bloqueamos los productos del lote y simulamos el descuento venta por venta
+    productos = {
+        id_producto: [precio, stock]
+        for id_producto, precio, stock in Productos.objects.select_for_update()
+        .filter(id_producto__in={linea['id_producto'] for venta in ventas for linea in venta['lineas']})
+        .order_by('id_producto')
+        .values_list('id_producto', 'precio', 'stock')
+    }
+
+    aceptadas = []  # (indice, venta, cantidades)
+    vistas = set()
+    for indice, venta in enumerate(ventas):
+        clave = venta['clave']
+        if clave in registradas or clave in vistas:
+            resultados[indice]['estado'] = DUPLICADA
+            continue
+        errores = {}
+        cantidades = agrupar_lineas(venta['lineas'])
+        if venta['id_turno'] not in turnos:
+            errores['id_turno'] = ['El turno no existe.']
+        elif venta['id_turno'] in cerrados:
+            errores['id_turno'] = ['El turno ya está cerrado.']
+        faltantes = [str(id_producto) for id_producto in cantidades if id_producto not in productos]
+        if faltantes:
+            errores['lineas'] = [f'Productos inexistentes: {", ".join(faltantes)}.']
+        elif any(productos[id_producto][1] < cantidad for id_producto, cantidad in cantidades.items()):
+            errores['stock'] = ['Stock insuficiente.']
+        if errores:
+            resultados[indice].update(estado=RECHAZADA, errores=errores)
+            continue
+        for id_producto, cantidad in cantidades.items():
+            productos[id_producto][1] -= cantidad
+        vistas.add(clave)
+        aceptadas.append((indice, venta, cantidades))
+
+    if not aceptadas:
+        return _completar_duplicadas(resultados, registradas)
+
+    ahora = timezone.now()
+    precios = {id_producto: precio for id_producto, (precio, _) in productos.items()}
+    encabezados, detalles_por_venta = [], []
+    for _, venta, cantidades in aceptadas:
+        detalles, total = construir_detalles(cantidades, precios)
+        encabezados.append(Ventas(
+            id_turno_id=venta['id_turno'],
+            nombre_cliente=venta.get('nombre_cliente') or None,
+            fecha_venta=venta.get('fecha_venta') or ahora,
+            total_venta=total,
+        ))
+        detalles_por_venta.append(detalles)
+
+    # MySQL no devuelve los ids de un INSERT múltiple; ahí los encabezados se insertan uno a uno
+    if connection.features.can_return_rows_from_bulk_insert:
+        Ventas.objects.bulk_create(encabezados)
+        etiquetas.invalidar_al_confirmar(*{f'turno:{encabezado.id_turno_id}' for encabezado in encabezados})
+    else:
+        for encabezado in encabezados:
+            encabezado.save(force_insert=True)
+
+    todos_detalles = []
+    for encabezado, detalles in zip(encabezados, detalles_por_venta):
+        for detalle in detalles:
+            detalle.id_venta = encabezado
+        todos_detalles.extend(detalles)
+    try:
+        movimientos.aplicar(movimientos_venta(todos_detalles))
+    except movimientos.StockInsuficiente:
+        # No debería pasar: las filas están bloqueadas desde la simulación
+        raise VentaRechazada({'stock': ['El stock cambió durante el registro del lote.']})
+    DetallesVenta.objects.bulk_create(todos_detalles)
+    VentaIdempotencia.objects.bulk_create([
+        VentaIdempotencia(clave=venta['clave'], id_venta=encabezado, fecha_registro=ahora)
+        for (_, venta, _), encabezado in zip(aceptadas, encabezados)
+    ])
+
+    acumular_ventas([
+        {
+            'fecha_venta': encabezado.fecha_venta,
+            'id_turno': encabezado.id_turno_id,
+            'total_venta': encabezado.total_venta,
+            'detalles': [(d.id_producto_id, d.cantidad, d.subtotal) for d in detalles],
+        }
+        for encabezado, detalles in zip(encabezados, detalles_por_venta)
+    ], turnos=turnos)
+
+    for (indice, venta, _), encabezado in zip(aceptadas, encabezados):
+        resultados[indice].update(estado=CREADA, id_venta=encabezado.id_venta)
+        registradas[venta['clave']] = encabezado.id_venta
+    return _completar_duplicadas(resultados, registradas)
+
+
+def _completar_duplicadas(resultados, registradas):
+    for resultado in resultados:
+        if resultado.get('estado') == DUPLICADA:
+            resultado['id_venta'] = registradas.get(resultado['clave'])
+    return resultados
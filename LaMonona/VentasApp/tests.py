@@ -1,3 +1,444 @@
-from django.test import TestCase
+import json
+import os
+import tempfile
+import time
+import unittest
+from concurrent.futures import Future
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import IntegrityError, connection
+from django.template.loader import render_to_string
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from Task.models import (
+    Cajas, DetallesVenta, Empleados, MovimientoStock, Productos, ResumenProductoDiario, ResumenVentasDiario, Sucursales,
+    TurnosCaja, Ventas,
+)
+from Task.pruebas import PresupuestoConsultasMixin
+from . import exportar, pdf, servicios
+from .reportes import datos_reporte_turno
+from .resumenes import reconstruir
+from .servicios import CREADA, DUPLICADA, RECHAZADA, VentaRechazada, registrar_lote, registrar_venta
+
+try:
+    import xhtml2pdf
+except ImportError:
+    xhtml2pdf = None
+
+
+class PresupuestosVentasTests(PresupuestoConsultasMixin, TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('vendedor', 'vendedor@lamonona.com', 'clave')
+        empleado = Empleados.objects.create(nombre='Vero', apellido='Venta', correo='vendedor@lamonona.com', id_user_id=cls.usuario.id)
+        sucursal = Sucursales.objects.create(nombre_sucursal='Centro')
+        caja = Cajas.objects.create(id_sucursal=sucursal, estado='Abierta')
+        ahora = timezone.now()
+        turnos = [TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=ahora) for _ in range(3)]
+        Ventas.objects.bulk_create(
+            Ventas(id_turno=turnos[i % 3], nombre_cliente=f'Cliente {i}', fecha_venta=ahora - timedelta(hours=i), total_venta=Decimal('12.50'))
+            for i in range(30)
+        )
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.usuario)
+
+    def test_lista_ventas(self):
+        self.get_con_presupuesto('lista_ventas')
+
+    def test_datos_ventas(self):
+        respuesta = self.get_con_presupuesto('datos_ventas', datos={'length': 25})
+        self.assertEqual(len(respuesta.json()['data']), 25)
+        respuesta = self.get_con_presupuesto('datos_ventas', datos={'length': 25, 'cursor': respuesta.json()['cursor']})
+        self.assertEqual(len(respuesta.json()['data']), 5)
+
+    def test_datos_ventas_con_parametros_invalidos(self):
+        respuesta = self.client.get(reverse('datos_ventas'), {'draw': 'x', 'length': 'y'})
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['draw'], 0)
+
+    def test_resumen(self):
+        self.get_con_presupuesto('reporte_resumen')
+
+    @mock.patch.object(exportar, 'TAMANO_LOTE', 7)
+    def test_exportar_csv_por_lotes(self):
+        respuesta = self.client.get(reverse('exportar_ventas', args=['ventas', 'csv']))
+        lineas = b''.join(respuesta.streaming_content).decode().splitlines()
+        ids = [int(linea.split(',')[0]) for linea in lineas[1:]]
+        self.assertEqual(ids, sorted(Ventas.objects.values_list('id_venta', flat=True)))
+
+
+class RegistrarVentaTests(TestCase):
+    """Invariantes del checkout: todo o nada, precios del servidor y consultas fijas"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('cajera', 'cajera@lamonona.com', 'clave')
+        empleado = Empleados.objects.create(nombre='Caro', apellido='Caja', correo='cajera@lamonona.com', id_user_id=cls.usuario.id)
+        caja = Cajas.objects.create(id_sucursal=Sucursales.objects.create(nombre_sucursal='Centro'), estado='Abierta')
+        cls.turno = TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+        cls.productos = [
+            Productos.objects.create(nombre_producto=f'Globo {i}', precio=Decimal('0.10') * (i + 1), stock=10, stock_minimo=1)
+            for i in range(4)
+        ]
+
+    def setUp(self):
+        cache.clear()
+
+    def _lineas(self, *cantidades):
+        return [
+            {'id_producto': producto.id_producto, 'cantidad': cantidad}
+            for producto, cantidad in zip(self.productos, cantidades)
+        ]
+
+    def test_total_calculado_en_el_servidor(self):
+        self.client.force_login(self.usuario)
+        lineas = [{**linea, 'precio': '0.01', 'subtotal': '0.01'} for linea in self._lineas(3, 1)]
+        respuesta = self.client.post(
+            reverse('checkout'),
+            json.dumps({'id_turno': self.turno.id_turno, 'lineas': lineas, 'total_venta': '0.01'}),
+            content_type='application/json',
+        )
+        self.assertEqual(respuesta.status_code, 200)
+        self.assertEqual(respuesta.json()['total_venta'], '0.50')
+        venta = Ventas.objects.get(pk=respuesta.json()['id_venta'])
+        self.assertEqual(venta.total_venta, Decimal('0.50'))
+        self.assertEqual(
+            sorted(DetallesVenta.objects.filter(id_venta=venta).values_list('subtotal', flat=True)),
+            [Decimal('0.20'), Decimal('0.30')],
+        )
+
+    def test_descuenta_stock_y_registra_movimientos(self):
+        venta = registrar_venta(self.turno.id_turno, self._lineas(3, 1) + self._lineas(2))
+        self.assertEqual(Productos.objects.get(pk=self.productos[0].pk).stock, 5)
+        self.assertEqual(Productos.objects.get(pk=self.productos[1].pk).stock, 9)
+        self.assertEqual(
+            sorted(MovimientoStock.objects.filter(id_venta=venta).values_list('id_producto_id', 'cantidad')),
+            [(self.productos[0].pk, -5), (self.productos[1].pk, -1)],
+        )
+
+    def test_sin_stock_deshace_toda_la_venta(self):
+        with self.assertRaises(VentaRechazada) as error:
+            registrar_venta(self.turno.id_turno, self._lineas(3, 11))
+        self.assertIn('stock', error.exception.errores)
+        self.assertFalse(Ventas.objects.exists())
+        self.assertFalse(DetallesVenta.objects.exists())
+        self.assertFalse(MovimientoStock.objects.exists())
+        self.assertFalse(ResumenVentasDiario.objects.exists())
+        self.assertEqual([producto.stock for producto in Productos.objects.order_by('pk')], [10] * 4)
+
+    def test_turno_cerrado(self):
+        TurnosCaja.objects.filter(pk=self.turno.pk).update(fecha_cierre=timezone.now())
+        with self.assertRaises(VentaRechazada) as error:
+            registrar_venta(self.turno.id_turno, self._lineas(1))
+        self.assertIn('id_turno', error.exception.errores)
+
+    def test_consultas_fijas(self):
+        # La primera venta crea las filas de resumen; las siguientes solo las actualizan
+        registrar_venta(self.turno.id_turno, self._lineas(1, 1, 1, 1))
+        consultas = []
+        for lineas in (self._lineas(1), self._lineas(1, 2, 1, 2)):
+            with CaptureQueriesContext(connection) as capturadas:
+                registrar_venta(self.turno.id_turno, lineas)
+            consultas.append(len(capturadas))
+        self.assertEqual(consultas[0], consultas[1])
+
+
+class ResumenDiarioTests(TestCase):
+    """Las tablas de resumen siguen a cada alta, edición y baja, y `reconstruir` llega a lo mismo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_user('rita', 'rita@lamonona.com', 'clave')
+        empleado = Empleados.objects.create(nombre='Rita', apellido='Resumen', correo='rita@lamonona.com', id_user_id=usuario.id)
+        caja = Cajas.objects.create(id_sucursal=Sucursales.objects.create(nombre_sucursal='Norte'), estado='Abierta')
+        cls.turnos = [
+            TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+            for _ in range(2)
+        ]
+        cls.producto = Productos.objects.create(nombre_producto='Trompo', precio=Decimal('2.50'), stock=100, stock_minimo=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def _vender(self, cantidad, turno=0, dias_atras=0):
+        return registrar_venta(
+            self.turnos[turno].id_turno, [{'id_producto': self.producto.id_producto, 'cantidad': cantidad}],
+            fecha_venta=timezone.now() - timedelta(days=dias_atras),
+        )
+
+    def _resumenes(self):
+        # Las filas que quedan en cero después de una baja equivalen a no tener fila
+        ventas = {
+            (fila.fecha, fila.id_turno_id): (fila.num_ventas, fila.total_ventas)
+            for fila in ResumenVentasDiario.objects.exclude(num_ventas=0)
+        }
+        productos = {
+            (fila.fecha, fila.id_producto_id): (fila.cantidad, fila.total_ventas)
+            for fila in ResumenProductoDiario.objects.exclude(cantidad=0)
+        }
+        return ventas, productos
+
+    def test_alta_edicion_y_baja(self):
+        hoy = timezone.localdate()
+        venta = self._vender(2)
+        self._vender(1)
+        turno_0, turno_1 = (turno.id_turno for turno in self.turnos)
+        self.assertEqual(self._resumenes(), (
+            {(hoy, turno_0): (2, Decimal('7.50'))},
+            {(hoy, self.producto.pk): (3, Decimal('7.50'))},
+        ))
+
+        ayer = timezone.localtime(timezone.now() - timedelta(days=1))
+        self.client.post(reverse('editar_venta', args=[venta.id_venta]), {
+            'id_turno': turno_1, 'fecha_venta': ayer.strftime('%Y-%m-%d %H:%M'), 'total_venta': '4.00',
+        })
+        self.assertEqual(self._resumenes(), (
+            {(hoy, turno_0): (1, Decimal('2.50')), (ayer.date(), turno_1): (1, Decimal('4.00'))},
+            {(hoy, self.producto.pk): (1, Decimal('2.50')), (ayer.date(), self.producto.pk): (2, Decimal('5.00'))},
+        ))
+
+        self.client.post(reverse('eliminar_venta', args=[venta.id_venta]))
+        self.assertFalse(Ventas.objects.filter(pk=venta.pk).exists())
+        self.assertEqual(Productos.objects.get(pk=self.producto.pk).stock, 99)
+        self.assertEqual(self._resumenes(), (
+            {(hoy, turno_0): (1, Decimal('2.50'))},
+            {(hoy, self.producto.pk): (1, Decimal('2.50'))},
+        ))
+
+    def test_reconstruir_llega_a_los_mismos_totales(self):
+        for dias_atras in range(3):
+            for turno in range(2):
+                self._vender(dias_atras + turno + 1, turno=turno, dias_atras=dias_atras)
+        incremental = self._resumenes()
+        hoy = timezone.localdate()
+        reconstruir(hoy - timedelta(days=2), hoy)
+        self.assertEqual(self._resumenes(), incremental)
+        self.assertEqual(len(incremental[0]), 6)
+
+
+class RegistrarLoteTests(TestCase):
+    """Lotes de terminales sin conexión: idempotentes y solo sobre turnos abiertos"""
+
+    @classmethod
+    def setUpTestData(cls):
+        usuario = User.objects.create_user('terminal', 'terminal@lamonona.com', 'clave')
+        empleado = Empleados.objects.create(nombre='Tere', apellido='Terminal', correo='terminal@lamonona.com', id_user_id=usuario.id)
+        caja = Cajas.objects.create(id_sucursal=Sucursales.objects.create(nombre_sucursal='Sur'), estado='Abierta')
+        cls.abierto = TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+        cls.cerrado = TurnosCaja.objects.create(
+            id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now() - timedelta(days=1),
+            fecha_cierre=timezone.now() - timedelta(hours=12), ingresos_totales=0, egresos_totales=0, saldo_final=0,
+        )
+        cls.producto = Productos.objects.create(nombre_producto='Yoyo', precio=Decimal('3.00'), stock=10, stock_minimo=1)
+
+    def setUp(self):
+        cache.clear()
+
+    def _venta(self, clave, turno=None, cantidad=1):
+        return {
+            'clave': clave, 'id_turno': (turno or self.abierto).id_turno,
+            'lineas': [{'id_producto': self.producto.id_producto, 'cantidad': cantidad}],
+        }
+
+    def test_reenviar_el_lote_no_duplica(self):
+        lote = [self._venta('a'), self._venta('b', cantidad=2), self._venta('a')]
+        primero = registrar_lote(lote)
+        self.assertEqual([resultado['estado'] for resultado in primero], [CREADA, CREADA, DUPLICADA])
+        self.assertEqual(primero[2]['id_venta'], primero[0]['id_venta'])
+
+        segundo = registrar_lote(lote)
+        self.assertEqual([resultado['estado'] for resultado in segundo], [DUPLICADA] * 3)
+        self.assertEqual(
+            [resultado['id_venta'] for resultado in segundo], [resultado['id_venta'] for resultado in primero],
+        )
+        self.assertEqual(Ventas.objects.count(), 2)
+        self.assertEqual(Productos.objects.get(pk=self.producto.pk).stock, 7)
+
+    def test_reintenta_una_vez_si_otra_terminal_registra_la_clave(self):
+        original = servicios._registrar_lote
+        llamadas = []
+
+        def con_conflicto(ventas):
+            llamadas.append(ventas)
+            if len(llamadas) == 1:
+                raise IntegrityError('UNIQUE constraint failed: ventas_idempotencia.clave')
+            return original(ventas)
+
+        with mock.patch.object(servicios, '_registrar_lote', side_effect=con_conflicto):
+            resultados = registrar_lote([self._venta('a')])
+        self.assertEqual(len(llamadas), 2)
+        self.assertEqual(resultados[0]['estado'], CREADA)
+
+        with mock.patch.object(servicios, '_registrar_lote', side_effect=IntegrityError('otra vez')):
+            with self.assertRaises(IntegrityError):
+                registrar_lote([self._venta('b')])
+
+    def test_rechaza_ventas_de_turnos_cerrados(self):
+        resultados = registrar_lote([self._venta('a', turno=self.cerrado), self._venta('b')])
+        self.assertEqual([resultado['estado'] for resultado in resultados], [RECHAZADA, CREADA])
+        self.assertIn('id_turno', resultados[0]['errores'])
+        self.assertFalse(Ventas.objects.filter(id_turno=self.cerrado).exists())
+        self.assertEqual(Productos.objects.get(pk=self.producto.pk).stock, 9)
+
+
+class _PoolManual:
+    """Hace de pool de procesos: guarda cada trabajo y la prueba decide cuándo termina"""
+
+    def __init__(self):
+        self.trabajos = []
+
+    def submit(self, funcion, html, destino):
+        futuro = Future()
+        self.trabajos.append((futuro, html, destino))
+        return futuro
+
+    def terminar(self, indice=-1, error=None):
+        futuro, _, destino = self.trabajos[indice]
+        if error is not None:
+            futuro.set_exception(error)
+            return
+        with open(destino, 'wb') as archivo:
+            archivo.write(b'%PDF-1.4 prueba')
+        futuro.set_result(destino)
+
+
+class ReportesPdfTests(TestCase):
+    """Cola de reportes PDF: pendiente, listo y cacheado por hash, sin generar dos veces el mismo"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.usuario = User.objects.create_user('gerente', 'gerente@lamonona.com', 'clave')
+        empleado = Empleados.objects.create(nombre='Gero', apellido='Ente', correo='gerente@lamonona.com', id_user_id=cls.usuario.id)
+        caja = Cajas.objects.create(id_sucursal=Sucursales.objects.create(nombre_sucursal='Centro'), estado='Abierta')
+        cls.turno = TurnosCaja.objects.create(id_caja=caja, id_empleado=empleado, fecha_apertura=timezone.now())
+        cls.producto = Productos.objects.create(nombre_producto='Globo', precio=Decimal('1.50'), stock=10, stock_minimo=1)
+
+    def setUp(self):
+        cache.clear()
+        directorio = tempfile.TemporaryDirectory()
+        self.addCleanup(directorio.cleanup)
+        self.directorio = directorio.name
+        ajustes = override_settings(REPORTES_PDF_DIR=self.directorio)
+        ajustes.enable()
+        self.addCleanup(ajustes.disable)
+        self.pool = _PoolManual()
+        parche = mock.patch.object(pdf, '_obtener_pool', return_value=self.pool)
+        parche.start()
+        self.addCleanup(parche.stop)
+        self.client.force_login(self.usuario)
+
+    def _pedir_turno(self):
+        return self.client.get(reverse('reporte_turno_pdf', args=[self.turno.id_turno]))
+
+    def _archivo(self, clave, extension):
+        return os.path.join(self.directorio, f'{clave}.{extension}')
+
+    def test_pendiente_listo_y_cacheado(self):
+        respuesta = self._pedir_turno()
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(respuesta.json()['estado'], pdf.PENDIENTE)
+        clave = respuesta.json()['url_estado'].split('/')[-3]
+        self.assertEqual(len(self.pool.trabajos), 1)
+        self.assertTrue(os.path.exists(self._archivo(clave, 'pendiente')))
+        self.assertEqual(self.client.get(respuesta.json()['url_estado']).json(), {'estado': pdf.PENDIENTE})
+        self.assertEqual(self.client.get(respuesta.json()['url_descarga']).status_code, 404)
+
+        # Pedirlo otra vez mientras se genera no lo vuelve a encolar
+        self.assertEqual(self._pedir_turno().status_code, 202)
+        self.assertEqual(len(self.pool.trabajos), 1)
+
+        self.pool.terminar()
+        self.assertFalse(os.path.exists(self._archivo(clave, 'pendiente')))
+        estado = self.client.get(respuesta.json()['url_estado'])
+        self.assertEqual(estado.status_code, 200)
+        self.assertEqual(estado.json(), {'estado': pdf.LISTO, 'url_descarga': respuesta.json()['url_descarga']})
+        descarga = self.client.get(respuesta.json()['url_descarga'])
+        self.assertEqual(descarga.status_code, 200)
+        self.assertEqual(descarga['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(descarga.streaming_content), b'%PDF-1.4 prueba')
+
+        # Ya generado: la vista entrega el archivo sin encolar nada
+        cacheado = self._pedir_turno()
+        self.assertEqual(cacheado.status_code, 200)
+        self.assertEqual(cacheado['Content-Type'], 'application/pdf')
+        self.assertEqual(b''.join(cacheado.streaming_content), b'%PDF-1.4 prueba')
+        self.assertEqual(len(self.pool.trabajos), 1)
+
+    def test_la_clave_sigue_a_los_datos(self):
+        datos = datos_reporte_turno(self.turno.id_turno)
+        clave = pdf.clave_reporte('ventas/reportes/turno.html', datos)
+        self.assertRegex(clave, r'^[0-9a-f]{64}$')
+        self.assertEqual(clave, pdf.clave_reporte('ventas/reportes/turno.html', datos_reporte_turno(self.turno.id_turno)))
+        self.assertNotEqual(clave, pdf.clave_reporte('ventas/reportes/ventas.html', datos))
+
+        registrar_venta(self.turno.id_turno, [{'id_producto': self.producto.id_producto, 'cantidad': 2}])
+        nueva = pdf.clave_reporte('ventas/reportes/turno.html', datos_reporte_turno(self.turno.id_turno))
+        self.assertNotEqual(clave, nueva)
+        # Con otra clave el reporte viejo no sirve: se encola uno nuevo
+        self.assertEqual(pdf.solicitar('ventas/reportes/turno.html', datos), (clave, pdf.PENDIENTE))
+        self.assertEqual(
+            pdf.solicitar('ventas/reportes/turno.html', datos_reporte_turno(self.turno.id_turno)), (nueva, pdf.PENDIENTE),
+        )
+        self.assertEqual(len(self.pool.trabajos), 2)
+
+    def test_otro_proceso_ya_lo_esta_generando(self):
+        datos = datos_reporte_turno(self.turno.id_turno)
+        clave = pdf.clave_reporte('ventas/reportes/turno.html', datos)
+        # El .pendiente creado por otro proceso web gana el O_EXCL
+        open(self._archivo(clave, 'pendiente'), 'w').close()
+        self.assertEqual(pdf.solicitar('ventas/reportes/turno.html', datos), (clave, pdf.PENDIENTE))
+        self.assertEqual(self.pool.trabajos, [])
+
+        # Si ese proceso murió, el .pendiente vence y el reporte se vuelve a encolar
+        viejo = time.time() - pdf.PENDIENTE_VENCE_SEGUNDOS - 1
+        os.utime(self._archivo(clave, 'pendiente'), (viejo, viejo))
+        self.assertEqual(pdf.solicitar('ventas/reportes/turno.html', datos), (clave, pdf.PENDIENTE))
+        self.assertEqual(len(self.pool.trabajos), 1)
+
+    def test_error_al_generar(self):
+        respuesta = self._pedir_turno()
+        self.pool.terminar(error=RuntimeError('xhtml2pdf reportó 1 error(es) al generar el PDF'))
+        clave = respuesta.json()['url_estado'].split('/')[-3]
+        self.assertFalse(os.path.exists(self._archivo(clave, 'pendiente')))
+        estado = self.client.get(respuesta.json()['url_estado'])
+        self.assertEqual(estado.status_code, 200)
+        self.assertEqual(estado.json(), {'estado': pdf.ERROR, 'error': 'xhtml2pdf reportó 1 error(es) al generar el PDF'})
+        self.assertEqual(self.client.get(respuesta.json()['url_descarga']).status_code, 404)
+
+        # Pedirlo de nuevo reintenta y borra el error anterior
+        self.assertEqual(self._pedir_turno().status_code, 202)
+        self.assertEqual(len(self.pool.trabajos), 2)
+        self.assertFalse(os.path.exists(self._archivo(clave, 'error')))
+        self.assertEqual(self.client.get(respuesta.json()['url_estado']).json(), {'estado': pdf.PENDIENTE})
+
+    def test_reportes_desconocidos(self):
+        clave = '0' * 64
+        self.assertEqual(self.client.get(reverse('estado_reporte', args=[clave])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('descargar_reporte', args=[clave])).status_code, 404)
+        self.assertEqual(self.client.get(reverse('reporte_turno_pdf', args=[self.turno.id_turno + 100])).status_code, 404)
+        self.assertEqual(self.pool.trabajos, [])
+
+    def test_reporte_de_ventas(self):
+        respuesta = self.client.get(reverse('reporte_ventas_pdf'), {'desde': '2024-01-01', 'hasta': '2024-01-31'})
+        self.assertEqual(respuesta.status_code, 202)
+        self.assertEqual(len(self.pool.trabajos), 1)
+        self.assertEqual(self.client.get(reverse('reporte_ventas_pdf'), {'desde': '2024-13-01'}).status_code, 400)
+
+    @unittest.skipIf(xhtml2pdf is None, 'xhtml2pdf no está instalado')
+    def test_dibujar_pdf_con_xhtml2pdf(self):
+        registrar_venta(self.turno.id_turno, [{'id_producto': self.producto.id_producto, 'cantidad': 2}])
+        html = render_to_string('ventas/reportes/turno.html', datos_reporte_turno(self.turno.id_turno))
+        destino = os.path.join(self.directorio, 'turno.pdf')
+        self.assertEqual(pdf._dibujar_pdf(html, destino), destino)
+        with open(destino, 'rb') as archivo:
+            self.assertEqual(archivo.read(5), b'%PDF-')
+        self.assertEqual(os.listdir(self.directorio), ['turno.pdf'])
@@ -1,9 +1,18 @@
-from django.urls import path
+from django.urls import path, re_path
 from . import views
 
 urlpatterns = [
     path('', views.lista_ventas, name='lista_ventas'),
+    path('datos/', views.datos_ventas, name='datos_ventas'),
     path('nueva/', views.crear_venta, name='crear_venta'),
+    path('checkout/', views.checkout, name='checkout'),
+    path('lote/', views.ingresar_lote, name='ingresar_lote'),
+    path('reportes/resumen/', views.reporte_resumen, name='reporte_resumen'),
+    path('reportes/turno/<int:id_turno>/pdf/', views.reporte_turno_pdf, name='reporte_turno_pdf'),
+    path('reportes/ventas/pdf/', views.reporte_ventas_pdf, name='reporte_ventas_pdf'),
+    re_path(r'^reportes/(?P<clave>[0-9a-f]{64})/estado/$', views.estado_reporte, name='estado_reporte'),
+    re_path(r'^reportes/(?P<clave>[0-9a-f]{64})/descargar/$', views.descargar_reporte, name='descargar_reporte'),
+    path('exportar/<str:tipo>/<str:formato>/', views.exportar_ventas, name='exportar_ventas'),
     path('editar/<int:pk>/', views.editar_venta, name='editar_venta'),
     path('eliminar/<int:pk>/', views.eliminar_venta, name='eliminar_venta'),
 ]
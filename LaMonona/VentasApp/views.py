@@ -1,16 +1,76 @@
 from django.shortcuts import render, redirect, get_object_or_404
-from Task.models import Ventas
-from .forms import VentaForm
+from django.contrib.auth.decorators import login_required
+from django.db import transaction
+from django.http import FileResponse, Http404, JsonResponse, StreamingHttpResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_http_methods
+from Task.models import Ventas, DetallesVenta
+from Task.asincrono import arender
+from Task.replicas import de_reporte
+from .forms import VentaForm, CheckoutForm, VentaLoteForm, validar_lineas
+from .consultas import apagina_keyset, filtrar_ventas
+from . import pdf
+from .reportes import datos_reporte_turno, datos_reporte_ventas
+from .exportar import COLUMNAS_DETALLES, COLUMNAS_VENTAS, csv_por_lotes, xlsx_por_lotes
+from .resumenes import acumular_ventas, datos_venta, productos_mas_vendidos, ventas_por_periodo
+from .servicios import RECHAZADA, borrar_venta, VentaRechazada, registrar_lote, registrar_venta
+import json
 
-def lista_ventas(request):
-    ventas = Ventas.objects.all()
-    return render(request, 'ventas/lista.html', {'ventas': ventas})
+TAMANO_PAGINA_MAXIMO = 100
+TAMANO_LOTE_MAXIMO = 500
+
+
+async def lista_ventas(request):
+    # Las filas se cargan desde `datos_ventas` (DataTables en modo serverSide)
+    return await arender(request, 'ventas/lista.html')
+
+
+async def datos_ventas(request):
+    """Página de ventas en JSON para DataTables, paginada por keyset"""
+    params = request.GET
+    try:
+        tamano = min(max(int(params.get('length', 25)), 1), TAMANO_PAGINA_MAXIMO)
+        inicio = max(int(params.get('start', 0)), 0)
+    except ValueError:
+        tamano, inicio = 25, 0
+    try:
+        draw = int(params.get('draw', 0) or 0)
+    except ValueError:
+        draw = 0
+
+    ventas = filtrar_ventas(Ventas.objects.select_related('id_turno'), params)
+    filas, siguiente = await apagina_keyset(ventas, params.get('cursor'), tamano)
+
+    data = [{
+        'id_venta': venta.id_venta,
+        'turno': f'Turno #{venta.id_turno.id_turno}',
+        'cliente': venta.nombre_cliente or 'Cliente sin nombre',
+        'fecha': timezone.localtime(venta.fecha_venta).strftime('%d/%m/%Y %H:%M'),
+        'total': f'{venta.total_venta:.2f}',
+        'url_editar': reverse('editar_venta', args=[venta.id_venta]),
+        'url_eliminar': reverse('eliminar_venta', args=[venta.id_venta]),
+    } for venta in filas]
+
+    # Sin COUNT(*): se informa una fila "extra" mientras exista otra página,
+    # suficiente para que DataTables habilite el botón "Siguiente".
+    total = inicio + len(filas) + (1 if siguiente else 0)
+    return JsonResponse({
+        'draw': draw,
+        'recordsTotal': total,
+        'recordsFiltered': total,
+        'data': data,
+        'cursor': siguiente,
+    })
 
 def crear_venta(request):
     if request.method == 'POST':
         form = VentaForm(request.POST)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                venta = form.save()
+                acumular_ventas([datos_venta(venta, detalles=[])])
             return redirect('lista_ventas')
     else:
         form = VentaForm()
@@ -19,9 +79,14 @@ def crear_venta(request):
 def editar_venta(request, pk):
     venta = get_object_or_404(Ventas, pk=pk)
     if request.method == 'POST':
+        anterior = datos_venta(venta)
         form = VentaForm(request.POST, instance=venta)
         if form.is_valid():
-            form.save()
+            with transaction.atomic():
+                venta = form.save()
+                # Se descuenta la venta como estaba y se vuelve a sumar con los datos nuevos
+                acumular_ventas([anterior], signo=-1)
+                acumular_ventas([datos_venta(venta, detalles=anterior['detalles'])])
             return redirect('lista_ventas')
     else:
         form = VentaForm(instance=venta)
@@ -30,6 +95,202 @@ def editar_venta(request, pk):
 def eliminar_venta(request, pk):
     venta = get_object_or_404(Ventas, pk=pk)
     if request.method == 'POST':
-        venta.delete()
+        borrar_venta(venta)
         return redirect('lista_ventas')
     return render(request, 'ventas/eliminar.html', {'venta': venta})
+
+
+@login_required
+@require_http_methods(["POST"])
+def checkout(request):
+    """Registra una venta con sus líneas a partir de un carrito en JSON.
+
+    Cuerpo: {"id_turno": 1, "nombre_cliente": "...", "lineas": [{"id_producto": 3, "cantidad": 2}, ...]}
+    """
+    try:
+        datos = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'errors': {'__all__': ['JSON inválido.']}}, status=400)
+    if not isinstance(datos, dict):
+        return JsonResponse({'success': False, 'errors': {'__all__': ['JSON inválido.']}}, status=400)
+
+    form = CheckoutForm(datos)
+    lineas, errores = validar_lineas(datos.get('lineas'))
+    if not form.is_valid() or errores:
+        errores.update(form.errors)
+        return JsonResponse({'success': False, 'errors': errores}, status=400)
+
+    try:
+        venta = registrar_venta(
+            form.cleaned_data['id_turno'],
+            lineas,
+            nombre_cliente=form.cleaned_data['nombre_cliente'],
+        )
+    except VentaRechazada as e:
+        return JsonResponse({'success': False, 'errors': e.errores}, status=409)
+
+    return JsonResponse({
+        'success': True,
+        'id_venta': venta.id_venta,
+        'total_venta': f'{venta.total_venta:.2f}',
+        'message': f'Venta #{venta.id_venta} registrada correctamente.',
+    })
+
+
+@login_required
+@require_http_methods(["POST"])
+def ingresar_lote(request):
+    """Recibe las ventas acumuladas por una terminal sin conexión.
+
+    Cuerpo: {"ventas": [{"clave": "<uuid>", "id_turno": 1, "fecha_venta": "...", "lineas": [...]}, ...]}
+    Responde un resultado por venta, en el mismo orden; reenviar el mismo lote no duplica ventas.
+    """
+    try:
+        datos = json.loads(request.body)
+    except (ValueError, UnicodeDecodeError):
+        return JsonResponse({'success': False, 'errors': {'__all__': ['JSON inválido.']}}, status=400)
+    ventas = datos.get('ventas') if isinstance(datos, dict) else None
+    if not isinstance(ventas, list) or not ventas:
+        return JsonResponse({'success': False, 'errors': {'ventas': ['Se esperaba una lista de ventas.']}}, status=400)
+    if len(ventas) > TAMANO_LOTE_MAXIMO:
+        return JsonResponse({
+            'success': False,
+            'errors': {'ventas': [f'El lote no puede tener más de {TAMANO_LOTE_MAXIMO} ventas.']},
+        }, status=400)
+
+    resultados = [None] * len(ventas)
+    validas, posiciones = [], []
+    for i, venta in enumerate(ventas):
+        venta = venta if isinstance(venta, dict) else {}
+        form = VentaLoteForm(venta)
+        lineas, errores = validar_lineas(venta.get('lineas'))
+        if not form.is_valid() or errores:
+            errores.update(form.errors)
+            resultados[i] = {'clave': venta.get('clave'), 'estado': RECHAZADA, 'errores': errores}
+            continue
+        validas.append(dict(form.cleaned_data, lineas=lineas))
+        posiciones.append(i)
+
+    if validas:
+        for i, resultado in zip(posiciones, registrar_lote(validas)):
+            resultados[i] = resultado
+
+    return JsonResponse({'success': True, 'resultados': resultados})
+
+
+@login_required
+@de_reporte
+def reporte_resumen(request):
+    """Totales por periodo y productos más vendidos, leídos de las tablas de resumen"""
+    hoy = timezone.localdate()
+    try:
+        desde = parse_date(request.GET.get('desde') or '') or hoy.replace(day=1)
+        hasta = parse_date(request.GET.get('hasta') or '') or hoy
+    except ValueError:
+        return JsonResponse({'success': False, 'errors': {'__all__': ['Fecha inválida.']}}, status=400)
+    sucursal = request.GET.get('sucursal')
+    periodos = ventas_por_periodo(
+        desde, hasta,
+        periodo=request.GET.get('periodo', 'dia'),
+        sucursal=int(sucursal) if sucursal and sucursal.isdigit() else None,
+    )
+    return JsonResponse({
+        'success': True,
+        'desde': desde.isoformat(),
+        'hasta': hasta.isoformat(),
+        'periodos': periodos,
+        'productos': productos_mas_vendidos(desde, hasta),
+    })
+
+
+@login_required
+@de_reporte
+def exportar_ventas(request, tipo, formato):
+    """Exporta ventas (`tipo=ventas`) o líneas de venta (`tipo=detalles`) en CSV o XLSX.
+
+    La respuesta se genera por lotes mientras se envía, así que la memoria usada no
+    depende del rango de fechas. Acepta los filtros `desde`, `hasta` y `sucursal`.
+    """
+    params = request.GET.copy()
+    params.pop('q', None)
+    params.pop('search[value]', None)
+    if tipo == 'ventas':
+        queryset = filtrar_ventas(Ventas.objects.all(), params)
+        columnas = COLUMNAS_VENTAS
+    elif tipo == 'detalles':
+        queryset = filtrar_ventas(DetallesVenta.objects.all(), params, prefijo='id_venta__')
+        columnas = COLUMNAS_DETALLES
+    else:
+        raise Http404('Tipo de exportación desconocido')
+
+    nombre = f'{tipo}_{timezone.localtime():%Y%m%d_%H%M}'
+    if formato == 'csv':
+        response = StreamingHttpResponse(csv_por_lotes(queryset, columnas), content_type='text/csv; charset=utf-8')
+        response['Content-Disposition'] = f'attachment; filename="{nombre}.csv"'
+    elif formato == 'xlsx':
+        response = StreamingHttpResponse(
+            xlsx_por_lotes(queryset, columnas, nombre_hoja=tipo.capitalize()),
+            content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+        )
+        response['Content-Disposition'] = f'attachment; filename="{nombre}.xlsx"'
+    else:
+        raise Http404('Formato de exportación desconocido')
+    return response
+
+
+def _responder_pdf(request, plantilla, datos, nombre):
+    """Entrega el PDF si ya está generado; si no, lo encola y responde 202 con la URL de estado"""
+    clave, estado = pdf.solicitar(plantilla, datos)
+    if estado == pdf.LISTO:
+        return FileResponse(open(pdf.ruta_pdf(clave), 'rb'), content_type='application/pdf', filename=f'{nombre}.pdf')
+    return JsonResponse({
+        'estado': estado,
+        'url_estado': reverse('estado_reporte', args=[clave]),
+        'url_descarga': reverse('descargar_reporte', args=[clave]),
+    }, status=202)
+
+
+@login_required
+@de_reporte
+def reporte_turno_pdf(request, id_turno):
+    """Reporte PDF de cierre de turno"""
+    datos = datos_reporte_turno(id_turno)
+    if datos is None:
+        raise Http404('Turno no encontrado')
+    return _responder_pdf(request, 'ventas/reportes/turno.html', datos, f'turno_{id_turno}')
+
+
+@login_required
+@de_reporte
+def reporte_ventas_pdf(request):
+    """Reporte PDF de ventas por día para el rango `desde`/`hasta` (por defecto, el mes en curso)"""
+    hoy = timezone.localdate()
+    try:
+        desde = parse_date(request.GET.get('desde') or '') or hoy.replace(day=1)
+        hasta = parse_date(request.GET.get('hasta') or '') or hoy
+    except ValueError:
+        return JsonResponse({'success': False, 'errors': {'__all__': ['Fecha inválida.']}}, status=400)
+    sucursal = request.GET.get('sucursal')
+    datos = datos_reporte_ventas(desde, hasta, sucursal=int(sucursal) if sucursal and sucursal.isdigit() else None)
+    return _responder_pdf(request, 'ventas/reportes/ventas.html', datos, f'ventas_{desde}_{hasta}')
+
+
+@login_required
+def estado_reporte(request, clave):
+    """Estado de un reporte en cola: pendiente, listo o error"""
+    estado = pdf.estado(clave)
+    if estado is None:
+        raise Http404('Reporte no encontrado')
+    respuesta = {'estado': estado}
+    if estado == pdf.LISTO:
+        respuesta['url_descarga'] = reverse('descargar_reporte', args=[clave])
+    elif estado == pdf.ERROR:
+        respuesta['error'] = pdf.mensaje_error(clave)
+    return JsonResponse(respuesta)
+
+
+@login_required
+def descargar_reporte(request, clave):
+    if pdf.estado(clave) != pdf.LISTO:
+        raise Http404('El reporte todavía no está listo')
+    return FileResponse(open(pdf.ruta_pdf(clave), 'rb'), content_type='application/pdf', filename=f'reporte_{clave[:12]}.pdf')